@@ -1,6 +1,12 @@
 -- DDL for creating the recipes table
 -- Final Version: Precisely aligned with the app/db/models.py SQLAlchemy model
 
+-- 語意搜尋用的 pgvector 擴充
+CREATE EXTENSION IF NOT EXISTS vector;
+
+-- 混合搜尋的關鍵字比對使用 pg_trgm（中文沒有空白斷詞，不使用 tsvector）
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
 -- 先刪除可能已存在的舊表格，方便我們重新開始
 DROP TABLE IF EXISTS recipes;
 
@@ -9,6 +15,10 @@ CREATE TABLE recipes (
     -- 對應 id = Column(Integer, primary_key=True, index=True)
     id SERIAL PRIMARY KEY,
 
+    -- 對應 source_url = Column(String, nullable=True, unique=True)
+    -- 食譜來源網址，匯入時作為 upsert 的自然鍵
+    source_url TEXT,
+
     -- 對應 name = Column(String, index=True, nullable=False)
     name TEXT NOT NULL,
 
@@ -45,10 +55,89 @@ CREATE TABLE recipes (
     -- 對應 nutrition_info = Column(JSON, nullable=True)
     nutrition_info JSONB,
 
-    -- 雖然 models.py 中沒有，但保留時間戳記是極佳的實踐
+    -- 對應 embedding = Column(Vector(768), nullable=True)
+    embedding vector(768),
+
+    -- 對應 embedding_hash = Column(String, nullable=True)
+    -- 產生 embedding 時輸入文字的雜湊，scripts/vec_import.py 以此略過未變動的食譜
+    embedding_hash TEXT,
+
+    -- 對應 embedding_updated_at = Column(DateTime(timezone=True), nullable=True)
+    -- 最近一次寫入 embedding 的時間，API 的記憶體向量索引依此增量更新
+    embedding_updated_at TIMESTAMP WITH TIME ZONE,
+
+    -- 對應 created_at / updated_at；updated_at 是 GET /recipes/{id} 的 ETag 與快取版本，
+    -- 內容變動時由下方的 trigger 自動更新
     created_at TIMESTAMP WITH TIME ZONE DEFAULT now(),
     updated_at TIMESTAMP WITH TIME ZONE DEFAULT now()
 );
 
 -- 根據 models.py 中的 index=True，為 name 欄位建立索引
-CREATE INDEX idx_recipes_name ON recipes (name);
\ No newline at end of file
+CREATE INDEX idx_recipes_name ON recipes (name);
+
+CREATE INDEX idx_recipes_embedding_updated_at ON recipes (embedding_updated_at);
+
+-- scripts/importer.py 以 source_url 做 ON CONFLICT upsert
+CREATE UNIQUE INDEX idx_recipes_source_url ON recipes (source_url);
+
+-- 向量搜尋使用 <#> (負內積)，因此 HNSW 索引使用 vector_ip_ops
+-- 資料量變動後可用 scripts/vector_index.py rebuild 線上重建
+CREATE INDEX idx_recipes_embedding ON recipes USING hnsw (embedding vector_ip_ops) WITH (m = 16, ef_construction = 64);
+
+-- 混合搜尋的關鍵字索引（與 migrations/0004_recipes_trigram_search.sql 相同）
+-- array_to_string 不是 IMMUTABLE，以宣告為 IMMUTABLE 的函式包裝後才能建立運算式索引
+CREATE OR REPLACE FUNCTION recipe_search_text(name TEXT, core_ingredients TEXT[])
+RETURNS TEXT
+LANGUAGE sql IMMUTABLE PARALLEL SAFE
+AS $$
+    SELECT lower(coalesce(name, '') || ' ' || coalesce(array_to_string(core_ingredients, ' '), ''))
+$$;
+CREATE INDEX idx_recipes_name_trgm ON recipes USING gin (lower(name) gin_trgm_ops);
+CREATE INDEX idx_recipes_search_text_trgm ON recipes USING gin (recipe_search_text(name, core_ingredients) gin_trgm_ops);
+
+-- 食材比對（POST /api/v1/recipes/pantry-match）用的倒排索引與同義詞表
+-- 初始同義詞資料見 migrations/0005_ingredient_index.sql
+CREATE INDEX idx_recipes_core_ingredients ON recipes USING gin (core_ingredients);
+CREATE TABLE IF NOT EXISTS ingredient_synonyms (
+    alias     TEXT PRIMARY KEY,
+    canonical TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_ingredient_synonyms_canonical ON ingredient_synonyms (canonical);
+
+-- 食材名稱的正規化與 app/services/ingredient_normalizer.py 相同（與 migrations/0008_ingredient_clean_index.sql 相同）
+CREATE OR REPLACE FUNCTION clean_ingredient(item TEXT)
+RETURNS TEXT
+LANGUAGE sql IMMUTABLE PARALLEL SAFE
+AS $$
+    SELECT lower(regexp_replace(regexp_replace(normalize(item, NFKC), '\(.*?\)', '', 'g'), '\s+', '', 'g'))
+$$;
+CREATE OR REPLACE FUNCTION clean_ingredients(items TEXT[])
+RETURNS TEXT[]
+LANGUAGE sql IMMUTABLE PARALLEL SAFE
+AS $$
+    SELECT ARRAY(SELECT clean_ingredient(item) FROM unnest(items) AS item)
+$$;
+CREATE INDEX idx_recipes_core_ingredients_clean ON recipes USING gin (clean_ingredients(core_ingredients));
+CREATE INDEX IF NOT EXISTS idx_ingredient_synonyms_alias_clean ON ingredient_synonyms (clean_ingredient(alias));
+
+-- 食譜內容變動時更新 updated_at（與 migrations/0007_recipes_updated_at_trigger.sql 相同）
+CREATE OR REPLACE FUNCTION recipes_touch_updated_at()
+RETURNS trigger
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    NEW.updated_at = now();
+    RETURN NEW;
+END;
+$$;
+CREATE TRIGGER trg_recipes_touch_updated_at
+    BEFORE UPDATE ON recipes
+    FOR EACH ROW
+    WHEN ((OLD.name, OLD.image_url, OLD.core_ingredients, OLD.full_ingredient_list, OLD.steps,
+           OLD.total_time, OLD.difficulty, OLD.cuisine_style, OLD.servings, OLD.key_equipment,
+           OLD.tips, OLD.nutrition_info)
+          IS DISTINCT FROM
+          (NEW.name, NEW.image_url, NEW.core_ingredients, NEW.full_ingredient_list, NEW.steps,
+           NEW.total_time, NEW.difficulty, NEW.cuisine_style, NEW.servings, NEW.key_equipment,
+           NEW.tips, NEW.nutrition_info))
+    EXECUTE FUNCTION recipes_touch_updated_at();
\ No newline at end of file
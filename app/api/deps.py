@@ -1,14 +1,21 @@
 # 檔案位置: app/api/deps.py
-from app.db.session import SessionLocal
+from app.db.session import AsyncSessionLocal, SessionLocal
 from fastapi import Header, HTTPException
 import os
 
-def get_db():
+async def get_db():
     """
     一個 FastAPI 的依賴項 (Dependency)。
-    在處理請求的過程中，它會建立並提供一個資料庫 session，
+    在處理請求的過程中，它會建立並提供一個非同步資料庫 session (asyncpg)，
     並在請求結束後，確保 session 被關閉。
     """
+    async with AsyncSessionLocal() as db:
+        yield db
+
+def get_sync_db():
+    """
+    同步版本的資料庫 session，給仍以 def 撰寫的端點使用（會在 threadpool 中執行）。
+    """
     db = SessionLocal()
     try:
         yield db
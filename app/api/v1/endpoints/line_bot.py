@@ -1,16 +1,19 @@
 # 檔案位置: app/api/v1/endpoints/line_bot.py
 
 import os
+import time
 from dotenv import load_dotenv
-from fastapi import APIRouter, Request, HTTPException
+from fastapi import APIRouter, Depends, Request, HTTPException
 
-from linebot.v3 import WebhookHandler
+from linebot.v3 import WebhookParser
 from linebot.v3.exceptions import InvalidSignatureError
-from linebot.v3.messaging import Configuration, ApiClient, MessagingApi, ReplyMessageRequest, TextMessage
+from linebot.v3.messaging import Configuration, AsyncApiClient, AsyncMessagingApi, ReplyMessageRequest, TextMessage
 from linebot.v3.webhooks import MessageEvent, TextMessageContent
 
+from app.api.deps import admin_auth
 # 匯入 AI 服務
 from app.services.ai_service import AIService
+from app.services.line_dispatcher import LineEventDispatcher
 
 # 建立一個 APIRouter，之後可以被主應用程式 main.py 引用
 router = APIRouter()
@@ -26,59 +29,122 @@ channel_access_token = os.getenv('LINE_CHANNEL_ACCESS_TOKEN')
 if channel_secret is None or channel_access_token is None:
     print("錯誤：LINE_CHANNEL_SECRET 或 LINE_CHANNEL_ACCESS_TOKEN 未設定。")
     # 在真實應用中，你可能會希望程式在此處停止或拋出更明確的錯誤
-    
+
 # 設定 Line Bot 的配置
 configuration = Configuration(access_token=channel_access_token)
-handler = WebhookHandler(channel_secret)
+# WebhookParser 只負責驗證簽名與解析事件，不會在 webhook 請求中直接執行處理函式
+parser = WebhookParser(channel_secret)
+
+# 從 LINE 送出事件到我們回覆的時間預算（秒），需小於 reply token 的有效時間
+REPLY_BUDGET_SECONDS = float(os.getenv("LINE_REPLY_BUDGET_SECONDS", "25"))
+
+# 異步的 API 客戶端會在 startup() 中建立（aiohttp session 必須在 event loop 內建立）
+api_client = None
+line_bot_api = None
+
+
+async def handle_event(event):
+    """
+    背景 worker 呼叫的事件處理入口。
+    """
+    if isinstance(event, MessageEvent) and isinstance(event.message, TextMessageContent):
+        await handle_text_message(event)
+
+
+async def handle_text_message(event):
+    """
+    處理文字訊息事件：把使用者的問題交給 AI 服務，再用 reply token 回覆。
+    """
+    # 取得使用者傳來的文字
+    user_text = event.message.text
+
+    # 扣掉事件在佇列中等待的時間，剩下的才是 AI 可以使用的時間
+    waited = max(0.0, time.time() - event.timestamp / 1000)
+    ai_response = await ai_service.chat(user_text, deadline=REPLY_BUDGET_SECONDS - waited)
+
+    # 準備回覆的訊息，內容為 AI 的回答
+    reply_message = TextMessage(text=ai_response)
+
+    # 使用異步的 reply_message 回覆訊息
+    # 注意：我們需要 event.reply_token 來知道要回覆給誰
+    await line_bot_api.reply_message(
+        ReplyMessageRequest(
+            reply_token=event.reply_token,
+            messages=[reply_message]
+        )
+    )
+
+
+# 背景事件派送器：webhook 只負責排入佇列，AI 呼叫與回覆交給 worker
+dispatcher = LineEventDispatcher(
+    handle_event,
+    workers=int(os.getenv("LINE_WORKERS", "4")),
+    queue_size=int(os.getenv("LINE_QUEUE_SIZE", "100")),
+    enqueue_timeout=float(os.getenv("LINE_ENQUEUE_TIMEOUT", "1.0")),
+)
+
+
+async def startup():
+    """建立異步 LINE 客戶端並啟動背景 worker，由 main.py 的 lifespan 呼叫"""
+    global api_client, line_bot_api
+    api_client = AsyncApiClient(configuration)
+    line_bot_api = AsyncMessagingApi(api_client)
+    await dispatcher.start()
+
+
+async def shutdown():
+    """處理完佇列中剩餘的事件後，關閉 worker、LINE 客戶端與圖譜連線池"""
+    await dispatcher.stop()
+    if api_client is not None:
+        await api_client.close()
+    ai_service.graph.close()
 
-# 建立一個異步的 API 客戶端
-# 在 FastAPI 這種異步框架中，使用異步的函式庫是最佳實踐
-api_client = ApiClient(configuration)
-line_bot_api = MessagingApi(api_client)
 
 @router.post("/callback")
 async def callback(request: Request):
     """
     Line Bot 的 Webhook 端點。
     所有來自 Line Platform 的事件都會被送到這裡。
+    驗證簽名後把事件排入佇列並立即回傳 200，不等待 AI 回覆。
     """
     # 取得請求頭中的 X-Line-Signature，用於驗證請求是否來自 Line
-    signature = request.headers['X-Line-Signature']
+    signature = request.headers.get('X-Line-Signature')
+    if not signature:
+        raise HTTPException(status_code=400, detail="Missing X-Line-Signature header.")
 
     # 將請求的內容（body）以文字形式讀取
     body = await request.body()
     body = body.decode()
 
     try:
-        # 使用 handler 來處理 webhook 事件
-        handler.handle(body, signature)
+        # 驗證簽名並解析出事件列表
+        events = parser.parse(body, signature)
     except InvalidSignatureError:
         # 如果簽名驗證失敗，回傳 400 錯誤
         raise HTTPException(status_code=400, detail="Invalid signature. Please check your channel secret.")
 
+    for event in events:
+        if not await dispatcher.submit(event):
+            # 佇列持續滿載：reply token 很快就會過期，直接放棄此事件並記錄
+            print(f"[callback] 事件佇列已滿，放棄事件 {getattr(event, 'webhook_event_id', '')}")
+
     return 'OK'
 
 
-@handler.add(MessageEvent, message=TextMessageContent)
-def handle_text_message(event):
-    """
-    處理文字訊息事件。
-    這是一個「迴聲機器人 (Echo Bot)」的簡單實現。
-    """
-    # 取得使用者傳來的文字
-    user_text = event.message.text
-    
-    # 將使用者的問題交由 AI 服務處理
-    ai_response = ai_service.chat(user_text)
+@router.get("/metrics", summary="LINE 事件佇列狀態", dependencies=[Depends(admin_auth)])
+def read_dispatcher_metrics():
+    return dispatcher.metrics()
 
-    # 準備回覆的訊息，內容為 AI 的回答
-    reply_message = TextMessage(text=ai_response)
 
-    # 使用 line_bot_api 的 reply_message 方法回覆訊息
-    # 注意：我們需要 event.reply_token 來知道要回覆給誰
-    line_bot_api.reply_message(
-        ReplyMessageRequest(
-            reply_token=event.reply_token,
-            messages=[reply_message]
-        )
-    )
\ No newline at end of file
+@router.get("/answer-cache-stats", summary="語意回答快取統計", dependencies=[Depends(admin_auth)])
+def read_answer_cache_stats():
+    if ai_service.answer_cache is None:
+        return {"enabled": False}
+    return ai_service.answer_cache.stats()
+
+
+@router.get("/cypher-cache-stats", summary="Cypher 樣板快取統計", dependencies=[Depends(admin_auth)])
+def read_cypher_cache_stats():
+    if ai_service.cypher_cache is None:
+        return {"enabled": False}
+    return ai_service.cypher_cache.stats()
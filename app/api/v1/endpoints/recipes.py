@@ -1,23 +1,37 @@
 # 檔案位置: app/api/v1/endpoints/recipes.py
 
-from fastapi import APIRouter, Depends, HTTPException, Query, Body
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Query, Body, Header, Response
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.ext.asyncio import AsyncSession
 
 # 這就是我們之前建立的「依賴項」和「資料庫模型」
-import os, json
-from sqlalchemy import text
+import os, json, base64, binascii
+from sqlalchemy import select, text
 from app.api import deps
 from app.db import models
 from app.schemas import recipe as recipe_schema
-from app.schemas.recipe import RecipeSearchResult, RecipeCreate, Recipe
-from typing import List
-from langchain_google_genai import GoogleGenerativeAIEmbeddings
-from pydantic import BaseModel
+from app.schemas.recipe import (
+    RecipeSearchResult, RecipeBatchSearchResult, RecipeCreate, Recipe, RecipePage, PantryMatchResult,
+)
+from typing import List, Literal, Optional
+from pydantic import BaseModel, Field
 from app.api.deps import admin_auth
+from app.services.embedding_service import get_embedding_service
+from app.services import hybrid_search
+from app.services.ingredient_normalizer import get_normalizer
+from app.services.pantry_match import pantry_match
+from app.services.memory_index import get_memory_index, memory_index
+from app.services.recipe_cache import (
+    RECIPE_CACHE_MAX_AGE, etag_matches, make_etag, recipe_cache, recipe_version,
+)
 
 # 建立一個專屬於食譜的 APIRouter
 router = APIRouter()
 
+def recipe_cache_headers(etag: str) -> dict:
+    cache_control = f"public, max-age={RECIPE_CACHE_MAX_AGE}" if RECIPE_CACHE_MAX_AGE > 0 else "no-cache"
+    return {"ETag": etag, "Cache-Control": cache_control}
+
 # -------------------------------------------------------------------
 # 這就是我們第一個真正的 API 端點 (Endpoint)
 # -------------------------------------------------------------------
@@ -25,111 +39,355 @@ router = APIRouter()
     "/{recipe_id}", 
     response_model=recipe_schema.Recipe  # 指定回應的資料格式
 )
-def read_recipe_by_id(
+async def read_recipe_by_id(
     recipe_id: int,
+    if_none_match: Optional[str] = Header(None),
     # =================================================================
     # ==  這就是魔法發生的地方！我們「注入」了 get_db 這個依賴項  ==
     # =================================================================
-    db: Session = Depends(deps.get_db)
+    db: AsyncSession = Depends(deps.get_db)
 ):
     """
     根據食譜 ID，從資料庫中讀取一筆食譜資料。
+    先以主鍵查出目前的版本（updated_at）：與 If-None-Match 相同時直接回 304；
+    快取中有同一版本的 JSON 時直接回傳，不必載入整筆資料與重新序列化。
     """
-    # 使用被注入的 db session 物件，來查詢資料庫
-    # 這行程式碼會去 `recipes` 表格中，尋找 id 等於我們傳入的 recipe_id 的那一筆資料
-    found_recipe = db.query(models.Recipe).filter(models.Recipe.id == recipe_id).first()
+    # 只查 updated_at，作為 ETag 與快取的版本
+    row = (await db.execute(
+        select(models.Recipe.updated_at).where(models.Recipe.id == recipe_id)
+    )).first()
 
     # 如果找不到對應的食譜，就回傳一個 404 Not Found 錯誤
-    if not found_recipe:
+    if row is None:
         raise HTTPException(status_code=404, detail="Recipe not found")
-        
-    # 如果找到了，就直接回傳這個從資料庫拿到的物件
-    # FastAPI 會很聰明地根據我們在 response_model 中指定的格式，將它轉換成 JSON
-    return found_recipe
+
+    version = recipe_version(row.updated_at)
+    etag = make_etag(recipe_id, version)
+    if etag_matches(if_none_match, etag):
+        recipe_cache.mark_not_modified()
+        return Response(status_code=304, headers=recipe_cache_headers(etag))
+
+    body = await recipe_cache.get(recipe_id, version)
+    if body is None:
+        # 快取沒有這個版本：載入整筆食譜，序列化一次後存進快取
+        found_recipe = await db.get(models.Recipe, recipe_id)
+        if not found_recipe:
+            raise HTTPException(status_code=404, detail="Recipe not found")
+        version = recipe_version(found_recipe.updated_at)
+        etag = make_etag(recipe_id, version)
+        body = Recipe.model_validate(found_recipe).model_dump_json().encode("utf-8")
+        await recipe_cache.set(recipe_id, version, body)
+
+    # 直接回傳序列化好的 JSON，格式與 response_model 相同
+    return Response(content=body, media_type="application/json", headers=recipe_cache_headers(etag))
+
+# ANN 索引的預設搜尋參數，未設定時沿用 pgvector 的預設值
+DEFAULT_EF_SEARCH = os.getenv("VECTOR_EF_SEARCH")
+DEFAULT_PROBES = os.getenv("VECTOR_PROBES")
 
 class RecipeSearchRequest(BaseModel):
     query: str
     limit: int = 5
+    # vector：純語意搜尋；lexical：只比對菜名與核心食材；
+    # hybrid：先比對關鍵字，夠確定就直接回傳（不呼叫 embedding），否則與向量結果以 RRF 合併
+    mode: Literal["hybrid", "vector", "lexical"] = "hybrid"
+    # 結構化篩選條件，在排名前就於 SQL 中套用
+    max_total_time: Optional[int] = Field(None, ge=1)  # 總時間上限（分鐘）
+    difficulty: Optional[int] = None
+    cuisine_style: Optional[str] = None
+    ingredients: Optional[List[str]] = None  # 必須包含的核心食材
+    ef_search: Optional[int] = Field(None, ge=1, le=1000)  # HNSW 候選清單大小，越大越準但越慢
+    probes: Optional[int] = Field(None, ge=1, le=1000)  # IVFFlat 探測的分群數
+
+async def apply_vector_search_settings(db: AsyncSession, ef_search: Optional[int], probes: Optional[int]):
+    """
+    以 set_config(..., is_local=true) 設定本次交易的 ANN 搜尋參數，
+    交易結束後自動還原，不會影響連線池中的其他請求。
+    """
+    ef_search = ef_search or DEFAULT_EF_SEARCH
+    probes = probes or DEFAULT_PROBES
+    if ef_search:
+        await db.execute(text("SELECT set_config('hnsw.ef_search', :v, true)"), {"v": str(int(ef_search))})
+    if probes:
+        await db.execute(text("SELECT set_config('ivfflat.probes', :v, true)"), {"v": str(int(probes))})
 
 @router.post(
     "/search",
     response_model=List[RecipeSearchResult],
     summary="語意搜尋食譜",
 )
-def search_recipes(
+async def search_recipes(
     body: RecipeSearchRequest = Body(...),
-    db: Session = Depends(deps.get_db)
+    db: AsyncSession = Depends(deps.get_db)
+    ):
+    filters = hybrid_search.build_filters(
+        max_total_time=body.max_total_time,
+        difficulty=body.difficulty,
+        cuisine_style=body.cuisine_style,
+        ingredients=body.ingredients,
+    )
+
+    # 1. 關鍵字比對（trigram 索引）；使用者輸入完整菜名時通常到這裡就能確定，不必產生查詢向量。
+    #    hybrid 模式一次取出 RRF 需要的候選數，不確定時直接當作關鍵字候選，融合時不必重做比對
+    rows = None
+    lexical_ids = None
+    if body.mode in ("hybrid", "lexical"):
+        probe_limit = max(hybrid_search.HYBRID_CANDIDATES, body.limit) if body.mode == "hybrid" else body.limit
+        lexical_rows, confident = await hybrid_search.lexical_search(db, body.query, probe_limit, filters)
+        if body.mode == "lexical":
+            hybrid_search.stats.add("lexical")
+            rows = lexical_rows
+        elif confident:
+            hybrid_search.stats.add("hybrid_lexical_only")
+            rows = lexical_rows[: body.limit]
+        else:
+            lexical_ids = [r.id for r in lexical_rows]
+
+    if rows is None:
+        # 2. 產生查詢向量（共用的 EmbeddingService 會先查快取，命中時不會連網）
+        #    Gemini client 是同步的，放到 threadpool 執行以免卡住 event loop
+        try:
+            q_vec = await run_in_threadpool(get_embedding_service().embed_query, body.query)
+        except RuntimeError as e:
+            raise HTTPException(500, str(e))
+        except Exception as e:
+            raise HTTPException(500, f"Embedding 失敗: {e}")
+
+        # 3. 向量檢索：啟用記憶體索引（VECTOR_MEMORY_INDEX）且沒有篩選條件時在行程內精確計算，
+        #    否則走 pgvector（有 HNSW/IVFFlat 索引時為近似搜尋，見 scripts/vector_index.py）；
+        #    hybrid 模式在同一個 SQL 中取得關鍵字與向量候選，以 reciprocal-rank fusion 合併
+        index = get_memory_index()
+        if index is not None and filters[0] == "TRUE":
+            k = max(hybrid_search.HYBRID_CANDIDATES, body.limit) if body.mode == "hybrid" else body.limit
+            # 矩陣運算會釋放 GIL，放到 threadpool 執行以免卡住 event loop
+            hits = await run_in_threadpool(index.search, q_vec, k)
+        else:
+            hits = None
+            await apply_vector_search_settings(db, body.ef_search, body.probes)
+
+        if body.mode == "hybrid":
+            hybrid_search.stats.add("hybrid_fused")
+            rows = await hybrid_search.fused_search(
+                db, body.query, q_vec, body.limit, filters,
+                vector_candidates=[(rid, distance) for rid, _, _, distance in hits] if hits is not None else None,
+                lexical_candidates=lexical_ids,
+            )
+        else:
+            hybrid_search.stats.add("vector")
+            if hits is not None:
+                rows = (await hybrid_search.hydrate_hits(db, [[(rid, distance) for rid, _, _, distance in hits]]))[0]
+            else:
+                rows = await hybrid_search.vector_search(db, q_vec, body.limit, filters)
+
+    if not rows:
+        raise HTTPException(404, f"找不到符合「{body.query}」的食譜")
+
+    # 4. 回傳結果
+    return [
+        RecipeSearchResult(
+            id=r.id,
+            name=r.name,
+            image_url=r.image_url,
+            distance=r.distance,
+            score=r.score,
+        )
+        for r in rows
+    ]
+
+class BatchSearchQuery(BaseModel):
+    query: str
+    limit: int = Field(5, ge=1, le=50)
+
+class RecipeBatchSearchRequest(BaseModel):
+    queries: List[BatchSearchQuery] = Field(..., min_length=1, max_length=20)
+    ef_search: Optional[int] = Field(None, ge=1, le=1000)
+    probes: Optional[int] = Field(None, ge=1, le=1000)
+
+@router.post(
+    "/search:batch",
+    response_model=List[RecipeBatchSearchResult],
+    summary="批次語意搜尋食譜",
+)
+async def batch_search_recipes(
+    body: RecipeBatchSearchRequest = Body(...),
+    db: AsyncSession = Depends(deps.get_db)
     ):
-    # 1. 產生查詢向量
-    api_key = os.getenv("GOOGLE_API_KEY")
-    if not api_key:
-        raise HTTPException(500, "GOOGLE_API_KEY 未設定")
-    emb = GoogleGenerativeAIEmbeddings(model="models/embedding-001",
-                                       google_api_key=api_key)
+    """
+    一次搜尋多個查詢（例如使用者列出的每一樣食材）：
+    快取沒命中的查詢合併成一次 embed_documents 呼叫，向量檢索也在同一個 SQL 中完成；
+    啟用記憶體索引時則以一次矩陣乘法算出所有查詢的結果。找不到結果的查詢回傳空陣列。
+    """
+    texts = [q.query for q in body.queries]
+    limits = [q.limit for q in body.queries]
     try:
-        q_vec = emb.embed_query(body.query)
+        q_vecs = await run_in_threadpool(get_embedding_service().embed_queries, texts)
+    except RuntimeError as e:
+        raise HTTPException(500, str(e))
     except Exception as e:
         raise HTTPException(500, f"Embedding 失敗: {e}")
 
-    # 2. 向量檢索
-    stmt = text("""
-        SELECT id, name, image_url,
-               embedding <#> CAST(:q_vec AS vector) AS distance
-        FROM recipes
-        WHERE embedding IS NOT NULL
-        ORDER BY distance
-        LIMIT :limit
-    """)
-    rows = db.execute(stmt, {"q_vec": q_vec, "limit": body.limit}).fetchall()
+    index = get_memory_index()
+    if index is not None:
+        hits = await run_in_threadpool(index.search_many, q_vecs, limits)
+        grouped = await hybrid_search.hydrate_hits(
+            db, [[(rid, distance) for rid, _, _, distance in rows] for rows in hits]
+        )
+    else:
+        await apply_vector_search_settings(db, body.ef_search, body.probes)
+        grouped = await hybrid_search.batch_vector_search(db, q_vecs, limits)
 
+    return [
+        RecipeBatchSearchResult(
+            query=query,
+            results=[
+                RecipeSearchResult(id=r.id, name=r.name, image_url=r.image_url, distance=r.distance)
+                for r in rows
+            ],
+        )
+        for query, rows in zip(texts, grouped)
+    ]
+
+class PantryMatchRequest(BaseModel):
+    ingredients: List[str] = Field(..., min_length=1, max_length=30)  # 手邊有的食材
+    limit: int = Field(10, ge=1, le=50)
+    max_missing: Optional[int] = Field(None, ge=0)  # 最多可接受缺少幾樣核心食材
+    max_total_time: Optional[int] = Field(None, ge=1)
+    difficulty: Optional[int] = None
+    cuisine_style: Optional[str] = None
+
+@router.post(
+    "/pantry-match",
+    response_model=List[PantryMatchResult],
+    summary="以手邊的食材找食譜",
+)
+async def match_pantry(
+    body: PantryMatchRequest = Body(...),
+    db: AsyncSession = Depends(deps.get_db)
+    ):
+    """
+    食材先經同義詞表正規化（例如 蕃茄 → 番茄、青蔥 → 蔥），
+    再以 core_ingredients 的 GIN 索引取出候選，依缺少的食材數與符合的食材數排序；
+    不需要呼叫 LLM 或 embedding。
+    """
+    normalizer = await get_normalizer(db)
+    filters = hybrid_search.build_filters(
+        max_total_time=body.max_total_time,
+        difficulty=body.difficulty,
+        cuisine_style=body.cuisine_style,
+    )
+    pantry, rows = await pantry_match(db, normalizer, body.ingredients, body.limit, body.max_missing, filters)
     if not rows:
-        raise HTTPException(404, f"找不到符合「{body.query}」的食譜")
+        raise HTTPException(404, f"找不到能用「{'、'.join(pantry or body.ingredients)}」做的食譜")
 
-    # 3. 回傳結果
     return [
-        RecipeSearchResult(
+        PantryMatchResult(
             id=r.id,
             name=r.name,
             image_url=r.image_url,
-            distance=r.distance
+            matched_count=r.matched_count,
+            missing_count=r.missing_count,
+            coverage=r.coverage,
+            matched_ingredients=r.matched_ingredients,
+            missing_ingredients=r.missing_ingredients,
         )
         for r in rows
     ]
 
+@router.get("/search/cache-stats", summary="查詢向量快取統計", dependencies=[Depends(admin_auth)])
+def read_search_cache_stats():
+    return {
+        **get_embedding_service().stats(),
+        "search_modes": hybrid_search.stats.snapshot(),
+        "memory_index": memory_index.stats(),
+        "recipe_cache": recipe_cache.stats(),
+    }
+
 @router.post("/", response_model=Recipe, summary="新增食譜", dependencies=[Depends(admin_auth)])
-def create_recipe(recipe: RecipeCreate, db: Session = Depends(deps.get_db)):
+async def create_recipe(recipe: RecipeCreate, db: AsyncSession = Depends(deps.get_db)):
     data = recipe.model_dump()
     # 修正 image_url 為 str
     data["image_url"] = str(data["image_url"])
     # full_ingredient_list, nutrition_info 保持 dict
     db_recipe = models.Recipe(**data)
     db.add(db_recipe)
-    db.commit()
-    db.refresh(db_recipe)
+    await db.commit()
+    await db.refresh(db_recipe)
     return db_recipe
 
-@router.get("/", response_model=List[Recipe], summary="查詢所有食譜（分頁）", dependencies=[Depends(admin_auth)])
-def read_recipes(skip: int = 0, limit: int = 20, db: Session = Depends(deps.get_db)):
-    return db.query(models.Recipe).offset(skip).limit(limit).all()
+# 列表可選取的欄位；summary 是列表畫面需要的精簡欄位，不含步驟與完整食材等大型欄位
+RECIPE_LIST_FIELDS = ["id", "name"] + [f for f in RecipeCreate.model_fields if f != "name"]
+RECIPE_SUMMARY_FIELDS = ["id", "name", "image_url", "total_time", "difficulty", "cuisine_style"]
+
+def encode_cursor(last_id: int) -> str:
+    return base64.urlsafe_b64encode(json.dumps({"id": last_id}).encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> int:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        return int(json.loads(base64.urlsafe_b64decode(padded))["id"])
+    except (binascii.Error, ValueError, KeyError, TypeError):
+        raise HTTPException(status_code=400, detail="cursor 格式不正確")
+
+def parse_fields(fields: str) -> List[str]:
+    if fields in ("summary", ""):
+        return RECIPE_SUMMARY_FIELDS
+    if fields in ("all", "full"):
+        return RECIPE_LIST_FIELDS
+    selected = [f.strip() for f in fields.split(",") if f.strip()]
+    unknown = [f for f in selected if f not in RECIPE_LIST_FIELDS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"不支援的欄位：{', '.join(unknown)}")
+    # id 是 cursor 的依據，一律回傳
+    return ["id"] + [f for f in selected if f != "id"]
+
+@router.get("/", response_model=RecipePage, summary="查詢所有食譜（分頁）", dependencies=[Depends(admin_auth)])
+async def read_recipes(
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = Query(None, description="上一頁回傳的 next_cursor"),
+    fields: str = Query("summary", description="summary、all，或以逗號分隔的欄位名稱"),
+    skip: Optional[int] = Query(None, ge=0, description="已淘汰：OFFSET 分頁，深層頁面會越來越慢"),
+    db: AsyncSession = Depends(deps.get_db),
+):
+    """
+    以 id 做 keyset 分頁：WHERE id > 上一頁最後一筆 ORDER BY id，
+    每一頁都只走主鍵索引的一小段，不會像 OFFSET 一樣越後面越慢。
+    fields 決定 SELECT 的欄位，列表畫面不需要載入步驟、完整食材與營養資訊。
+    """
+    columns = [getattr(models.Recipe, f) for f in parse_fields(fields)]
+    stmt = select(*columns).order_by(models.Recipe.id).limit(limit + 1)
+    if cursor:
+        stmt = stmt.where(models.Recipe.id > decode_cursor(cursor))
+    elif skip:
+        stmt = stmt.offset(skip)
+    rows = (await db.execute(stmt)).mappings().all()
+
+    items = [dict(r) for r in rows[:limit]]
+    next_cursor = encode_cursor(items[-1]["id"]) if len(rows) > limit else None
+    return RecipePage(items=items, next_cursor=next_cursor)
 
 @router.put("/{recipe_id}", response_model=Recipe, summary="更新食譜", dependencies=[Depends(admin_auth)])
-def update_recipe(recipe_id: int, recipe: RecipeCreate, db: Session = Depends(deps.get_db)):
-    db_recipe = db.query(models.Recipe).filter(models.Recipe.id == recipe_id).first()
+async def update_recipe(recipe_id: int, recipe: RecipeCreate, db: AsyncSession = Depends(deps.get_db)):
+    db_recipe = await db.get(models.Recipe, recipe_id)
     if not db_recipe:
         raise HTTPException(status_code=404, detail="Recipe not found")
+    old_version = recipe_version(db_recipe.updated_at)
     data = recipe.model_dump()
     data["image_url"] = str(data["image_url"])
     for k, v in data.items():
         setattr(db_recipe, k, v)
-    db.commit()
-    db.refresh(db_recipe)
+    await db.commit()
+    await db.refresh(db_recipe)
+    # updated_at 已改變，舊版本的快取不會再被讀到；這裡一併清掉，釋放空間
+    await recipe_cache.invalidate(recipe_id, old_version)
     return db_recipe
 
 @router.delete("/{recipe_id}", summary="刪除食譜", dependencies=[Depends(admin_auth)])
-def delete_recipe(recipe_id: int, db: Session = Depends(deps.get_db)):
-    db_recipe = db.query(models.Recipe).filter(models.Recipe.id == recipe_id).first()
+async def delete_recipe(recipe_id: int, db: AsyncSession = Depends(deps.get_db)):
+    db_recipe = await db.get(models.Recipe, recipe_id)
     if not db_recipe:
         raise HTTPException(status_code=404, detail="Recipe not found")
-    db.delete(db_recipe)
-    db.commit()
+    old_version = recipe_version(db_recipe.updated_at)
+    await db.delete(db_recipe)
+    await db.commit()
+    await recipe_cache.invalidate(recipe_id, old_version)
     return {"ok": True}
\ No newline at end of file
@@ -1,7 +1,11 @@
 # 檔案位置: app/db/models.py
 
-from sqlalchemy import Column, Integer, String, Text, ARRAY, JSON
-from sqlalchemy.orm import declarative_base
+from sqlalchemy import Column, DateTime, Integer, String, Text, ARRAY, JSON, func
+from sqlalchemy.orm import declarative_base, deferred
+from pgvector.sqlalchemy import Vector
+
+# Gemini models/embedding-001 的向量維度
+EMBEDDING_DIM = 768
 
 # 建立一個所有模型都會繼承的 Base class
 Base = declarative_base()
@@ -13,6 +17,7 @@ class Recipe(Base):
     __tablename__ = "recipes"
 
     id = Column(Integer, primary_key=True, index=True)  # 食譜編號
+    source_url = Column(String, nullable=True, unique=True)  # 食譜來源網址（匯入時的自然鍵）
     name = Column(String, index=True, nullable=False)  # 食譜名稱
     image_url = Column(String, nullable=False)  # 食譜圖片網址
     core_ingredients = Column(ARRAY(String), nullable=False)  # 核心食材
@@ -24,4 +29,14 @@ class Recipe(Base):
     servings = Column(String, nullable=True)  # 份量
     key_equipment = Column(ARRAY(String), nullable=True)  # 關鍵設備
     tips = Column(ARRAY(Text), nullable=True)  # 小技巧
-    nutrition_info = Column(JSON, nullable=True)  # 營養資訊
\ No newline at end of file
+    nutrition_info = Column(JSON, nullable=True)  # 營養資訊
+    # 語意搜尋用的向量 (pgvector)；設為 deferred，一般讀取食譜時不會一併載入 768 維的向量
+    embedding = deferred(Column(Vector(EMBEDDING_DIM), nullable=True))
+    # 產生 embedding 時輸入文字的雜湊（scripts/vec_import.py 用來判斷是否需要重新嵌入）
+    embedding_hash = deferred(Column(String, nullable=True))
+    # 最近一次寫入 embedding 的時間；app/services/memory_index.py 依此只載入有變動的向量
+    embedding_updated_at = deferred(Column(DateTime(timezone=True), nullable=True))
+    created_at = Column(DateTime(timezone=True), server_default=func.now())  # 建立時間
+    # 最後修改時間；GET /recipes/{id} 以此作為 ETag 與快取的版本
+    # （以 SQL 直接更新時由 migrations/0007 的 trigger 維護）
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
\ No newline at end of file
@@ -2,7 +2,9 @@
 
 import os
 from dotenv import load_dotenv
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker
 
 # 載入 .env 檔案中的環境變數
@@ -19,9 +21,55 @@ if DATABASE_URL is None:
     db_name = os.getenv("DB_NAME")
     DATABASE_URL = f"postgresql+psycopg2://{db_user}:{db_password}@{db_host}:{db_port}/{db_name}"
 
+# 連線池設定（同步與非同步引擎共用）
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))  # 秒；避免使用被防火牆或 DB 端關掉的舊連線
+# asyncpg 每條連線快取的 prepared statement 數；經過 PgBouncer (transaction mode) 時需設為 0
+DB_STATEMENT_CACHE_SIZE = int(os.getenv("DB_STATEMENT_CACHE_SIZE", "100"))
+
 # 建立 SQLAlchemy 引擎
-engine = create_engine(DATABASE_URL, pool_pre_ping=True)
+engine = create_engine(
+    DATABASE_URL,
+    pool_pre_ping=True,
+    pool_size=DB_POOL_SIZE,
+    max_overflow=DB_MAX_OVERFLOW,
+    pool_timeout=DB_POOL_TIMEOUT,
+    pool_recycle=DB_POOL_RECYCLE,
+)
 
 # 建立一個 SessionLocal class
 # 這個 class 的每一個實例，都將會是一個獨立的資料庫 session
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
\ No newline at end of file
+SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+
+def to_async_url(url: str):
+    """把同步連線 URL 轉成 asyncpg driver 的 URL"""
+    async_url = make_url(url).set(drivername="postgresql+asyncpg")
+    return async_url.update_query_dict({"prepared_statement_cache_size": str(DB_STATEMENT_CACHE_SIZE)})
+
+
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL") or to_async_url(DATABASE_URL)
+
+# API 使用的非同步引擎（asyncpg），請求等待 DB 時不會佔用 threadpool
+async_engine = create_async_engine(
+    ASYNC_DATABASE_URL,
+    pool_pre_ping=True,
+    pool_size=DB_POOL_SIZE,
+    max_overflow=DB_MAX_OVERFLOW,
+    pool_timeout=DB_POOL_TIMEOUT,
+    pool_recycle=DB_POOL_RECYCLE,
+    connect_args={"statement_cache_size": DB_STATEMENT_CACHE_SIZE},
+)
+
+
+@event.listens_for(async_engine.sync_engine, "connect")
+def register_vector_codec(dbapi_connection, connection_record):
+    # 讓 asyncpg 直接以二進位格式收送 pgvector 的 vector 型別
+    from pgvector.asyncpg import register_vector
+    dbapi_connection.run_async(register_vector)
+
+
+# commit 後不讓物件過期，避免回傳 response 時觸發非同步環境下不允許的 lazy load
+AsyncSessionLocal = async_sessionmaker(async_engine, expire_on_commit=False, autoflush=False)
\ No newline at end of file
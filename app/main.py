@@ -1,10 +1,27 @@
 # app/main.py
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 # 匯入 line_bot router
 from app.api.v1.endpoints import line_bot , recipes
+from app.db.session import async_engine
+from app.services import memory_index
+from app.services.recipe_cache import recipe_cache
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # 啟動 LINE 事件的背景 worker，關閉時先處理完佇列再結束
+    await line_bot.startup()
+    # VECTOR_MEMORY_INDEX=1 時把食譜向量載入記憶體，語意搜尋不必每次查詢 pgvector
+    await memory_index.startup()
+    yield
+    await memory_index.shutdown()
+    await line_bot.shutdown()
+    await recipe_cache.close()
+    # 關閉 asyncpg 連線池
+    await async_engine.dispose()
 
 # 建立一個 FastAPI 應用實例
-app = FastAPI(title="Mom's Hero API")
+app = FastAPI(title="Mom's Hero API", lifespan=lifespan)
 
 # 定義一個根路由 (endpoint)
 @app.get("/")
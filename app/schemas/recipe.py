@@ -1,7 +1,7 @@
 # 檔案位置: app/schemas/recipe.py
 
 from pydantic import BaseModel, HttpUrl
-from typing import List, Optional
+from typing import Any, Dict, List, Optional
 
 class RecipeBase(BaseModel):
     """
@@ -35,6 +35,31 @@ class RecipeSearchResult(BaseModel):
     id: int
     name: str
     image_url: HttpUrl
-    distance: float   # 相似度距離 (cosine distance)
+    distance: Optional[float] = None   # 相似度距離 (cosine distance)；只由關鍵字比對命中時為 None
+    score: Optional[float] = None   # 關鍵字相似度或混合搜尋的 RRF 分數；純向量搜尋時為 None
     class Config:
-        from_attributes = True 
\ No newline at end of file
+        from_attributes = True 
+
+class RecipeBatchSearchResult(BaseModel):
+    """ 批次搜尋中單一查詢的結果，順序與請求中的 queries 相同。 """
+    query: str
+    results: List[RecipeSearchResult]
+
+class PantryMatchResult(BaseModel):
+    """ 食材比對的結果：使用者手邊的食材能做的食譜，以及還缺哪些食材。 """
+    id: int
+    name: str
+    image_url: HttpUrl
+    matched_count: int  # 符合的核心食材數（依標準名稱計算）
+    missing_count: int  # 還缺少的核心食材數
+    coverage: float  # 符合的食材占食譜核心食材的比例
+    matched_ingredients: List[str]
+    missing_ingredients: List[str]
+
+class RecipePage(BaseModel):
+    """
+    食譜列表的一頁。items 只包含 fields 指定的欄位；
+    next_cursor 為 None 代表已經是最後一頁，否則帶入下一次請求的 cursor 參數。
+    """
+    items: List[Dict[str, Any]]
+    next_cursor: Optional[str] = None
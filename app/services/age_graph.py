@@ -0,0 +1,436 @@
+# 檔案位置: app/services/age_graph.py
+
+import copy
+import hashlib
+import json
+import os
+import re
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+
+from dotenv import load_dotenv
+from langchain_community.chains.graph_qa.cypher import construct_schema
+from langchain_community.graphs.graph_store import GraphStore
+from psycopg2.extensions import connection as PgConnection
+from psycopg2.pool import ThreadedConnectionPool
+
+load_dotenv()
+
+# AGE 連線池大小
+AGE_POOL_MIN = int(os.getenv("AGE_POOL_MIN", "1"))
+AGE_POOL_MAX = int(os.getenv("AGE_POOL_MAX", "10"))
+# 每條連線最多保留幾個 PREPARE 過的 Cypher；LLM 產生的 Cypher 幾乎每題都不同，超過時 DEALLOCATE 最久未用的
+AGE_PREPARED_PER_CONN = int(os.getenv("AGE_PREPARED_PER_CONN", "64"))
+# 串流讀取結果時每次 fetchmany 的筆數
+AGE_FETCH_SIZE = int(os.getenv("AGE_FETCH_SIZE", "500"))
+# 推導 schema 時每個 label 抽樣的筆數
+AGE_SCHEMA_SAMPLE_SIZE = int(os.getenv("AGE_SCHEMA_SAMPLE_SIZE", "100"))
+
+# 與 scripts/graph_builder.py 建立的圖譜一致；資料庫無法連線或圖譜尚未建立時使用
+DEFAULT_SCHEMA: Dict[str, Any] = {
+    "node_props": {
+        "Recipe": [{"property": "id", "type": "INTEGER"}, {"property": "name", "type": "STRING"}],
+        "Ingredient": [{"property": "name", "type": "STRING"}],
+        "Cuisine": [{"property": "name", "type": "STRING"}],
+        "Equipment": [{"property": "name", "type": "STRING"}],
+    },
+    "rel_props": {},
+    "relationships": [
+        {"start": "Recipe", "type": "HAS_INGREDIENT", "end": "Ingredient"},
+        {"start": "Recipe", "type": "BELONGS_TO_CUISINE", "end": "Cuisine"},
+        {"start": "Recipe", "type": "REQUIRES_EQUIPMENT", "end": "Equipment"},
+    ],
+}
+
+# 包住 Cypher 的 dollar-quote 標記
+_CYPHER_QUOTE = "$cypher$"
+_AGTYPE_SUFFIX = re.compile(r"::(vertex|edge|path|numeric)\b")
+_RETURN_CLAUSE = re.compile(r"\bRETURN\b(\s+DISTINCT\b)?", re.IGNORECASE)
+_RETURN_TAIL = re.compile(r"\b(ORDER\s+BY|SKIP|LIMIT|UNION)\b", re.IGNORECASE)
+_ALIAS = re.compile(r"\s+AS\s+`?([^`\s]+)`?\s*$", re.IGNORECASE)
+
+
+def _split_top_level(text: str) -> List[str]:
+    """以逗號切開 RETURN 的項目，忽略括號與字串中的逗號"""
+    parts, depth, quote, start = [], 0, None, 0
+    for i, ch in enumerate(text):
+        if quote:
+            if ch == quote and text[i - 1] != "\\":
+                quote = None
+        elif ch in "'\"":
+            quote = ch
+        elif ch in "([{":
+            depth += 1
+        elif ch in ")]}":
+            depth -= 1
+        elif ch == "," and depth == 0:
+            parts.append(text[start:i])
+            start = i + 1
+    parts.append(text[start:])
+    return [p.strip() for p in parts if p.strip()]
+
+
+def return_columns(cypher: str) -> List[str]:
+    """
+    從 Cypher 的最後一個 RETURN 子句推出欄位名稱；
+    ag_catalog.cypher() 必須用 AS (...) 宣告與 RETURN 相同數量的欄位。
+    """
+    matches = list(_RETURN_CLAUSE.finditer(cypher))
+    if not matches:
+        # 沒有 RETURN 的寫入語句（CREATE / MERGE / DELETE）仍需宣告一個欄位
+        return ["result"]
+    body = cypher[matches[-1].end():]
+    tail = _RETURN_TAIL.search(body)
+    if tail:
+        body = body[:tail.start()]
+    columns = []
+    for item in _split_top_level(body):
+        if item == "*":
+            raise ValueError("AGE 需要明確的回傳欄位，不支援 RETURN *")
+        alias = _ALIAS.search(item)
+        columns.append(alias.group(1) if alias else item)
+    return columns or ["result"]
+
+
+def _strip_agtype_suffixes(text: str) -> str:
+    """移除字串常值以外的 ::vertex / ::edge / ::path / ::numeric 型別標記"""
+    out, i, in_string = [], 0, False
+    while i < len(text):
+        ch = text[i]
+        if in_string:
+            out.append(ch)
+            if ch == "\\" and i + 1 < len(text):
+                out.append(text[i + 1])
+                i += 1
+            elif ch == '"':
+                in_string = False
+        elif ch == '"':
+            in_string = True
+            out.append(ch)
+        elif ch == ":" and text.startswith("::", i):
+            m = _AGTYPE_SUFFIX.match(text, i)
+            if m:
+                i = m.end()
+                continue
+            out.append(ch)
+        else:
+            out.append(ch)
+        i += 1
+    return "".join(out)
+
+
+def _simplify(value: Any) -> Any:
+    """把 vertex / edge 轉成它們的屬性 dict，與 LangChain 其他 GraphStore 的回傳格式一致"""
+    if isinstance(value, dict):
+        if "label" in value and "properties" in value and "id" in value:
+            return _simplify(value["properties"])
+        return {k: _simplify(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_simplify(v) for v in value]
+    return value
+
+
+def _property_type(value: Any) -> str:
+    if isinstance(value, bool):
+        return "BOOLEAN"
+    if isinstance(value, int):
+        return "INTEGER"
+    if isinstance(value, float):
+        return "FLOAT"
+    if isinstance(value, list):
+        return "LIST"
+    if isinstance(value, dict):
+        return "MAP"
+    return "STRING"
+
+
+def parse_agtype(raw: Optional[str]) -> Any:
+    """將 agtype 的文字表示轉成 Python 物件"""
+    if raw is None:
+        return None
+    return _simplify(json.loads(_strip_agtype_suffixes(raw)))
+
+
+class AgeConnection(PgConnection):
+    """
+    記錄 AGE 初始化狀態的連線。狀態放在連線物件本身，
+    連線池關閉舊連線、再建立新連線時，新連線一定會重新初始化。
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # None 表示尚未執行 LOAD 'age' 與 search_path 設定；之後為已 PREPARE 的語句名稱（依使用順序）
+        self.age_prepared: "Optional[OrderedDict[str, None]]" = None
+
+
+class CustomAgeGraph(GraphStore):
+    """
+    Apache AGE 的 GraphStore 實作。
+
+    查詢透過 psycopg2 連線池執行；每條連線只在第一次借出時執行
+    LOAD 'age' 與 search_path 設定，Cypher 以 PREPARE 的方式帶入參數
+    （ag_catalog.cypher 的第三個參數必須是 prepared statement 的 $1）。
+    """
+    def __init__(
+        self,
+        connection_details: Dict[str, Any],
+        graph_name: str,
+        pool_min: int = AGE_POOL_MIN,
+        pool_max: int = AGE_POOL_MAX,
+    ):
+        self.connection_details = connection_details
+        self.graph_name = graph_name
+        self.pool_min = pool_min
+        self.pool_max = pool_max
+        self._pool: Optional[ThreadedConnectionPool] = None
+        self._pool_lock = threading.Lock()
+        # ThreadedConnectionPool 借出的連線超過 maxconn 時會直接丟出 PoolError，先在這裡排隊等待
+        self._slots = threading.BoundedSemaphore(pool_max)
+        self._structured_schema: Dict[str, Any] = {}
+        self._schema_version: Optional[int] = None
+        self.refresh_schema()
+
+    @property
+    def get_structured_schema(self) -> Dict[str, Any]:
+        return self._structured_schema
+
+    @property
+    def pool(self) -> ThreadedConnectionPool:
+        if self._pool is None:
+            with self._pool_lock:
+                if self._pool is None:
+                    self._pool = ThreadedConnectionPool(
+                        self.pool_min, self.pool_max, connection_factory=AgeConnection,
+                        **self.connection_details
+                    )
+        return self._pool
+
+    @contextmanager
+    def connection(self):
+        """
+        從連線池借出一條已完成 AGE 初始化的連線；同時借出的連線數超過 pool_max 時等待歸還。
+        """
+        self._slots.acquire()
+        try:
+            pool = self.pool
+            conn = pool.getconn()
+        except Exception:
+            self._slots.release()
+            raise
+        broken = False
+        try:
+            if conn.age_prepared is None:
+                conn.autocommit = True
+                with conn.cursor() as cur:
+                    cur.execute("LOAD 'age';")
+                    cur.execute('SET search_path = ag_catalog, "$user", public;')
+                conn.age_prepared = OrderedDict()
+            yield conn
+        except Exception:
+            broken = bool(conn.closed)
+            raise
+        finally:
+            try:
+                pool.putconn(conn, close=broken)
+            finally:
+                self._slots.release()
+
+    def _prepare(self, conn, cur, cypher: str, columns: List[str]) -> str:
+        """
+        在這條連線上 PREPARE 指定的 Cypher（已 PREPARE 過則直接重用），回傳語句名稱。
+        每條連線只保留最近使用的 AGE_PREPARED_PER_CONN 個語句，其餘以 DEALLOCATE 釋放。
+        """
+        if _CYPHER_QUOTE in cypher:
+            raise ValueError(f"Cypher 中不可包含 {_CYPHER_QUOTE}")
+        key = f"{self.graph_name}\n{cypher}\n{len(columns)}"
+        name = "age_" + hashlib.sha1(key.encode("utf-8")).hexdigest()[:20]
+        prepared = conn.age_prepared
+        if name in prepared:
+            prepared.move_to_end(name)
+        else:
+            column_defs = ", ".join(f"c{i} agtype" for i in range(len(columns)))
+            cur.execute(
+                f"PREPARE {name}(agtype) AS "
+                f"SELECT * FROM ag_catalog.cypher(%s, {_CYPHER_QUOTE}{cypher.replace('%', '%%')}{_CYPHER_QUOTE}, $1) "
+                f"AS ({column_defs});",
+                (self.graph_name,),
+            )
+            prepared[name] = None
+            while len(prepared) > AGE_PREPARED_PER_CONN:
+                evicted, _ = prepared.popitem(last=False)
+                cur.execute(f"DEALLOCATE {evicted};")
+        return name
+
+    def iter_query(self, query: str, params: Optional[dict] = None, fetch_size: int = AGE_FETCH_SIZE,
+                   timeout: Optional[float] = None) -> Iterator[Dict[str, Any]]:
+        """
+        執行 Cypher 並以 generator 逐批回傳結果，每筆為 {欄位名稱: Python 值}。
+        timeout（秒）會設成這次查詢的 statement_timeout，超過時由資料庫中止查詢。
+        """
+        columns = return_columns(query)
+        with self.connection() as conn, conn.cursor() as cur:
+            name = self._prepare(conn, cur, query, columns)
+            if timeout is not None:
+                # 連線為 autocommit，SET LOCAL 沒有交易可依附；改為查詢前設定、結束後重設。0 表示不限時，至少設 1 毫秒
+                cur.execute("SET statement_timeout = %s;", (max(1, int(timeout * 1000)),))
+            try:
+                cur.execute(f"EXECUTE {name}(%s);", (json.dumps(params or {}, ensure_ascii=False),))
+                if cur.description is None:
+                    return
+                while True:
+                    rows = cur.fetchmany(fetch_size)
+                    if not rows:
+                        break
+                    for row in rows:
+                        yield {col: parse_agtype(value) for col, value in zip(columns, row)}
+            finally:
+                if timeout is not None and not conn.closed:
+                    cur.execute("RESET statement_timeout;")
+
+    def query(self, query: str, params: dict = {}, timeout: Optional[float] = None) -> List[Dict[str, Any]]:
+        return list(self.iter_query(query, params, timeout=timeout))
+
+    def graph_version(self) -> int:
+        """
+        讀取 scripts/graph_builder.py 每次建圖後遞增的版本號；尚未建過圖時回傳 0。
+        """
+        with self.connection() as conn, conn.cursor() as cur:
+            cur.execute("SELECT to_regclass('public.graph_build_meta') IS NOT NULL;")
+            if not cur.fetchone()[0]:
+                return 0
+            cur.execute(
+                "SELECT version FROM public.graph_build_meta WHERE graph_name = %s;",
+                (self.graph_name,),
+            )
+            row = cur.fetchone()
+            return row[0] if row else 0
+
+    def introspect_schema(self, sample_size: int = AGE_SCHEMA_SAMPLE_SIZE) -> Dict[str, Any]:
+        """
+        從 ag_catalog 讀出所有 label，並以單一 UNION ALL 查詢抽樣各 label 的屬性
+        與關係兩端的節點 label，推導出 LangChain 使用的結構化 schema。
+        """
+        with self.connection() as conn, conn.cursor() as cur:
+            cur.execute(
+                """
+                SELECT g.graphid, l.name, l.kind, l.relation::text
+                FROM ag_catalog.ag_label l
+                JOIN ag_catalog.ag_graph g ON g.graphid = l.graph
+                WHERE g.name = %s AND l.name NOT IN ('_ag_label_vertex', '_ag_label_edge')
+                ORDER BY l.kind DESC, l.name;
+                """,
+                (self.graph_name,),
+            )
+            labels = cur.fetchall()
+            if not labels:
+                return {"node_props": {}, "rel_props": {}, "relationships": []}
+
+            parts, args = [], []
+            for graph_oid, name, kind, relation in labels:
+                if kind == "v":
+                    parts.append(
+                        f"(SELECT 'v'::text, %s::text, properties::text, NULL::text, NULL::text "
+                        f"FROM {relation} LIMIT %s)"
+                    )
+                    args += [name, sample_size]
+                else:
+                    parts.append(
+                        f"(SELECT 'e'::text, %s::text, properties::text, "
+                        f"ag_catalog._label_name(%s::oid, start_id)::text, "
+                        f"ag_catalog._label_name(%s::oid, end_id)::text "
+                        f"FROM {relation} LIMIT %s)"
+                    )
+                    args += [name, graph_oid, graph_oid, sample_size]
+            cur.execute(" UNION ALL ".join(parts), args)
+            rows = cur.fetchall()
+
+        node_props: Dict[str, Dict[str, str]] = {n: {} for _, n, k, _ in labels if k == "v"}
+        rel_props: Dict[str, Dict[str, str]] = {n: {} for _, n, k, _ in labels if k == "e"}
+        relationships = []
+        for kind, label, properties, start, end in rows:
+            target = node_props if kind == "v" else rel_props
+            for prop, value in (parse_agtype(properties) or {}).items():
+                prop_type = _property_type(value)
+                seen = target[label].get(prop)
+                # 抽樣中型別不一致時以 STRING 描述，避免誤導 LLM
+                target[label][prop] = prop_type if seen in (None, prop_type) else "STRING"
+            if kind == "e":
+                rel = {"start": start, "type": label, "end": end}
+                if rel not in relationships:
+                    relationships.append(rel)
+
+        def to_list(props: Dict[str, Dict[str, str]]) -> Dict[str, List[Dict[str, str]]]:
+            return {
+                label: [{"property": p, "type": t} for p, t in sorted(items.items())]
+                for label, items in props.items()
+            }
+
+        return {
+            "node_props": to_list(node_props),
+            "rel_props": {k: v for k, v in to_list(rel_props).items() if v},
+            "relationships": relationships,
+        }
+
+    def _load_persisted_schema(self, version: int) -> Optional[Dict[str, Any]]:
+        with self.connection() as conn, conn.cursor() as cur:
+            cur.execute(
+                "SELECT schema FROM public.graph_build_meta "
+                "WHERE graph_name = %s AND schema_version = %s;",
+                (self.graph_name, version),
+            )
+            row = cur.fetchone()
+        return row[0] if row and row[0] else None
+
+    def _persist_schema(self, version: int, schema: Dict[str, Any]) -> None:
+        with self.connection() as conn, conn.cursor() as cur:
+            cur.execute(
+                "UPDATE public.graph_build_meta SET schema = %s, schema_version = %s "
+                "WHERE graph_name = %s AND version = %s;",
+                (json.dumps(schema, ensure_ascii=False), version, self.graph_name, version),
+            )
+
+    def refresh_schema(self, force: bool = False) -> None:
+        """
+        更新 schema。只有圖譜版本改變（重建過）時才重新檢視資料庫；
+        同一版本的結果會存回 graph_build_meta，其他 worker 與重新啟動時可直接讀取。
+        """
+        try:
+            version = self.graph_version()
+            if not force and self._structured_schema and version == self._schema_version:
+                return
+            schema = None
+            if version and not force:
+                try:
+                    schema = self._load_persisted_schema(version)
+                except Exception as e:
+                    print(f"[CustomAgeGraph] 讀取已儲存的 schema 失敗：{e}")
+            if schema is None:
+                schema = self.introspect_schema()
+                if not schema["node_props"]:
+                    # 圖譜尚未建立，沿用預設 schema
+                    schema = copy.deepcopy(DEFAULT_SCHEMA)
+                elif version:
+                    try:
+                        self._persist_schema(version, schema)
+                    except Exception as e:
+                        print(f"[CustomAgeGraph] 儲存 schema 失敗：{e}")
+            self._structured_schema = schema
+            self._schema_version = version
+        except Exception as e:
+            # 資料庫暫時無法連線時不阻擋啟動，先用預設 schema，下次版本檢查再更新
+            print(f"[CustomAgeGraph] 讀取圖譜 schema 失敗，改用預設 schema：{e}")
+            if not self._structured_schema:
+                self._structured_schema = copy.deepcopy(DEFAULT_SCHEMA)
+
+    @property
+    def get_schema(self) -> str:
+        return construct_schema(self._structured_schema, [], [])
+
+    def close(self) -> None:
+        if self._pool is not None:
+            self._pool.closeall()
+            self._pool = None
+
+
+__all__ = ["CustomAgeGraph", "parse_agtype", "return_columns"]
@@ -1,40 +1,49 @@
 # app/services/ai_service.py
 # app/services/ai_service.py
 
+import asyncio
 import os
-from typing import Any, Dict, List
+import re
+import time
+from typing import Any, Dict, Optional
 from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain.chains import GraphCypherQAChain
-from langchain_community.graphs.graph_store import GraphStore
 from dotenv import load_dotenv
- 
-class CustomAgeGraph(GraphStore):
-    def __init__(self, connection_details: Dict[str, Any], graph_name: str):
-        self.connection_details = connection_details
-        self.graph_name = graph_name
-        self._structured_schema: Dict[str, Any] = {}
-        self.refresh_schema()
-
-    @property
-    def get_structured_schema(self) -> Dict[str, Any]:
-        return self._structured_schema
- 
-    def refresh_schema(self) -> None:
-        self._structured_schema = {
-            "node_labels": ["Recipe", "Ingredient", "Cuisine", "Equipment"],
-            "node_properties": [
-                {"label": "Recipe", "properties": [("recipe_id", "INTEGER"), ("name", "STRING")]},
-                {"label": "Ingredient", "properties": [("name", "STRING")]},
-                {"label": "Cuisine", "properties": [("name", "STRING")]},
-                {"label": "Equipment", "properties": [("name", "STRING")]},
-            ],
-            "relationships": [
-                {"start": "Recipe", "type": "HAS_INGREDIENT", "end": "Ingredient"},
-                {"start": "Recipe", "type": "BELONGS_TO_CUISINE", "end": "Cuisine"},
-                {"start": "Recipe", "type": "REQUIRES_EQUIPMENT", "end": "Equipment"},
-            ],
-            "relationship_properties": [],
-        }
+
+from app.services.age_graph import CustomAgeGraph
+from app.services.answer_cache import SemanticAnswerCache, extract_literals
+from app.services.cypher_cache import CypherPlanCache
+from app.services.embedding_service import get_embedding_service
+
+load_dotenv()
+
+# 每次對話的時間預算（秒），必須落在 LINE reply token 的有效時間內
+AI_DEADLINE_SECONDS = float(os.getenv("AI_DEADLINE_SECONDS", "20"))
+# 同時送往 Gemini 的請求上限
+AI_MAX_CONCURRENCY = int(os.getenv("AI_MAX_CONCURRENCY", "8"))
+
+ERROR_MESSAGE = "抱歉，查詢時發生錯誤，請稍後再試。"
+TIMEOUT_MESSAGE = "抱歉，現在詢問的人有點多，請稍後再問我一次。"
+
+# 語意回答快取：相似度門檻、容量與存活時間（秒）
+# 只改了食材的問題（「牛肉怎麼煮」與「豬肉怎麼煮」）相似度也常在 0.95 以上，門檻需夠高，並另外比對常值
+ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "1") == "1"
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.98"))
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "512"))
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", "3600"))
+# Cypher 樣板快取：相同形狀的問題重用驗證過的 Cypher，不再呼叫 LLM 產生
+CYPHER_CACHE_ENABLED = os.getenv("CYPHER_CACHE_ENABLED", "1") == "1"
+CYPHER_CACHE_SIZE = int(os.getenv("CYPHER_CACHE_SIZE", "256"))
+# 每隔多少秒檢查一次圖譜版本（圖譜重建後回答快取需失效）
+GRAPH_VERSION_CHECK_SECONDS = float(os.getenv("GRAPH_VERSION_CHECK_SECONDS", "30"))
+
+
+def extract_cypher(text: str) -> str:
+    """
+    從 LLM 回覆中取出 Cypher；回覆常以 ```cypher ... ``` 包住，需一併去除語言標記。
+    """
+    match = re.search(r"```(?:cypher)?\s*(.*?)```", text, re.DOTALL | re.IGNORECASE)
+    return (match.group(1) if match else text).strip()
 
 class AIService:
     """
@@ -52,7 +61,8 @@ class AIService:
             "password": os.getenv("DB_PASSWORD"),
         }
         # 初始化 CustomAgeGraph
-        self.graph = CustomAgeGraph(self.conn_details, graph_name=os.getenv("GRAPH_NAME", "moms_hero"))
+        # 圖譜名稱需與 scripts/graph_builder.py 建立的一致
+        self.graph = CustomAgeGraph(self.conn_details, graph_name=os.getenv("GRAPH_NAME", "moms_hero_graph"))
         # 初始化 LLM
         self.llm = ChatGoogleGenerativeAI(api_key=os.getenv("GOOGLE_API_KEY"),
                                           model="gemini-1.5-flash"  # 或您要的其他 Gemini 模型
@@ -61,17 +71,169 @@ class AIService:
         self.chain = GraphCypherQAChain.from_llm(llm=self.llm,
                                                  graph=self.graph,
                                                  allow_dangerous_requests=True)
+        # 限制同時送往 Gemini 的請求數，以及每次對話的預設時間預算
+        self.deadline = AI_DEADLINE_SECONDS
+        self._llm_slots = asyncio.Semaphore(AI_MAX_CONCURRENCY)
+        # 語意回答快取：相近的問題直接回傳先前的回答
+        self.answer_cache = SemanticAnswerCache(
+            threshold=ANSWER_CACHE_THRESHOLD,
+            maxsize=ANSWER_CACHE_SIZE,
+            ttl=ANSWER_CACHE_TTL,
+        ) if ANSWER_CACHE_ENABLED else None
+        self.cypher_cache = CypherPlanCache(maxsize=CYPHER_CACHE_SIZE) if CYPHER_CACHE_ENABLED else None
+        self._graph_version = None
+        self._graph_version_checked_at = 0.0
+
+    def _sync_graph_version(self) -> None:
+        """
+        定期檢查圖譜版本，圖譜重建後清空回答快取與 Cypher 樣板快取，並更新 schema。
+        """
+        now = time.monotonic()
+        if now - self._graph_version_checked_at < GRAPH_VERSION_CHECK_SECONDS:
+            return
+        self._graph_version_checked_at = now
+        try:
+            version = self.graph.graph_version()
+        except Exception as e:
+            print(f"[AIService] 讀取圖譜版本失敗：{e}")
+            return
+        if self.answer_cache is not None:
+            self.answer_cache.sync_version(version)
+        if self._graph_version not in (None, version):
+            if self.cypher_cache is not None:
+                self.cypher_cache.clear()
+            # 圖譜重建後重新讀取 schema，讓產生 Cypher 的提示與實際圖譜一致
+            self.graph.refresh_schema()
+            self.chain.graph_schema = self.graph.get_schema
+        self._graph_version = version
+
+    def _literals(self, question: str):
+        """問題中的常值：引號與數字，加上 Cypher 樣板辨識出的參數（食材、菜系等）"""
+        extra = self.cypher_cache.literals(question) if self.cypher_cache is not None else []
+        return extract_literals(question, extra)
+
+    def _lookup_answer(self, question: str):
+        """
+        查詢語意回答快取，回傳 (問題向量, 快取的回答)；快取停用或產生向量失敗時回傳 (None, None)。
+        向量相近但常值不同的問題不算命中。
+        """
+        self._sync_graph_version()
+        if self.answer_cache is None:
+            return None, None
+        try:
+            vector = get_embedding_service().embed_query(question)
+        except Exception as e:
+            print(f"[AIService] 產生問題向量失敗，略過回答快取：{e}")
+            return None, None
+        return vector, self.answer_cache.lookup(vector, self._literals(question))
+
+    def _store_answer(self, question: str, vector, answer: str) -> None:
+        if self.answer_cache is not None and vector is not None:
+            # 回答後才存入：此時 Cypher 樣板可能剛學會這個問題的形狀，能辨識出更多常值
+            self.answer_cache.store(question, vector, answer, self._literals(question))
 
     def query_graph(self, question: str) -> Any:
         """
         接收使用者問題，執行 GraphCypherQAChain 並回傳結果
         """
         try:
-            return self.chain.run(question)
+            vector, cached = self._lookup_answer(question)
+            if cached is not None:
+                return cached
+            answer = self.chain.run(question)
+            self._store_answer(question, vector, answer)
+            return answer
         except Exception as e:
             # 記錄錯誤並回傳可讀訊息
             print(f"[AIService] 查詢發生錯誤：{e}")
-            return "抱歉，查詢時發生錯誤，請稍後再試。"
+            return ERROR_MESSAGE
+
+    async def _allm(self, chain, inputs: Dict[str, Any]) -> str:
+        """
+        以非同步方式呼叫 LLMChain；等待名額的時間同樣計入 deadline。
+        """
+        async with self._llm_slots:
+            result = await chain.ainvoke(inputs)
+        return result[chain.output_key]
+
+    async def _agraph_query(self, cypher: str, params: Optional[dict], deadline_at: Optional[float]):
+        """
+        在 thread 中執行圖譜查詢。thread 無法被取消，因此以剩餘的時間預算作為 statement_timeout，
+        逾時後資料庫會中止查詢，連線也會歸還連線池。
+        """
+        timeout = None if deadline_at is None else max(deadline_at - asyncio.get_running_loop().time(), 0.001)
+        return await asyncio.to_thread(self.graph.query, cypher, params or {}, timeout)
+
+    async def _arun_chain(self, question: str, deadline_at: Optional[float] = None) -> str:
+        """
+        與 GraphCypherQAChain._call 相同的流程（產生 Cypher → 查詢圖譜 → 組織回答），
+        但 LLM 呼叫走原生 async，逾時取消時會一併中斷對 Gemini 的請求；
+        deadline_at（event loop 時間）之後仍在執行的圖譜查詢由資料庫中止。
+        """
+        chain = self.chain
+        context = None
+
+        # 1. 問題形狀已知：代入參數後直接查詢圖譜，省下產生 Cypher 的 LLM 呼叫
+        plan = self.cypher_cache.match(question) if self.cypher_cache is not None else None
+        if plan is not None:
+            template, cypher, params = plan
+            try:
+                # 圖譜查詢是同步的資料庫呼叫，放到 thread 中執行
+                context = (await self._agraph_query(cypher, params, deadline_at))[: chain.top_k]
+            except Exception as e:
+                print(f"[AIService] Cypher 樣板執行失敗，改由 LLM 產生：{e}")
+            # 查無資料時可能是形狀判斷錯誤，交回 LLM 重新產生
+            if not context:
+                context = None
+            self.cypher_cache.record(template, validated=context is not None)
+
+        # 2. 未知的形狀：請 LLM 產生 Cypher，執行成功且有結果才學成樣板
+        if context is None:
+            generated = await self._allm(
+                chain.cypher_generation_chain,
+                {"question": question, "schema": chain.graph_schema},
+            )
+            cypher = extract_cypher(generated)
+            context = (await self._agraph_query(cypher, None, deadline_at))[: chain.top_k] if cypher else []
+            if context and self.cypher_cache is not None:
+                self.cypher_cache.learn(question, cypher)
+
+        return await self._allm(chain.qa_chain, {"question": question, "context": context})
+
+    async def _aanswer(self, question: str, deadline_at: Optional[float] = None) -> str:
+        """
+        先查語意回答快取，沒命中才執行完整的 chain，並把結果寫回快取。
+        """
+        vector, cached = await asyncio.to_thread(self._lookup_answer, question)
+        if cached is not None:
+            return cached
+        answer = await self._arun_chain(question, deadline_at)
+        self._store_answer(question, vector, answer)
+        return answer
+
+    async def aquery(self, question: str, deadline: Optional[float] = None) -> str:
+        """
+        非同步版本的 query_graph。超過 deadline（秒）會取消仍在進行的工作並回傳提示訊息，
+        確保呼叫端一定能在時間內得到回覆；呼叫端給的 deadline 只能縮短、不能超過 AI_DEADLINE_SECONDS。
+        """
+        timeout = self.deadline if deadline is None else min(self.deadline, deadline)
+        if timeout <= 0:
+            return TIMEOUT_MESSAGE
+        try:
+            deadline_at = asyncio.get_running_loop().time() + timeout
+            return await asyncio.wait_for(self._aanswer(question, deadline_at), timeout=timeout)
+        except asyncio.TimeoutError:
+            print(f"[AIService] 超過 {timeout:.1f} 秒仍未完成，已取消：{question}")
+            return TIMEOUT_MESSAGE
+        except Exception as e:
+            print(f"[AIService] 查詢發生錯誤：{e}")
+            return ERROR_MESSAGE
+
+    async def chat(self, text: str, deadline: Optional[float] = None) -> str:
+        """
+        LINE Bot 使用的對話入口。
+        """
+        return await self.aquery(text, deadline=deadline)
 
 __all__ = ["CustomAgeGraph", "AIService"]
 
@@ -0,0 +1,134 @@
+# 檔案位置: app/services/answer_cache.py
+
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Dict, FrozenSet, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+# 問題中以引號標出的字串，以及數字（阿拉伯數字或中文數字），例如「列出三道」、「30 分鐘內」
+_QUOTED = re.compile(r"[「『\"']([^」』\"']+)[」』\"']")
+_NUMBER = re.compile(r"\d+|[零一二兩三四五六七八九十百千]+")
+
+
+def extract_literals(question: str, extra: Iterable[str] = ()) -> FrozenSet[str]:
+    """
+    取出問題中的常值。向量相近的問題若常值不同（「牛肉」與「豬肉」、「三道」與「五道」），
+    回答也不同，不可共用快取；extra 為呼叫端另外辨識出的常值（例如 Cypher 樣板的參數）。
+    """
+    question = unicodedata.normalize("NFKC", question)
+    literals = {m.group(1).strip() for m in _QUOTED.finditer(question)}
+    literals.update(m.group(0) for m in _NUMBER.finditer(question))
+    literals.update(v.strip() for v in extra)
+    return frozenset(v for v in literals if v)
+
+
+class SemanticAnswerCache:
+    """
+    以問題向量為鍵的回答快取。
+
+    新問題與任一快取問題的 cosine 相似度達到 threshold，且兩者的常值（extract_literals）完全相同時，
+    直接回傳快取的回答，省下「產生 Cypher + 組織回答」兩次 LLM 呼叫與一次圖譜查詢。
+    容量滿時淘汰最久未使用的項目，超過 ttl 秒的項目視為過期；
+    圖譜重建後（version 改變）整個快取失效。
+    """
+    def __init__(self, threshold: float = 0.98, maxsize: int = 512, ttl: float = 3600):
+        self.threshold = threshold
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.version: Optional[int] = None
+        # key -> (單位向量, 原始問題, 回答, 建立時間, 常值)
+        self._entries: "OrderedDict[int, Tuple[np.ndarray, str, str, float, FrozenSet[str]]]" = OrderedDict()
+        self._next_key = 0
+        self._matrix: Optional[np.ndarray] = None
+        self._keys: List[int] = []
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def _unit(vector) -> Optional[np.ndarray]:
+        arr = np.asarray(vector, dtype=np.float32)
+        norm = float(np.linalg.norm(arr))
+        return arr / norm if norm else None
+
+    def _evict_expired(self, now: float) -> None:
+        expired = [k for k, (_, _, _, created, _) in self._entries.items() if now - created > self.ttl]
+        for k in expired:
+            del self._entries[k]
+        if expired:
+            self._matrix = None
+
+    def _ensure_matrix(self) -> None:
+        # 快取項目不多（數百筆），變動時重新堆疊成矩陣，查詢時一次算完所有相似度
+        if self._matrix is None and self._entries:
+            self._keys = list(self._entries.keys())
+            self._matrix = np.stack([self._entries[k][0] for k in self._keys])
+
+    def lookup(self, vector, literals: FrozenSet[str] = frozenset()) -> Optional[str]:
+        unit = self._unit(vector)
+        with self._lock:
+            self._evict_expired(time.monotonic())
+            if unit is None or not self._entries:
+                self.misses += 1
+                return None
+            self._ensure_matrix()
+            scores = self._matrix @ unit
+            # 由相似度高到低，取第一個常值也相同的項目
+            candidates = np.flatnonzero(scores >= self.threshold)
+            for i in candidates[np.argsort(-scores[candidates])]:
+                key = self._keys[int(i)]
+                if self._entries[key][4] == literals:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return self._entries[key][2]
+            self.misses += 1
+            return None
+
+    def store(self, question: str, vector, answer: str, literals: FrozenSet[str] = frozenset()) -> None:
+        unit = self._unit(vector)
+        if unit is None:
+            return
+        with self._lock:
+            self._entries[self._next_key] = (unit, question, answer, time.monotonic(), literals)
+            self._next_key += 1
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+            self._matrix = None
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._matrix = None
+            self.invalidations += 1
+
+    def sync_version(self, version: Optional[int]) -> None:
+        """
+        圖譜版本改變（scripts/graph_builder.py 重建過圖譜）時清空快取。
+        """
+        if version != self.version:
+            if self.version is not None:
+                self.clear()
+            self.version = version
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+                "threshold": self.threshold,
+                "graph_version": self.version,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "invalidations": self.invalidations,
+            }
+
+
+__all__ = ["SemanticAnswerCache", "extract_literals"]
@@ -0,0 +1,213 @@
+# 檔案位置: app/services/cypher_cache.py
+
+import re
+import threading
+import unicodedata
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+# Cypher 中的字串常值（單引號或雙引號）
+_STRING_LITERAL = re.compile(r"'((?:[^'\\]|\\.)*)'|\"((?:[^\"\\]|\\.)*)\"")
+# LIMIT 後面的數字，例如「列出 3 道菜」產生的 LIMIT 3
+_LIMIT_LITERAL = re.compile(r"\bLIMIT\s+(\d+)\b", re.IGNORECASE)
+# 被擷取的參數值不應包含這些分隔字，否則多半是「A 和 B」這類不同形狀的問題
+_SEPARATORS = re.compile(r"[\s,，、;；和與及跟或]")
+
+
+def normalize_question(question: str) -> str:
+    return unicodedata.normalize("NFKC", question).strip()
+
+
+@dataclass
+class CypherTemplate:
+    """
+    一個可重複使用的問題形狀與其 Cypher 樣板。
+
+    shape 例如「哪些食譜用到{p0}?」，cypher 例如
+    「MATCH (r:Recipe)-[:HAS_INGREDIENT]->(i:Ingredient {name: $p0}) RETURN r.name」。
+    """
+    shape: str
+    pattern: "re.Pattern[str]"
+    cypher: str
+    kinds: List[str]  # 每個參數的型別："str" 或 "int"
+    hits: int = field(default=0)
+
+    def bind(self, values: List[str]) -> Tuple[str, Dict[str, Any]]:
+        """
+        代入新的參數值：字串走 Cypher 參數 ($p0)，整數（LIMIT）轉型後直接寫入樣板。
+        """
+        cypher = self.cypher
+        params: Dict[str, Any] = {}
+        for i, (kind, value) in enumerate(zip(self.kinds, values)):
+            name = f"p{i}"
+            if kind == "int":
+                cypher = re.sub(rf"\${name}\b", str(int(value)), cypher)
+            else:
+                params[name] = value
+        return cypher, params
+
+
+class CypherPlanCache:
+    """
+    Cypher 產生結果的樣板快取。
+
+    LLM 為某個問題產生並驗證過的 Cypher，會把其中同時出現在問題裡的常值
+    （食材、菜系、設備名稱或數量）換成參數，得到一個「問題形狀」。
+    之後形狀相同的問題只要代入新參數即可，不必再呼叫 LLM 產生 Cypher。
+    """
+    def __init__(self, maxsize: int = 256, min_literal_chars: int = 2):
+        self.maxsize = maxsize
+        self.min_literal_chars = min_literal_chars
+        self._templates: "OrderedDict[str, CypherTemplate]" = OrderedDict()
+        # clear() 會在背景執行緒（圖版本檢查）中呼叫，走訪與修改 OrderedDict 都要持有鎖
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.learned = 0
+        self.rejected = 0
+
+    def match(self, question: str) -> Optional[Tuple[CypherTemplate, str, Dict[str, Any]]]:
+        """
+        找出符合問題形狀的樣板，回傳 (樣板, 代入後的 Cypher, 參數)。
+        """
+        question = normalize_question(question)
+        with self._lock:
+            templates = list(reversed(self._templates.items()))
+        for shape, template in templates:
+            m = template.pattern.fullmatch(question)
+            if not m:
+                continue
+            values = list(m.groups())
+            if any(kind == "str" and _SEPARATORS.search(v) for kind, v in zip(template.kinds, values)):
+                continue
+            with self._lock:
+                if shape in self._templates:
+                    self._templates.move_to_end(shape)
+            cypher, params = template.bind(values)
+            return template, cypher, params
+        return None
+
+    def literals(self, question: str) -> List[str]:
+        """
+        問題符合已知形狀時，回傳代入的參數值（食材、菜系等）；不改變 LRU 順序。
+        """
+        question = normalize_question(question)
+        with self._lock:
+            templates = list(reversed(self._templates.values()))
+        for template in templates:
+            m = template.pattern.fullmatch(question)
+            if m:
+                return list(m.groups())
+        return []
+
+    def record(self, template: Optional[CypherTemplate], validated: bool) -> None:
+        """
+        記錄樣板的使用結果；代入參數後查無資料的樣板視為不適用，交回 LLM 處理。
+        """
+        if template is not None and validated:
+            template.hits += 1
+            self.hits += 1
+        else:
+            self.misses += 1
+
+    def learn(self, question: str, cypher: str) -> Optional[CypherTemplate]:
+        """
+        從 LLM 產生且執行成功的 Cypher 推導出問題形狀並存入快取。
+        """
+        question = normalize_question(question)
+        # (值, 型別) -> 在 Cypher 中出現的所有 span；同一個值可能出現不只一次
+        spans: Dict[Tuple[str, str], List[Tuple[int, int]]] = {}
+        for m in _STRING_LITERAL.finditer(cypher):
+            value = m.group(1) if m.group(1) is not None else m.group(2)
+            if value:
+                spans.setdefault((value, "str"), []).append(m.span())
+        for m in _LIMIT_LITERAL.finditer(cypher):
+            spans.setdefault((m.group(1), "int"), []).append(m.span(1))
+        # (在問題中的位置, 值, 型別)
+        found: List[Tuple[int, str, str]] = []
+        for value, kind in spans:
+            pos = question.find(value)
+            if pos >= 0:
+                found.append((pos, value, kind))
+
+        # 依問題中的位置排序，並略過彼此重疊的值
+        found.sort(key=lambda f: (f[0], -len(f[1])))
+        params: List[Tuple[int, str, str]] = []
+        end = -1
+        for item in found:
+            if item[0] >= end:
+                params.append(item)
+                end = item[0] + len(item[1])
+
+        shape_parts, regex_parts, kinds = [], [], []
+        cursor = 0
+        for i, (pos, value, kind) in enumerate(params):
+            shape_parts.append(question[cursor:pos])
+            regex_parts.append(re.escape(question[cursor:pos]))
+            shape_parts.append(f"{{p{i}}}")
+            regex_parts.append(r"(\d+)" if kind == "int" else r"(.+?)")
+            kinds.append(kind)
+            cursor = pos + len(value)
+        shape_parts.append(question[cursor:])
+        regex_parts.append(re.escape(question[cursor:]))
+
+        literal = "".join(p for p in shape_parts if not re.fullmatch(r"\{p\d+\}", p))
+        if len(re.sub(r"\W", "", literal)) < self.min_literal_chars:
+            # 幾乎整句都是參數（例如只輸入「牛肉」），形狀太籠統，不快取
+            self.rejected += 1
+            return None
+
+        # 每個參數值在 Cypher 中的所有出現位置都要換掉；由後往前替換，避免前面的替換改變後面的 span
+        replacements = sorted(
+            ((start, stop, i) for i, (_, value, kind) in enumerate(params) for start, stop in spans[(value, kind)]),
+            reverse=True,
+        )
+        template_cypher = cypher
+        for start, stop, i in replacements:
+            template_cypher = template_cypher[:start] + f"$p{i}" + template_cypher[stop:]
+        # 參數值仍以其他形式留在 Cypher 中（例如寫在 CONTAINS 或屬性名稱裡），代入新值後會查錯，不快取
+        remaining = re.sub(r"\$p\d+\b", "", template_cypher)
+        if any(value in remaining for _, value, _ in params):
+            self.rejected += 1
+            return None
+
+        shape = "".join(shape_parts)
+        template = CypherTemplate(
+            shape=shape,
+            pattern=re.compile("".join(regex_parts)),
+            cypher=template_cypher,
+            kinds=kinds,
+        )
+        with self._lock:
+            self._templates[shape] = template
+            self._templates.move_to_end(shape)
+            while len(self._templates) > self.maxsize:
+                self._templates.popitem(last=False)
+        self.learned += 1
+        return template
+
+    def clear(self) -> None:
+        with self._lock:
+            self._templates.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            templates = list(self._templates.values())
+        total = self.hits + self.misses
+        return {
+            "templates": len(templates),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "learned": self.learned,
+            "rejected": self.rejected,
+            "top_shapes": [
+                {"shape": t.shape, "hits": t.hits}
+                for t in sorted(templates, key=lambda t: -t.hits)[:10]
+            ],
+        }
+
+
+__all__ = ["CypherPlanCache", "CypherTemplate", "normalize_question"]
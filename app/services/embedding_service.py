@@ -0,0 +1,242 @@
+# 檔案位置: app/services/embedding_service.py
+
+import hashlib
+import os
+import threading
+import unicodedata
+from typing import Any, Dict, List, Optional
+
+from cachetools import TTLCache
+from dotenv import load_dotenv
+from langchain_google_genai import GoogleGenerativeAIEmbeddings
+from sqlalchemy import text
+
+from app.db.session import engine
+
+load_dotenv()
+
+# 可由環境變數調整的快取參數
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "models/embedding-001")
+EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", "2048"))
+EMBEDDING_CACHE_TTL = int(os.getenv("EMBEDDING_CACHE_TTL", "3600"))  # 秒
+# 設為 "postgres" 時啟用第二層（持久化）快取，重新啟動後仍保有熱門查詢
+EMBEDDING_CACHE_PERSIST = os.getenv("EMBEDDING_CACHE_PERSIST", "").lower()
+EMBEDDING_CACHE_PERSIST_TTL_DAYS = int(os.getenv("EMBEDDING_CACHE_PERSIST_TTL_DAYS", "30"))
+
+
+def normalize_query(query: str) -> str:
+    """
+    將查詢字串正規化，讓「全形/半形」、大小寫與多餘空白不同的查詢共用同一個快取項目。
+    """
+    query = unicodedata.normalize("NFKC", query)
+    return " ".join(query.casefold().split())
+
+
+class PostgresEmbeddingStore:
+    """
+    第二層快取：把查詢向量存進 Postgres，讓服務重啟後仍能直接命中。
+    """
+    def __init__(self, bind=engine, ttl_days: int = EMBEDDING_CACHE_PERSIST_TTL_DAYS):
+        self.bind = bind
+        self.ttl_days = ttl_days
+        self._ready = False
+
+    def _ensure_table(self) -> None:
+        if self._ready:
+            return
+        with self.bind.begin() as conn:
+            conn.execute(text("""
+                CREATE TABLE IF NOT EXISTS query_embedding_cache (
+                    cache_key  TEXT PRIMARY KEY,
+                    model      TEXT NOT NULL,
+                    query      TEXT NOT NULL,
+                    embedding  REAL[] NOT NULL,
+                    created_at TIMESTAMP WITH TIME ZONE DEFAULT now()
+                )
+            """))
+        self._ready = True
+
+    def get(self, key: str) -> Optional[List[float]]:
+        self._ensure_table()
+        with self.bind.connect() as conn:
+            row = conn.execute(
+                text("""
+                    SELECT embedding FROM query_embedding_cache
+                    WHERE cache_key = :key
+                      AND created_at > now() - make_interval(days => :ttl_days)
+                """),
+                {"key": key, "ttl_days": self.ttl_days},
+            ).first()
+        return list(row.embedding) if row else None
+
+    def set(self, key: str, model: str, query: str, vector: List[float]) -> None:
+        self._ensure_table()
+        with self.bind.begin() as conn:
+            conn.execute(
+                text("""
+                    INSERT INTO query_embedding_cache (cache_key, model, query, embedding)
+                    VALUES (:key, :model, :query, :embedding)
+                    ON CONFLICT (cache_key) DO UPDATE
+                    SET embedding = EXCLUDED.embedding, created_at = now()
+                """),
+                {"key": key, "model": model, "query": query, "embedding": vector},
+            )
+
+
+class EmbeddingService:
+    """
+    全行程共用的查詢向量產生器。
+
+    第一層是記憶體內的 LRU + TTL 快取，第二層（可選）是 Postgres；
+    只有兩層都沒命中時才會呼叫 Gemini Embedding API。
+    """
+    def __init__(
+        self,
+        model: str = EMBEDDING_MODEL,
+        maxsize: int = EMBEDDING_CACHE_SIZE,
+        ttl: int = EMBEDDING_CACHE_TTL,
+        store: Optional[PostgresEmbeddingStore] = None,
+    ):
+        self.model = model
+        self.store = store
+        self._cache: TTLCache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._lock = threading.Lock()
+        self._client: Optional[GoogleGenerativeAIEmbeddings] = None
+        self.hits = 0
+        self.persistent_hits = 0
+        self.misses = 0
+
+    @property
+    def client(self) -> GoogleGenerativeAIEmbeddings:
+        # 延遲建立 client：快取命中時完全不需要 API 金鑰或網路
+        if self._client is None:
+            api_key = os.getenv("GOOGLE_API_KEY")
+            if not api_key:
+                raise RuntimeError("GOOGLE_API_KEY 未設定")
+            self._client = GoogleGenerativeAIEmbeddings(model=self.model, google_api_key=api_key)
+        return self._client
+
+    def cache_key(self, normalized: str) -> str:
+        return hashlib.sha1(f"{self.model}\n{normalized}".encode("utf-8")).hexdigest()
+
+    def embed_query(self, query: str) -> List[float]:
+        """
+        取得查詢向量；依序查詢記憶體快取、持久化快取，最後才呼叫遠端 API。
+        """
+        normalized = normalize_query(query)
+        key = self.cache_key(normalized)
+
+        with self._lock:
+            vector = self._cache.get(key)
+            if vector is not None:
+                self.hits += 1
+                return vector
+
+        if self.store is not None:
+            try:
+                vector = self.store.get(key)
+            except Exception as e:
+                # 第二層快取故障時不影響搜尋，只是退回呼叫 API
+                print(f"[EmbeddingService] 讀取持久化快取失敗：{e}")
+                vector = None
+            if vector is not None:
+                with self._lock:
+                    self._cache[key] = vector
+                    self.persistent_hits += 1
+                return vector
+
+        vector = list(self.client.embed_query(normalized))
+        with self._lock:
+            self._cache[key] = vector
+            self.misses += 1
+
+        if self.store is not None:
+            try:
+                self.store.set(key, self.model, normalized, vector)
+            except Exception as e:
+                print(f"[EmbeddingService] 寫入持久化快取失敗：{e}")
+        return vector
+
+    def embed_queries(self, queries: List[str]) -> List[List[float]]:
+        """
+        一次取得多個查詢向量（順序與輸入相同）。快取沒命中的查詢合併成一次 embed_documents 呼叫，
+        task_type 指定為 RETRIEVAL_QUERY，與 embed_query 產生的向量在同一個空間。
+        """
+        normalized = [normalize_query(q) for q in queries]
+        keys = [self.cache_key(n) for n in normalized]
+        vectors: Dict[str, List[float]] = {}
+        with self._lock:
+            for key in dict.fromkeys(keys):
+                vector = self._cache.get(key)
+                if vector is not None:
+                    vectors[key] = vector
+                    self.hits += 1
+
+        missing = {key: n for key, n in zip(keys, normalized) if key not in vectors}
+        if missing and self.store is not None:
+            for key in list(missing):
+                try:
+                    vector = self.store.get(key)
+                except Exception as e:
+                    print(f"[EmbeddingService] 讀取持久化快取失敗：{e}")
+                    break
+                if vector is not None:
+                    vectors[key] = vector
+                    del missing[key]
+                    with self._lock:
+                        self._cache[key] = vector
+                        self.persistent_hits += 1
+
+        if missing:
+            embedded = self.client.embed_documents(list(missing.values()), task_type="RETRIEVAL_QUERY")
+            with self._lock:
+                for key, vector in zip(missing, embedded):
+                    vectors[key] = self._cache[key] = list(vector)
+                    self.misses += 1
+            if self.store is not None:
+                for key, query in missing.items():
+                    try:
+                        self.store.set(key, self.model, query, vectors[key])
+                    except Exception as e:
+                        print(f"[EmbeddingService] 寫入持久化快取失敗：{e}")
+                        break
+        return [vectors[key] for key in keys]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._cache.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self.hits + self.persistent_hits + self.misses
+            return {
+                "model": self.model,
+                "size": len(self._cache),
+                "maxsize": self._cache.maxsize,
+                "ttl": self._cache.ttl,
+                "hits": self.hits,
+                "persistent_hits": self.persistent_hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits + self.persistent_hits) / total if total else 0.0,
+                "persistent": self.store is not None,
+            }
+
+
+_embedding_service: Optional[EmbeddingService] = None
+_embedding_service_lock = threading.Lock()
+
+
+def get_embedding_service() -> EmbeddingService:
+    """
+    取得全行程共用的 EmbeddingService（第一次呼叫時才建立）。
+    """
+    global _embedding_service
+    if _embedding_service is None:
+        with _embedding_service_lock:
+            if _embedding_service is None:
+                store = PostgresEmbeddingStore() if EMBEDDING_CACHE_PERSIST == "postgres" else None
+                _embedding_service = EmbeddingService(store=store)
+    return _embedding_service
+
+
+__all__ = ["EmbeddingService", "PostgresEmbeddingStore", "get_embedding_service", "normalize_query"]
@@ -0,0 +1,308 @@
+# 檔案位置: app/services/hybrid_search.py
+
+import os
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.services.embedding_service import normalize_query
+
+# reciprocal-rank fusion 的平滑常數：分數為 Σ 1 / (k + 名次)，k 越大，前幾名與後面的差距越小
+HYBRID_RRF_K = int(os.getenv("HYBRID_RRF_K", "60"))
+# 關鍵字與向量各取多少筆候選結果參與融合
+HYBRID_CANDIDATES = int(os.getenv("HYBRID_CANDIDATES", "50"))
+# 第一名的菜名相似度達到此值（或菜名完全相同）時，視為關鍵字已足夠確定，不再呼叫 embedding
+LEXICAL_CONFIDENT_SIMILARITY = float(os.getenv("LEXICAL_CONFIDENT_SIMILARITY", "0.8"))
+# 有篩選條件時，HNSW 的 ORDER BY ... LIMIT 會先取出最近的 ef_search 筆再套用條件，結果可能少於 limit：
+# 先不帶條件多取 limit × VECTOR_FILTER_OVERFETCH 筆最近的食譜，再套用條件
+VECTOR_FILTER_OVERFETCH = int(os.getenv("VECTOR_FILTER_OVERFETCH", "10"))
+# pgvector 0.8 以上可設為 relaxed_order 或 strict_order，改用 hnsw.iterative_scan 持續掃描到湊滿 limit，
+# 不再需要多取；postgres-docker 使用的 pgvector 0.7.3 沒有這個參數，因此預設不啟用
+VECTOR_ITERATIVE_SCAN = os.getenv("VECTOR_ITERATIVE_SCAN")
+
+# 關鍵字比對：菜名的 trigram 相似度，或菜名 + 核心食材中包含查詢字串
+# （兩個條件分別對應 migrations/0004 的 idx_recipes_name_trgm 與 idx_recipes_search_text_trgm）
+_LEXICAL_MATCH = "(lower(name) % :q OR recipe_search_text(name, core_ingredients) LIKE :pattern)"
+_LEXICAL_SCORE = "greatest(similarity(lower(name), :q), word_similarity(:q, recipe_search_text(name, core_ingredients)))"
+_LEXICAL_ORDER = f"(lower(name) = :q) DESC, {_LEXICAL_SCORE} DESC, id"
+
+
+def build_filters(
+    max_total_time: Optional[int] = None,
+    difficulty: Optional[int] = None,
+    cuisine_style: Optional[str] = None,
+    ingredients: Optional[List[str]] = None,
+) -> Tuple[str, Dict[str, Any]]:
+    """
+    把結構化條件轉成 SQL 條件與參數。
+    條件同時套用在關鍵字與向量兩個候選查詢中，排名前就先篩掉不符合的食譜。
+    """
+    conditions, params = [], {}
+    if max_total_time is not None:
+        conditions.append("total_time <= :max_total_time")
+        params["max_total_time"] = max_total_time
+    if difficulty is not None:
+        conditions.append("difficulty = :difficulty")
+        params["difficulty"] = difficulty
+    if cuisine_style:
+        conditions.append("cuisine_style = :cuisine_style")
+        params["cuisine_style"] = cuisine_style
+    if ingredients:
+        # 必須包含的食材：core_ingredients 需包含全部項目
+        conditions.append("core_ingredients @> CAST(:ingredients AS text[])")
+        params["ingredients"] = list(ingredients)
+    return (" AND ".join(conditions) or "TRUE"), params
+
+
+def _like_pattern(query: str) -> str:
+    # LIKE 預設以反斜線跳脫，查詢中的 % 與 _ 視為一般字元
+    escaped = query.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return f"%{escaped}%"
+
+
+class HybridSearchStats:
+    """記錄各種搜尋路徑的次數，觀察有多少查詢省下了 embedding 呼叫"""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counts = {"vector": 0, "lexical": 0, "hybrid_lexical_only": 0, "hybrid_fused": 0}
+
+    def add(self, key: str) -> None:
+        with self._lock:
+            self.counts[key] += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            counts = dict(self.counts)
+        hybrid = counts["hybrid_lexical_only"] + counts["hybrid_fused"]
+        counts["embedding_skipped_rate"] = counts["hybrid_lexical_only"] / hybrid if hybrid else 0.0
+        return counts
+
+
+stats = HybridSearchStats()
+
+
+def _nearest_sql(where: str, limit_param: str) -> str:
+    """
+    依距離排序的 (id, distance) 子查詢，最多 :{limit_param} 筆且符合篩選條件。
+    有篩選條件且未啟用 iterative scan 時，先在 ANN 索引上多取 :overfetch 筆，再於外層套用條件。
+    """
+    if where == "TRUE" or VECTOR_ITERATIVE_SCAN:
+        return f"""
+            SELECT id, embedding <#> CAST(:q_vec AS vector) AS distance
+            FROM recipes
+            WHERE embedding IS NOT NULL AND {where}
+            ORDER BY distance
+            LIMIT :{limit_param}"""
+    return f"""
+            SELECT n.id, n.distance
+            FROM (
+                SELECT id, embedding <#> CAST(:q_vec AS vector) AS distance
+                FROM recipes
+                WHERE embedding IS NOT NULL
+                ORDER BY distance
+                LIMIT :overfetch
+            ) AS n
+            JOIN recipes ON recipes.id = n.id
+            WHERE {where}
+            ORDER BY n.distance
+            LIMIT :{limit_param}"""
+
+
+async def _prepare_filtered_scan(db: AsyncSession, where: str, limit: int) -> Dict[str, Any]:
+    """
+    有篩選條件時調整本次交易的 ANN 設定，回傳 _nearest_sql 需要的額外參數。
+    HNSW 最多只回傳 ef_search 筆，多取時 ef_search 也要至少這麼大。
+    """
+    if where == "TRUE":
+        return {}
+    if VECTOR_ITERATIVE_SCAN:
+        await db.execute(text("SELECT set_config('hnsw.iterative_scan', :v, true)"), {"v": VECTOR_ITERATIVE_SCAN})
+        return {}
+    # hnsw.ef_search 的上限為 1000
+    overfetch = min(limit * VECTOR_FILTER_OVERFETCH, 1000)
+    await db.execute(
+        text("SELECT set_config('hnsw.ef_search', "
+             "greatest(current_setting('hnsw.ef_search', true)::int, :v)::text, true)"),
+        {"v": overfetch},
+    )
+    return {"overfetch": overfetch}
+
+
+async def lexical_search(
+    db: AsyncSession, query: str, limit: int, filters: Tuple[str, Dict[str, Any]],
+) -> Tuple[List[Any], bool]:
+    """
+    只用 trigram 索引做關鍵字比對，回傳 (結果, 是否足夠確定)。
+    第一名的菜名與查詢完全相同，或相似度達 LEXICAL_CONFIDENT_SIMILARITY 時視為確定。
+    """
+    q = normalize_query(query)
+    where, params = filters
+    stmt = text(f"""
+        SELECT id, name, image_url,
+               NULL::float8 AS distance,
+               {_LEXICAL_SCORE} AS score,
+               lower(name) = :q AS exact,
+               similarity(lower(name), :q) AS name_similarity
+        FROM recipes
+        WHERE {_LEXICAL_MATCH} AND {where}
+        ORDER BY {_LEXICAL_ORDER}
+        LIMIT :limit
+    """)
+    rows = (await db.execute(stmt, {**params, "q": q, "pattern": _like_pattern(q), "limit": limit})).fetchall()
+    confident = bool(rows) and (rows[0].exact or rows[0].name_similarity >= LEXICAL_CONFIDENT_SIMILARITY)
+    return rows, confident
+
+
+async def vector_search(
+    db: AsyncSession, q_vec: List[float], limit: int, filters: Tuple[str, Dict[str, Any]],
+) -> List[Any]:
+    """純向量搜尋（負內積，走 HNSW / IVFFlat 索引），篩選條件一併下推到 SQL"""
+    where, params = filters
+    extra = await _prepare_filtered_scan(db, where, limit)
+    stmt = text(f"""
+        SELECT r.id, r.name, r.image_url, v.distance, NULL::float8 AS score
+        FROM ({_nearest_sql(where, "limit")}
+        ) AS v
+        JOIN recipes r ON r.id = v.id
+        ORDER BY v.distance
+    """)
+    return (await db.execute(stmt, {**params, **extra, "q_vec": q_vec, "limit": limit})).fetchall()
+
+
+async def batch_vector_search(
+    db: AsyncSession, q_vecs: List[List[float]], limits: List[int],
+) -> List[List[Any]]:
+    """
+    多個查詢向量在同一個 SQL 中完成：以 unnest 把向量與各自的筆數上限展開，
+    再以 LATERAL 子查詢對每個向量各做一次 ORDER BY embedding <#> q LIMIT n（每次都能走 HNSW / IVFFlat 索引）。
+    向量以文字格式傳入，避免 driver 把巢狀 list 當成多維陣列。
+    """
+    stmt = text("""
+        SELECT q.ord, r.id, r.name, r.image_url, r.distance, NULL::float8 AS score
+        FROM (
+            SELECT CAST(vec AS vector) AS vec, lim, ord
+            FROM unnest(CAST(:q_vecs AS text[]), CAST(:limits AS int[])) WITH ORDINALITY AS t(vec, lim, ord)
+        ) AS q
+        CROSS JOIN LATERAL (
+            SELECT id, name, image_url, embedding <#> q.vec AS distance
+            FROM recipes
+            WHERE embedding IS NOT NULL
+            ORDER BY embedding <#> q.vec
+            LIMIT q.lim
+        ) AS r
+        ORDER BY q.ord, r.distance
+    """)
+    params = {
+        "q_vecs": ["[" + ",".join(repr(float(v)) for v in vec) + "]" for vec in q_vecs],
+        "limits": list(limits),
+    }
+    results: List[List[Any]] = [[] for _ in q_vecs]
+    for row in (await db.execute(stmt, params)).fetchall():
+        results[row.ord - 1].append(row)
+    return results
+
+
+async def hydrate_hits(
+    db: AsyncSession, groups: List[List[Tuple[int, float]]],
+) -> List[List[Any]]:
+    """
+    記憶體索引只負責算出 [(id, 距離)]，名稱與圖片一律以主鍵從 recipes 讀出目前的值：
+    編輯過的食譜不會顯示舊名稱，已刪除的食譜也會在這裡被排除。多組結果在同一個 SQL 中完成。
+    """
+    flat = [(g, rid, distance) for g, hits in enumerate(groups) for rid, distance in hits]
+    results: List[List[Any]] = [[] for _ in groups]
+    if not flat:
+        return results
+    stmt = text("""
+        SELECT c.grp, r.id, r.name, r.image_url, c.distance, NULL::float8 AS score
+        FROM unnest(CAST(:groups AS int[]), CAST(:ids AS int[]), CAST(:distances AS float8[]))
+             WITH ORDINALITY AS c(grp, id, distance, ord)
+        JOIN recipes r ON r.id = c.id
+        ORDER BY c.ord
+    """)
+    params = {
+        "groups": [g for g, _, _ in flat],
+        "ids": [rid for _, rid, _ in flat],
+        "distances": [distance for _, _, distance in flat],
+    }
+    for row in (await db.execute(stmt, params)).fetchall():
+        results[row.grp].append(row)
+    return results
+
+
+_VECTOR_CANDIDATES_SQL = """
+            SELECT id, distance, row_number() OVER (ORDER BY distance) AS rank
+            FROM ({nearest}
+            ) AS nearest"""
+_LEXICAL_CANDIDATES_SQL = f"""
+            SELECT id, row_number() OVER (ORDER BY {_LEXICAL_ORDER}) AS rank
+            FROM recipes
+            WHERE {_LEXICAL_MATCH} AND {{where}}
+            ORDER BY rank
+            LIMIT :candidates"""
+# 關鍵字候選已由 lexical_search 取得時，直接以陣列帶入（名次即陣列順序）
+_PRECOMPUTED_LEXICAL_SQL = """
+            SELECT id, rank
+            FROM unnest(CAST(:lexical_ids AS int[])) WITH ORDINALITY AS l(id, rank)"""
+# 向量候選已由記憶體索引算好時，直接以陣列帶入（名次即陣列順序）
+_PRECOMPUTED_CANDIDATES_SQL = """
+            SELECT id, distance, rank
+            FROM unnest(CAST(:candidate_ids AS int[]), CAST(:candidate_distances AS float8[]))
+                 WITH ORDINALITY AS c(id, distance, rank)"""
+
+
+async def fused_search(
+    db: AsyncSession, query: str, q_vec: List[float], limit: int, filters: Tuple[str, Dict[str, Any]],
+    candidates: int = HYBRID_CANDIDATES, rrf_k: int = HYBRID_RRF_K,
+    vector_candidates: Optional[List[Tuple[int, float]]] = None,
+    lexical_candidates: Optional[List[int]] = None,
+) -> List[Any]:
+    """
+    關鍵字與向量兩組候選在同一個 SQL 中取得，以 reciprocal-rank fusion 合併：
+    score = 1 / (k + 關鍵字名次) + 1 / (k + 向量名次)，只出現在其中一組時另一項為 0。
+    vector_candidates 為 [(id, 距離)] 時（記憶體索引），不再於 SQL 中做向量搜尋；
+    lexical_candidates 為依名次排序的 id 時（lexical_search 已取得），不再重做關鍵字比對。
+    """
+    candidates = max(candidates, limit)
+    where, params = filters
+    if lexical_candidates is None:
+        q = normalize_query(query)
+        lexical_sql = _LEXICAL_CANDIDATES_SQL.format(where=where)
+        params = {**params, "q": q, "pattern": _like_pattern(q)}
+    else:
+        lexical_sql = _PRECOMPUTED_LEXICAL_SQL
+        params = {**params, "lexical_ids": list(lexical_candidates)}
+    if vector_candidates is None:
+        vector_sql = _VECTOR_CANDIDATES_SQL.format(nearest=_nearest_sql(where, "candidates"))
+        params = {**params, **await _prepare_filtered_scan(db, where, candidates), "q_vec": q_vec}
+    else:
+        vector_sql = _PRECOMPUTED_CANDIDATES_SQL
+        params = {**params,
+                  "candidate_ids": [rid for rid, _ in vector_candidates],
+                  "candidate_distances": [distance for _, distance in vector_candidates]}
+    stmt = text(f"""
+        WITH lexical AS ({lexical_sql}
+        ),
+        vector AS ({vector_sql}
+        ),
+        fused AS (
+            SELECT coalesce(l.id, v.id) AS id,
+                   v.distance,
+                   coalesce(1.0 / (:rrf_k + l.rank), 0) + coalesce(1.0 / (:rrf_k + v.rank), 0) AS score
+            FROM lexical l
+            FULL OUTER JOIN vector v ON v.id = l.id
+        )
+        SELECT r.id, r.name, r.image_url, f.distance, f.score::float8 AS score
+        FROM fused f
+        JOIN recipes r ON r.id = f.id
+        ORDER BY f.score DESC, f.distance NULLS LAST, r.id
+        LIMIT :limit
+    """)
+    values = {**params, "candidates": candidates, "rrf_k": rrf_k, "limit": limit}
+    return (await db.execute(stmt, values)).fetchall()
+
+
+__all__ = ["build_filters", "lexical_search", "vector_search", "batch_vector_search",
+           "hydrate_hits", "fused_search", "stats"]
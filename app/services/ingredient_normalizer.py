@@ -0,0 +1,76 @@
+# 檔案位置: app/services/ingredient_normalizer.py
+
+import os
+import re
+import time
+import unicodedata
+from typing import Dict, Iterable, List, Optional, Set
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+# 同義詞表重新載入的間隔（秒）；修改 ingredient_synonyms 後最慢這麼久生效
+INGREDIENT_SYNONYMS_TTL = int(os.getenv("INGREDIENT_SYNONYMS_TTL", "600"))
+
+SYNONYMS_SQL = "SELECT alias, canonical FROM ingredient_synonyms"
+
+# 食材名稱後面的括號註記，例如「雞蛋(常溫)」
+_NOTE = re.compile(r"\(.*?\)")
+
+
+def clean_ingredient(name: str) -> str:
+    """全形轉半形、去除括號註記與空白"""
+    name = unicodedata.normalize("NFKC", name)
+    name = _NOTE.sub("", name)
+    return "".join(name.split()).lower()
+
+
+class IngredientNormalizer:
+    """
+    依 ingredient_synonyms 表把食材轉成標準名稱（例如 蕃茄 → 番茄、青蔥 → 蔥），
+    也能把標準名稱展開成所有別名，用來比對資料庫中原始的 core_ingredients。
+    """
+    def __init__(self, synonyms: Dict[str, str]):
+        self.synonyms = {clean_ingredient(a): clean_ingredient(c) for a, c in synonyms.items()}
+        self.aliases: Dict[str, Set[str]] = {}
+        for alias, canonical in self.synonyms.items():
+            self.aliases.setdefault(canonical, {canonical}).add(alias)
+
+    def normalize(self, name: str) -> str:
+        cleaned = clean_ingredient(name)
+        return self.synonyms.get(cleaned, cleaned)
+
+    def normalize_all(self, names: Iterable[str]) -> List[str]:
+        """轉成標準名稱，去除空字串與重複（保留原順序）"""
+        result = []
+        for name in names:
+            canonical = self.normalize(name)
+            if canonical and canonical not in result:
+                result.append(canonical)
+        return result
+
+    def expand(self, canonicals: Iterable[str]) -> List[str]:
+        """標準名稱加上所有別名"""
+        expanded = set()
+        for canonical in canonicals:
+            expanded |= self.aliases.get(canonical, {canonical})
+        return sorted(expanded)
+
+
+_normalizer: Optional[IngredientNormalizer] = None
+_loaded_at = 0.0
+
+
+async def get_normalizer(db: AsyncSession) -> IngredientNormalizer:
+    """
+    取得全行程共用的 IngredientNormalizer；同義詞表超過 INGREDIENT_SYNONYMS_TTL 秒才重新讀取。
+    """
+    global _normalizer, _loaded_at
+    if _normalizer is None or time.monotonic() - _loaded_at > INGREDIENT_SYNONYMS_TTL:
+        rows = (await db.execute(text(SYNONYMS_SQL))).fetchall()
+        _normalizer = IngredientNormalizer({r.alias: r.canonical for r in rows})
+        _loaded_at = time.monotonic()
+    return _normalizer
+
+
+__all__ = ["IngredientNormalizer", "clean_ingredient", "get_normalizer", "SYNONYMS_SQL"]
@@ -0,0 +1,128 @@
+# 檔案位置: app/services/line_dispatcher.py
+
+import asyncio
+import zlib
+from typing import Any, Awaitable, Callable, Dict, List
+
+
+def event_partition_key(event: Any) -> str:
+    """
+    取得事件的排序鍵：同一個使用者（或群組、聊天室）的事件必須依序處理。
+    """
+    source = getattr(event, "source", None)
+    for attr in ("group_id", "room_id", "user_id"):
+        value = getattr(source, attr, None)
+        if value:
+            return value
+    return ""
+
+
+class LineEventDispatcher:
+    """
+    LINE webhook 事件的背景派送器。
+
+    webhook 只負責驗證簽名並把事件放進佇列，真正耗時的 AI 呼叫與回覆
+    由固定數量的 async worker 處理。每個 worker 擁有自己的有界佇列，
+    事件依使用者雜湊分配到固定 worker，因此同一位使用者的訊息會依序處理；
+    佇列滿時 submit 會等待（backpressure），超過 enqueue_timeout 仍無法放入才放棄。
+    """
+    def __init__(
+        self,
+        handler: Callable[[Any], Awaitable[None]],
+        workers: int = 4,
+        queue_size: int = 100,
+        enqueue_timeout: float = 1.0,
+    ):
+        self._handler = handler
+        self.workers = workers
+        self.queue_size = queue_size
+        self.enqueue_timeout = enqueue_timeout
+        self._queues: List[asyncio.Queue] = []
+        self._tasks: List[asyncio.Task] = []
+        self.enqueued = 0
+        self.processed = 0
+        self.failed = 0
+        self.dropped = 0
+        self.in_flight = 0
+
+    @property
+    def running(self) -> bool:
+        return bool(self._tasks)
+
+    async def start(self) -> None:
+        if self.running:
+            return
+        self._queues = [asyncio.Queue(maxsize=self.queue_size) for _ in range(self.workers)]
+        self._tasks = [
+            asyncio.create_task(self._worker(i, q), name=f"line-worker-{i}")
+            for i, q in enumerate(self._queues)
+        ]
+
+    async def stop(self, drain_timeout: float = 10.0) -> None:
+        """
+        停止所有 worker；先給佇列中的事件最多 drain_timeout 秒處理完畢。
+        """
+        if not self.running:
+            return
+        try:
+            await asyncio.wait_for(
+                asyncio.gather(*(q.join() for q in self._queues)), timeout=drain_timeout
+            )
+        except asyncio.TimeoutError:
+            print(f"[LineEventDispatcher] 關閉時仍有 {self.queue_depth()} 個事件未處理")
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def _queue_for(self, event: Any) -> asyncio.Queue:
+        key = event_partition_key(event)
+        return self._queues[zlib.crc32(key.encode("utf-8")) % len(self._queues)]
+
+    async def submit(self, event: Any) -> bool:
+        """
+        將事件放入對應 worker 的佇列。回傳 False 代表佇列持續滿載而放棄此事件。
+        """
+        if not self.running:
+            raise RuntimeError("LineEventDispatcher 尚未啟動")
+        try:
+            await asyncio.wait_for(self._queue_for(event).put(event), timeout=self.enqueue_timeout)
+        except asyncio.TimeoutError:
+            self.dropped += 1
+            return False
+        self.enqueued += 1
+        return True
+
+    async def _worker(self, index: int, queue: asyncio.Queue) -> None:
+        while True:
+            event = await queue.get()
+            self.in_flight += 1
+            try:
+                await self._handler(event)
+                self.processed += 1
+            except Exception as e:
+                self.failed += 1
+                print(f"[LineEventDispatcher] worker {index} 處理事件失敗：{e}")
+            finally:
+                self.in_flight -= 1
+                queue.task_done()
+
+    def queue_depth(self) -> int:
+        return sum(q.qsize() for q in self._queues)
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            "running": self.running,
+            "workers": self.workers,
+            "queue_size": self.queue_size,
+            "queue_depth": self.queue_depth(),
+            "queue_depth_per_worker": [q.qsize() for q in self._queues],
+            "in_flight": self.in_flight,
+            "enqueued": self.enqueued,
+            "processed": self.processed,
+            "failed": self.failed,
+            "dropped": self.dropped,
+        }
+
+
+__all__ = ["LineEventDispatcher", "event_partition_key"]
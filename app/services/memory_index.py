@@ -0,0 +1,281 @@
+# 檔案位置: app/services/memory_index.py
+
+import asyncio
+import json
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import text
+
+from app.db.session import AsyncSessionLocal
+
+# 設為 1 時在啟動時把所有食譜向量載入記憶體，語意搜尋直接在行程內以 NumPy 計算；
+# 未設定時一律走 pgvector
+VECTOR_MEMORY_INDEX = os.getenv("VECTOR_MEMORY_INDEX", "").lower() in ("1", "true", "yes")
+# 向量快照（.npy，旁邊搭配同名的 .meta.json）；存在時以 memory map 載入，再從資料庫補上快照之後的變動
+VECTOR_MEMORY_INDEX_SNAPSHOT = os.getenv("VECTOR_MEMORY_INDEX_SNAPSHOT")
+# 檢查 embedding_updated_at 的間隔（秒）
+VECTOR_MEMORY_INDEX_REFRESH = float(os.getenv("VECTOR_MEMORY_INDEX_REFRESH", "60"))
+# 往前多看的秒數：同一時間 commit 的批次可能帶有稍早的時間戳記，重複套用是安全的
+REFRESH_OVERLAP = timedelta(seconds=60)
+
+LOAD_SQL = """
+    SELECT id, name, image_url, embedding, embedding_updated_at
+    FROM recipes
+    WHERE embedding IS NOT NULL
+"""
+CHANGED_SQL = LOAD_SQL + " AND embedding_updated_at > :since"
+COUNT_SQL = "SELECT count(*) FROM recipes WHERE embedding IS NOT NULL"
+IDS_SQL = "SELECT id FROM recipes WHERE embedding IS NOT NULL"
+
+
+def _as_array(value) -> np.ndarray:
+    """pgvector 的 Vector、文字格式 '[1,2,...]' 或 list 都轉成 float32 陣列"""
+    if hasattr(value, "to_numpy"):
+        return value.to_numpy().astype(np.float32, copy=False)
+    if isinstance(value, str):
+        return np.array(json.loads(value), dtype=np.float32)
+    return np.asarray(value, dtype=np.float32)
+
+
+class MemoryVectorIndex:
+    """
+    行程內的精確向量索引：所有向量放在一個 (N, D) 的 float32 矩陣中，
+    查詢時算一次矩陣與查詢向量的內積，以 argpartition 取出前 k 名。
+    距離與 SQL 的 embedding <#> :q_vec 相同，為負內積（越小越相似）。
+
+    更新時複製一份新的矩陣再整組替換，查詢中的執行緒不會讀到改到一半的資料。
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.ids = np.empty(0, dtype=np.int64)
+        self.vectors = np.empty((0, 0), dtype=np.float32)
+        self.names: List[str] = []
+        self.image_urls: List[str] = []
+        self.watermark: Optional[datetime] = None
+        self.loaded_at: Optional[float] = None
+        self.source: Optional[str] = None
+        self.searches = 0
+        self.refreshes = 0
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @property
+    def ready(self) -> bool:
+        return self.loaded_at is not None and len(self) > 0
+
+    def _swap(self, ids, vectors, names, image_urls, watermark, source=None):
+        with self._lock:
+            self.ids, self.vectors = ids, vectors
+            self.names, self.image_urls = names, image_urls
+            self.watermark = watermark
+            self.loaded_at = time.time()
+            if source:
+                self.source = source
+
+    def load_rows(self, rows, source: str = "postgres", loaded_at: Optional[datetime] = None) -> None:
+        """
+        以 (id, name, image_url, embedding, embedding_updated_at) 的資料列整個重建索引。
+        沒有任何 embedding_updated_at（舊資料或空表）時以 loaded_at（載入時的資料庫時間）作為水位，
+        之後只需讀取晚於載入時間的變動。
+        """
+        rows = list(rows)
+        ids = np.array([r[0] for r in rows], dtype=np.int64)
+        vectors = np.vstack([_as_array(r[3]) for r in rows]) if rows else np.empty((0, 0), dtype=np.float32)
+        stamps = [r[4] for r in rows if r[4] is not None]
+        self._swap(ids, vectors, [r[1] for r in rows], [r[2] for r in rows], max(stamps, default=loaded_at), source)
+
+    def apply_rows(self, rows) -> int:
+        """套用有變動的資料列：已存在的 id 覆寫該列，新的 id 附加在最後；回傳處理筆數"""
+        rows = list(rows)
+        if not rows:
+            return 0
+        with self._lock:
+            ids, vectors = self.ids, self.vectors
+            names, image_urls = list(self.names), list(self.image_urls)
+            watermark = self.watermark
+        position = {int(rid): i for i, rid in enumerate(ids)}
+        # 從 memory map 載入的矩陣是唯讀的，這裡一律複製到記憶體
+        vectors = np.array(vectors, dtype=np.float32)
+        new_ids, new_vectors = [], []
+        for rid, name, image_url, embedding, updated_at in rows:
+            vec = _as_array(embedding)
+            if rid in position:
+                i = position[rid]
+                vectors[i] = vec
+                names[i], image_urls[i] = name, image_url
+            else:
+                position[rid] = len(ids) + len(new_ids)
+                new_ids.append(rid)
+                new_vectors.append(vec)
+                names.append(name)
+                image_urls.append(image_url)
+            if updated_at is not None and (watermark is None or updated_at > watermark):
+                watermark = updated_at
+        if new_ids:
+            ids = np.concatenate([ids, np.array(new_ids, dtype=np.int64)])
+            vectors = np.vstack([vectors, np.vstack(new_vectors)]) if len(vectors) else np.vstack(new_vectors)
+        self._swap(ids, vectors, names, image_urls, watermark)
+        self.refreshes += 1
+        return len(rows)
+
+    def retain(self, keep_ids) -> int:
+        """移除不在 keep_ids 中的列（食譜已刪除或 embedding 被清空），回傳移除筆數"""
+        with self._lock:
+            ids, vectors = self.ids, self.vectors
+            names, image_urls, watermark = self.names, self.image_urls, self.watermark
+        mask = np.isin(ids, np.fromiter(keep_ids, dtype=np.int64))
+        removed = int(len(ids) - mask.sum())
+        if removed:
+            positions = np.flatnonzero(mask)
+            self._swap(ids[mask], np.asarray(vectors)[mask], [names[i] for i in positions],
+                       [image_urls[i] for i in positions], watermark)
+        return removed
+
+    def search(self, q_vec, k: int) -> List[Tuple[int, str, str, float]]:
+        """回傳前 k 名的 (id, name, image_url, 負內積距離)，依距離由小到大排序"""
+        return self.search_many([q_vec], [k])[0]
+
+    def search_many(self, q_vecs, ks: List[int]) -> List[List[Tuple[int, str, str, float]]]:
+        """多個查詢一次以矩陣乘法算出分數，每個查詢各自取前 ks[i] 名"""
+        with self._lock:
+            ids, vectors, names, image_urls = self.ids, self.vectors, self.names, self.image_urls
+        self.searches += len(ks)
+        if not len(ids):
+            return [[] for _ in ks]
+        all_scores = np.asarray(q_vecs, dtype=np.float32) @ vectors.T
+        results = []
+        for scores, k in zip(all_scores, ks):
+            k = min(k, len(scores))
+            # argpartition 只保證前 k 名在最後 k 個位置（O(N)），再只對這 k 個排序
+            top = np.argpartition(scores, len(scores) - k)[-k:] if k < len(scores) else np.arange(len(scores))
+            top = top[np.argsort(-scores[top], kind="stable")]
+            results.append([(int(ids[i]), names[i], image_urls[i], float(-scores[i])) for i in top])
+        return results
+
+    def save_snapshot(self, path: str) -> None:
+        """向量存成 .npy（可用 memory map 載入），id、名稱與時間戳記存在旁邊的 .meta.json"""
+        with self._lock:
+            ids, vectors, names, image_urls, watermark = (
+                self.ids, self.vectors, self.names, self.image_urls, self.watermark,
+            )
+        np.save(path, vectors)
+        with open(_meta_path(path), "w", encoding="utf-8") as f:
+            json.dump({
+                "ids": ids.tolist(),
+                "names": names,
+                "image_urls": image_urls,
+                "watermark": watermark.isoformat() if watermark else None,
+            }, f, ensure_ascii=False)
+
+    def load_snapshot(self, path: str) -> None:
+        vectors = np.load(path, mmap_mode="r")
+        with open(_meta_path(path), encoding="utf-8") as f:
+            meta = json.load(f)
+        if len(meta["ids"]) != len(vectors):
+            raise ValueError(f"快照 {path} 的向量數與 meta 不一致")
+        watermark = datetime.fromisoformat(meta["watermark"]) if meta["watermark"] else None
+        self._swap(np.array(meta["ids"], dtype=np.int64), vectors, meta["names"], meta["image_urls"],
+                   watermark, source=f"snapshot:{path}")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "enabled": VECTOR_MEMORY_INDEX,
+                "size": len(self.ids),
+                "dim": int(self.vectors.shape[1]) if self.vectors.ndim == 2 and len(self.ids) else 0,
+                "bytes": int(self.vectors.nbytes),
+                "source": self.source,
+                "watermark": self.watermark.isoformat() if self.watermark else None,
+                "searches": self.searches,
+                "refreshes": self.refreshes,
+            }
+
+
+def _meta_path(path: str) -> str:
+    return os.path.splitext(path)[0] + ".meta.json"
+
+
+memory_index = MemoryVectorIndex()
+_refresh_task: Optional[asyncio.Task] = None
+
+
+async def load_from_database(index: MemoryVectorIndex = memory_index) -> None:
+    async with AsyncSessionLocal() as db:
+        loaded_at = (await db.execute(text("SELECT now()"))).scalar()
+        rows = (await db.execute(text(LOAD_SQL))).fetchall()
+    index.load_rows(rows, loaded_at=loaded_at)
+
+
+async def refresh(index: MemoryVectorIndex = memory_index) -> int:
+    """
+    讀取 embedding_updated_at 晚於上次紀錄的向量（scripts/vec_import.py 寫回時會更新），套用到索引中。
+    新增與修改都會出現在這些變動中，因此套用後筆數與資料庫不同就表示有食譜被刪除（或 embedding 被清空）；
+    只有這時才讀出所有 id 比對，移除已不存在的項目，索引中缺少的 id 則整個重新載入。
+    名稱與圖片不以索引中的值為準，搜尋結果一律以 hybrid_search.hydrate_hits 從 recipes 讀取。
+    """
+    if index.watermark is None:
+        # 快照沒有水位：整個重新載入，之後就有載入時間可用
+        await load_from_database(index)
+        return len(index)
+    async with AsyncSessionLocal() as db:
+        rows = (await db.execute(text(CHANGED_SQL), {"since": index.watermark - REFRESH_OVERLAP})).fetchall()
+        count = (await db.execute(text(COUNT_SQL))).scalar()
+        changed = await asyncio.to_thread(index.apply_rows, rows)
+        if count == len(index):
+            return changed
+        db_ids = set((await db.execute(text(IDS_SQL))).scalars().all())
+    changed += await asyncio.to_thread(index.retain, db_ids)
+    if db_ids.difference(index.ids.tolist()):
+        await load_from_database(index)
+    return changed
+
+
+async def _refresh_loop():
+    while True:
+        await asyncio.sleep(VECTOR_MEMORY_INDEX_REFRESH)
+        try:
+            changed = await refresh()
+            if changed:
+                print(f"[MemoryVectorIndex] 已更新 {changed} 筆向量，共 {len(memory_index)} 筆")
+        except Exception as e:
+            print(f"[MemoryVectorIndex] 更新失敗：{e}")
+
+
+async def startup():
+    """載入索引並啟動定期更新，由 main.py 的 lifespan 呼叫；未啟用時不做任何事"""
+    global _refresh_task
+    if not VECTOR_MEMORY_INDEX:
+        return
+    try:
+        if VECTOR_MEMORY_INDEX_SNAPSHOT and os.path.exists(VECTOR_MEMORY_INDEX_SNAPSHOT):
+            memory_index.load_snapshot(VECTOR_MEMORY_INDEX_SNAPSHOT)
+            await refresh()
+        else:
+            await load_from_database()
+    except Exception as e:
+        # 載入失敗時搜尋照常走 pgvector
+        print(f"[MemoryVectorIndex] 載入失敗，改用 pgvector：{e}")
+        return
+    print(f"[MemoryVectorIndex] 已載入 {len(memory_index)} 筆向量（{memory_index.source}）")
+    _refresh_task = asyncio.create_task(_refresh_loop())
+
+
+async def shutdown():
+    if _refresh_task is not None:
+        _refresh_task.cancel()
+
+
+def get_memory_index() -> Optional[MemoryVectorIndex]:
+    """啟用且已載入時回傳索引，否則回傳 None（呼叫端改走 pgvector）"""
+    if VECTOR_MEMORY_INDEX and memory_index.ready:
+        return memory_index
+    return None
+
+
+__all__ = ["MemoryVectorIndex", "memory_index", "get_memory_index", "startup", "shutdown", "refresh"]
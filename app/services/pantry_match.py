@@ -0,0 +1,87 @@
+# 檔案位置: app/services/pantry_match.py
+
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.services.ingredient_normalizer import IngredientNormalizer
+
+
+def pantry_match_sql(where: str = "TRUE") -> str:
+    """
+    以使用者的食材比對 core_ingredients，一個 SQL 完成候選、覆蓋率與缺少食材的計算：
+      1. candidates：clean_ingredients(core_ingredients) && :expanded（走 idx_recipes_core_ingredients_clean GIN 索引），
+         :expanded 是使用者食材的標準名稱加上所有別名
+      2. items：把候選食譜的食材展開，透過 ingredient_synonyms 轉成標準名稱
+    資料庫端的 clean_ingredient（migrations/0008）與 ingredient_normalizer.clean_ingredient 的正規化規則相同，
+    兩邊比對的都是 NFKC、去除括號註記與空白、轉小寫後的名稱。
+      3. 依缺少的食材數由少到多、符合的食材數由多到少排序
+    """
+    return f"""
+        WITH candidates AS (
+            SELECT id, name, image_url, core_ingredients
+            FROM recipes
+            WHERE clean_ingredients(core_ingredients) && CAST(:expanded AS text[]) AND {where}
+        ),
+        items AS (
+            SELECT c.id, btrim(i.item) AS item,
+                   coalesce(clean_ingredient(s.canonical), clean_ingredient(i.item)) AS canonical
+            FROM candidates c
+            CROSS JOIN LATERAL unnest(c.core_ingredients) AS i(item)
+            LEFT JOIN ingredient_synonyms s ON clean_ingredient(s.alias) = clean_ingredient(i.item)
+        ),
+        scored AS (
+            SELECT id,
+                   count(DISTINCT canonical) AS total,
+                   count(DISTINCT canonical) FILTER (WHERE canonical = ANY(CAST(:pantry AS text[]))) AS matched_count,
+                   coalesce(array_agg(DISTINCT item) FILTER (WHERE canonical = ANY(CAST(:pantry AS text[]))),
+                            ARRAY[]::text[]) AS matched_ingredients,
+                   coalesce(array_agg(DISTINCT item) FILTER (WHERE NOT canonical = ANY(CAST(:pantry AS text[]))),
+                            ARRAY[]::text[]) AS missing_ingredients
+            FROM items
+            GROUP BY id
+        )
+        SELECT c.id, c.name, c.image_url,
+               s.matched_count,
+               s.total - s.matched_count AS missing_count,
+               s.matched_count::float8 / s.total AS coverage,
+               s.matched_ingredients,
+               s.missing_ingredients
+        FROM scored s
+        JOIN candidates c ON c.id = s.id
+        WHERE s.total - s.matched_count <= :max_missing
+        ORDER BY missing_count, s.matched_count DESC, coverage DESC, c.id
+        LIMIT :limit
+    """
+
+
+def pantry_match_params(
+    normalizer: IngredientNormalizer, ingredients: List[str], limit: int, max_missing: Optional[int] = None,
+) -> Tuple[List[str], Dict[str, Any]]:
+    """回傳 (標準化後的食材, SQL 參數)"""
+    pantry = normalizer.normalize_all(ingredients)
+    params = {
+        "pantry": pantry,
+        "expanded": normalizer.expand(pantry),
+        "limit": limit,
+        # 不限制時以一個不可能達到的數字代替，讓 SQL 保持同一個形狀
+        "max_missing": max_missing if max_missing is not None else 2 ** 31 - 1,
+    }
+    return pantry, params
+
+
+async def pantry_match(
+    db: AsyncSession, normalizer: IngredientNormalizer, ingredients: List[str], limit: int,
+    max_missing: Optional[int] = None, filters: Tuple[str, Dict[str, Any]] = ("TRUE", {}),
+) -> Tuple[List[str], List[Any]]:
+    """回傳 (標準化後的食材, 排序後的食譜)"""
+    where, filter_params = filters
+    pantry, params = pantry_match_params(normalizer, ingredients, limit, max_missing)
+    if not pantry:
+        return pantry, []
+    rows = (await db.execute(text(pantry_match_sql(where)), {**filter_params, **params})).fetchall()
+    return pantry, rows
+
+
+__all__ = ["pantry_match", "pantry_match_sql", "pantry_match_params"]
@@ -0,0 +1,148 @@
+# 檔案位置: app/services/recipe_cache.py
+
+import os
+import threading
+from datetime import datetime
+from typing import Any, Dict, Optional, Tuple
+
+from cachetools import LRUCache
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# 行程內快取的食譜筆數
+RECIPE_CACHE_SIZE = int(os.getenv("RECIPE_CACHE_SIZE", "1024"))
+# 設定時啟用共用的第二層快取（多個 worker / 機器共用），例如 redis://localhost:6379/0
+REDIS_URL = os.getenv("REDIS_URL")
+RECIPE_CACHE_SHARED_TTL = int(os.getenv("RECIPE_CACHE_SHARED_TTL", "86400"))  # 秒
+# 回應的 Cache-Control max-age（秒）。預設 0：送出 no-cache，用戶端每次都以 If-None-Match 重新驗證，
+# 食譜更新後不會再拿到舊內容；設為正數才允許用戶端在這段時間內不經驗證直接使用
+RECIPE_CACHE_MAX_AGE = int(os.getenv("RECIPE_CACHE_MAX_AGE", "0"))
+
+
+def recipe_version(updated_at: Optional[datetime]) -> str:
+    """以 updated_at（微秒）作為食譜的版本；舊資料沒有 updated_at 時為 0"""
+    return str(int(updated_at.timestamp() * 1_000_000)) if updated_at else "0"
+
+
+def make_etag(recipe_id: int, version: str) -> str:
+    return f'"recipe-{recipe_id}-{version}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """If-None-Match 可能是以逗號分隔的多個 ETag、弱 ETag（W/ 開頭）或 *"""
+    if not if_none_match:
+        return False
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*" or candidate.removeprefix("W/") == etag:
+            return True
+    return False
+
+
+class RecipeCache:
+    """
+    GET /api/v1/recipes/{id} 的 read-through 快取，存放已序列化好的 JSON bytes。
+
+    第一層是行程內的 LRU（以 id 為鍵，連同版本一起存放），第二層（可選）是 Redis
+    （鍵為 recipe:{id}:{版本}）。版本取自 updated_at，每次讀取都先以主鍵查出目前版本，
+    版本不同的項目視同不存在，因此其他 worker 更新食譜後也不會讀到舊內容。
+    """
+    def __init__(self, maxsize: int = RECIPE_CACHE_SIZE, redis_url: Optional[str] = REDIS_URL,
+                 shared_ttl: int = RECIPE_CACHE_SHARED_TTL):
+        self._local: LRUCache = LRUCache(maxsize=maxsize)
+        self._lock = threading.Lock()
+        self.redis_url = redis_url
+        self.shared_ttl = shared_ttl
+        self._redis = None
+        self.hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+        self.not_modified = 0
+        self.invalidations = 0
+
+    @property
+    def redis(self):
+        # 延遲建立 client：未設定 REDIS_URL 時不需要安裝 redis 套件
+        if self._redis is None and self.redis_url:
+            import redis.asyncio as redis
+            self._redis = redis.Redis.from_url(self.redis_url)
+        return self._redis
+
+    @staticmethod
+    def shared_key(recipe_id: int, version: str) -> str:
+        return f"recipe:{recipe_id}:{version}"
+
+    async def get(self, recipe_id: int, version: str) -> Optional[bytes]:
+        with self._lock:
+            entry: Optional[Tuple[str, bytes]] = self._local.get(recipe_id)
+            if entry is not None and entry[0] == version:
+                self.hits += 1
+                return entry[1]
+
+        if self.redis is not None:
+            try:
+                body = await self.redis.get(self.shared_key(recipe_id, version))
+            except Exception as e:
+                # 共用快取故障時不影響讀取，只是改查資料庫
+                print(f"[RecipeCache] 讀取共用快取失敗：{e}")
+                body = None
+            if body is not None:
+                with self._lock:
+                    self._local[recipe_id] = (version, body)
+                    self.shared_hits += 1
+                return body
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    async def set(self, recipe_id: int, version: str, body: bytes) -> None:
+        with self._lock:
+            self._local[recipe_id] = (version, body)
+        if self.redis is not None:
+            try:
+                await self.redis.set(self.shared_key(recipe_id, version), body, ex=self.shared_ttl)
+            except Exception as e:
+                print(f"[RecipeCache] 寫入共用快取失敗：{e}")
+
+    async def invalidate(self, recipe_id: int, version: Optional[str] = None) -> None:
+        """移除食譜的快取；version 為更新或刪除前的版本，用來刪除共用快取中的舊項目"""
+        with self._lock:
+            entry = self._local.pop(recipe_id, None)
+            self.invalidations += 1
+        versions = {v for v in (version, entry[0] if entry else None) if v}
+        if self.redis is not None and versions:
+            try:
+                await self.redis.delete(*(self.shared_key(recipe_id, v) for v in versions))
+            except Exception as e:
+                print(f"[RecipeCache] 刪除共用快取失敗：{e}")
+
+    def mark_not_modified(self) -> None:
+        with self._lock:
+            self.not_modified += 1
+
+    async def close(self) -> None:
+        if self._redis is not None:
+            await self._redis.aclose()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self.hits + self.shared_hits + self.misses
+            return {
+                "size": len(self._local),
+                "maxsize": self._local.maxsize,
+                "shared": self.redis_url is not None,
+                "hits": self.hits,
+                "shared_hits": self.shared_hits,
+                "misses": self.misses,
+                "not_modified": self.not_modified,
+                "invalidations": self.invalidations,
+                "hit_rate": (self.hits + self.shared_hits) / total if total else 0.0,
+            }
+
+
+recipe_cache = RecipeCache()
+
+
+__all__ = ["RecipeCache", "recipe_cache", "recipe_version", "make_etag", "etag_matches", "RECIPE_CACHE_MAX_AGE"]
@@ -0,0 +1,9 @@
+-- 0001: 讓 recipes.embedding 成為正式欄位
+-- 早期的資料庫是手動 ALTER 出 embedding 欄位，這裡統一補齊（已存在則略過）
+
+CREATE EXTENSION IF NOT EXISTS vector;
+
+ALTER TABLE recipes ADD COLUMN IF NOT EXISTS embedding vector(768);
+
+-- 近似最近鄰 (ANN) 索引請使用 scripts/vector_index.py 建立與重建，
+-- 因為索引參數 (m / ef_construction / lists) 需要依資料量調整。
@@ -0,0 +1,7 @@
+-- 0002: 以食譜來源網址作為自然鍵
+-- scripts/importer.py 的 bulk 模式以 source_url upsert，重複匯入時保留既有的 id 與 embedding
+
+ALTER TABLE recipes ADD COLUMN IF NOT EXISTS source_url TEXT;
+
+-- 舊資料的 source_url 為 NULL，唯一索引允許多個 NULL
+CREATE UNIQUE INDEX IF NOT EXISTS idx_recipes_source_url ON recipes (source_url);
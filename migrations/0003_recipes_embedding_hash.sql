@@ -0,0 +1,4 @@
+-- 0003: 記錄產生 embedding 時的輸入文字雜湊
+-- scripts/vec_import.py 依此略過內容沒有變動的食譜，中斷後重新執行即可續傳
+
+ALTER TABLE recipes ADD COLUMN IF NOT EXISTS embedding_hash TEXT;
@@ -0,0 +1,22 @@
+-- 0004: 混合搜尋（關鍵字 + 向量）用的 trigram 索引
+-- 中文沒有空白斷詞，tsvector 的 simple / english 設定無法切出詞彙，因此關鍵字比對改用 pg_trgm；
+-- 資料庫的 LC_CTYPE 需為 UTF-8（例如 C.UTF-8），pg_trgm 才會把中文字元視為詞的一部分。
+
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+-- 名稱與核心食材合併成一段文字；array_to_string 不是 IMMUTABLE，不能直接寫在索引運算式中，
+-- 包一層宣告為 IMMUTABLE 的函式（查詢時必須使用同一個函式才會走索引）
+CREATE OR REPLACE FUNCTION recipe_search_text(name TEXT, core_ingredients TEXT[])
+RETURNS TEXT
+LANGUAGE sql IMMUTABLE PARALLEL SAFE
+AS $$
+    SELECT lower(coalesce(name, '') || ' ' || coalesce(array_to_string(core_ingredients, ' '), ''))
+$$;
+
+-- 菜名的相似度比對（lower(name) % :q）
+CREATE INDEX IF NOT EXISTS idx_recipes_name_trgm
+    ON recipes USING gin (lower(name) gin_trgm_ops);
+
+-- 菜名 + 核心食材的部分比對（LIKE '%...%'）
+CREATE INDEX IF NOT EXISTS idx_recipes_search_text_trgm
+    ON recipes USING gin (recipe_search_text(name, core_ingredients) gin_trgm_ops);
@@ -0,0 +1,37 @@
+-- 0005: 「冰箱裡有什麼」食材比對用的倒排索引與同義詞表
+-- POST /api/v1/recipes/pantry-match 以 core_ingredients && :食材 取出候選，GIN 索引讓這一步不必掃描整張表
+
+CREATE INDEX IF NOT EXISTS idx_recipes_core_ingredients
+    ON recipes USING gin (core_ingredients);
+
+-- 食材別名對應到標準名稱；標準名稱本身不需要列在 alias 中
+-- 查詢時使用者的食材先轉成標準名稱，再展開成所有別名去比對 core_ingredients
+CREATE TABLE IF NOT EXISTS ingredient_synonyms (
+    alias     TEXT PRIMARY KEY,
+    canonical TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_ingredient_synonyms_canonical ON ingredient_synonyms (canonical);
+
+INSERT INTO ingredient_synonyms (alias, canonical) VALUES
+    ('蕃茄', '番茄'), ('西紅柿', '番茄'),
+    ('青蔥', '蔥'), ('蔥花', '蔥'),
+    ('蒜頭', '蒜'), ('大蒜', '蒜'), ('蒜末', '蒜'),
+    ('老薑', '薑'), ('生薑', '薑'), ('薑片', '薑'), ('薑絲', '薑'),
+    ('洋芋', '馬鈴薯'), ('土豆', '馬鈴薯'),
+    ('胡蘿蔔', '紅蘿蔔'),
+    ('蘿蔔', '白蘿蔔'),
+    ('甘藍', '高麗菜'), ('包心菜', '高麗菜'), ('捲心菜', '高麗菜'),
+    ('蛋', '雞蛋'), ('全蛋', '雞蛋'),
+    ('芫荽', '香菜'),
+    ('番薯', '地瓜'), ('蕃薯', '地瓜'), ('甘藷', '地瓜'),
+    ('絞肉', '豬絞肉'), ('豬肉末', '豬絞肉'),
+    ('豬五花', '五花肉'), ('三層肉', '五花肉'),
+    ('玉蜀黍', '玉米'),
+    ('菠薐菜', '菠菜'),
+    ('青花菜', '綠花椰菜'), ('西蘭花', '綠花椰菜'),
+    ('三文魚', '鮭魚'),
+    ('雞胸', '雞胸肉'),
+    ('雞腿肉', '雞腿'), ('去骨雞腿', '雞腿'),
+    ('紅辣椒', '辣椒'),
+    ('鮮香菇', '香菇')
+ON CONFLICT (alias) DO NOTHING;
@@ -0,0 +1,10 @@
+-- 0006: 記錄最近一次寫入 embedding 的時間
+-- API 的記憶體向量索引（app/services/memory_index.py）定期讀取此時間之後的向量，不必整個重新載入
+
+ALTER TABLE recipes ADD COLUMN IF NOT EXISTS embedding_updated_at TIMESTAMP WITH TIME ZONE;
+
+-- 既有的向量視為現在寫入
+UPDATE recipes SET embedding_updated_at = now()
+WHERE embedding IS NOT NULL AND embedding_updated_at IS NULL;
+
+CREATE INDEX IF NOT EXISTS idx_recipes_embedding_updated_at ON recipes (embedding_updated_at);
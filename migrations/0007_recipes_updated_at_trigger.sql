@@ -0,0 +1,30 @@
+-- 0007: 食譜內容變動時自動更新 updated_at
+-- GET /api/v1/recipes/{id} 以 updated_at 作為 ETag 與快取版本，
+-- 手動或其他腳本直接以 SQL 更新食譜時也必須讓版本改變，快取才不會回傳舊內容
+
+ALTER TABLE recipes ADD COLUMN IF NOT EXISTS created_at TIMESTAMP WITH TIME ZONE DEFAULT now();
+ALTER TABLE recipes ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP WITH TIME ZONE DEFAULT now();
+
+CREATE OR REPLACE FUNCTION recipes_touch_updated_at()
+RETURNS trigger
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    NEW.updated_at = now();
+    RETURN NEW;
+END;
+$$;
+
+-- 只有回應中會出現的欄位變動時才更新；scripts/vec_import.py 寫入 embedding 不會讓快取失效
+DROP TRIGGER IF EXISTS trg_recipes_touch_updated_at ON recipes;
+CREATE TRIGGER trg_recipes_touch_updated_at
+    BEFORE UPDATE ON recipes
+    FOR EACH ROW
+    WHEN ((OLD.name, OLD.image_url, OLD.core_ingredients, OLD.full_ingredient_list, OLD.steps,
+           OLD.total_time, OLD.difficulty, OLD.cuisine_style, OLD.servings, OLD.key_equipment,
+           OLD.tips, OLD.nutrition_info)
+          IS DISTINCT FROM
+          (NEW.name, NEW.image_url, NEW.core_ingredients, NEW.full_ingredient_list, NEW.steps,
+           NEW.total_time, NEW.difficulty, NEW.cuisine_style, NEW.servings, NEW.key_equipment,
+           NEW.tips, NEW.nutrition_info))
+    EXECUTE FUNCTION recipes_touch_updated_at();
@@ -0,0 +1,27 @@
+-- 0008: 食材比對在 SQL 與 Python 兩邊使用相同的正規化
+-- app/services/ingredient_normalizer.py 的 clean_ingredient 會做 NFKC（全形轉半形）、去除括號註記、去除空白並轉小寫；
+-- 資料庫端若只比對 btrim 後的原始字串，「雞蛋(常溫)」或全形的食材名稱會被算成缺少的食材
+
+-- normalize() 需要資料庫編碼為 UTF8；函式宣告為 IMMUTABLE 才能用在索引運算式中
+CREATE OR REPLACE FUNCTION clean_ingredient(item TEXT)
+RETURNS TEXT
+LANGUAGE sql IMMUTABLE PARALLEL SAFE
+AS $$
+    SELECT lower(regexp_replace(regexp_replace(normalize(item, NFKC), '\(.*?\)', '', 'g'), '\s+', '', 'g'))
+$$;
+
+CREATE OR REPLACE FUNCTION clean_ingredients(items TEXT[])
+RETURNS TEXT[]
+LANGUAGE sql IMMUTABLE PARALLEL SAFE
+AS $$
+    SELECT ARRAY(SELECT clean_ingredient(item) FROM unnest(items) AS item)
+$$;
+
+-- pantry-match 的候選條件 clean_ingredients(core_ingredients) && :expanded 走這個索引
+-- （idx_recipes_core_ingredients 仍供搜尋的 core_ingredients @> :ingredients 篩選使用）
+CREATE INDEX IF NOT EXISTS idx_recipes_core_ingredients_clean
+    ON recipes USING gin (clean_ingredients(core_ingredients));
+
+-- 同義詞表中的別名也以同樣的方式比對
+CREATE INDEX IF NOT EXISTS idx_ingredient_synonyms_alias_clean
+    ON ingredient_synonyms (clean_ingredient(alias));
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+# scripts/bench_age_query.py
+"""
+CustomAgeGraph 查詢效能的 micro-benchmark（需要本機的 AGE 容器與已建好的圖譜）。
+
+比較兩種執行方式的 queries/sec：
+  naive  : 每次查詢都新建連線、LOAD 'age'、設定 search_path，Cypher 以字串直接組出
+  pooled : CustomAgeGraph 的連線池 + PREPARE 過的參數化 Cypher
+用法：
+    python scripts/bench_age_query.py --queries 500 --threads 4
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import psycopg2
+from dotenv import load_dotenv
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from app.services.age_graph import CustomAgeGraph  # noqa: E402
+
+CYPHER = "MATCH (r:Recipe)-[:HAS_INGREDIENT]->(i:Ingredient {name: $name}) RETURN r.name LIMIT 10"
+
+
+def connection_details():
+    load_dotenv()
+    return {
+        "host": os.getenv("DB_HOST", "localhost"),
+        "port": os.getenv("DB_PORT", "5432"),
+        "dbname": os.getenv("DB_NAME"),
+        "user": os.getenv("DB_USER"),
+        "password": os.getenv("DB_PASSWORD"),
+    }
+
+
+def naive_query(details, graph_name, name):
+    conn = psycopg2.connect(**details)
+    try:
+        with conn.cursor() as cur:
+            cur.execute("LOAD 'age';")
+            cur.execute('SET search_path = ag_catalog, "$user", public;')
+            literal = name.replace("'", "\\'")
+            cur.execute(
+                f"SELECT * FROM ag_catalog.cypher('{graph_name}', $$"
+                f"MATCH (r:Recipe)-[:HAS_INGREDIENT]->(i:Ingredient {{name: '{literal}'}}) RETURN r.name LIMIT 10"
+                "$$) AS (name agtype);"
+            )
+            return cur.fetchall()
+    finally:
+        conn.close()
+
+
+def run(label, fn, names, threads):
+    latencies = []
+
+    def timed(name):
+        start = time.perf_counter()
+        fn(name)
+        latencies.append((time.perf_counter() - start) * 1000)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        list(pool.map(timed, names))
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    print(
+        f"{label:<8} {len(names) / elapsed:>10.1f} q/s   "
+        f"p50 {statistics.median(latencies):>7.2f} ms   "
+        f"p95 {latencies[int(len(latencies) * 0.95) - 1]:>7.2f} ms"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="CustomAgeGraph 查詢效能測試")
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--threads", type=int, default=4)
+    parser.add_argument("--graph", default=os.getenv("GRAPH_NAME", "moms_hero_graph"))
+    args = parser.parse_args()
+
+    details = connection_details()
+    graph = CustomAgeGraph(details, graph_name=args.graph, pool_max=args.threads)
+    ingredients = [row["name"] for row in graph.query("MATCH (i:Ingredient) RETURN i.name AS name LIMIT 50")]
+    if not ingredients:
+        print("圖譜中沒有 Ingredient 節點，請先執行 scripts/graph_builder.py。")
+        return
+    names = [ingredients[i % len(ingredients)] for i in range(args.queries)]
+
+    print(f"圖譜 {args.graph}：{args.queries} 次查詢，{args.threads} 個 thread")
+    run("naive", lambda n: naive_query(details, args.graph, n), names, args.threads)
+    run("pooled", lambda n: graph.query(CYPHER, {"name": n}), names, args.threads)
+    graph.close()
+
+
+if __name__ == "__main__":
+    main()
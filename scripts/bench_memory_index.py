@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+# scripts/bench_memory_index.py
+"""
+比較語意搜尋的兩種向量檢索方式（不需要 GOOGLE_API_KEY）：
+  memory : app/services/memory_index.py 的行程內 NumPy 精確搜尋
+  sql    : pgvector 的 ORDER BY embedding <#> :q LIMIT k（有 HNSW / IVFFlat 索引時為近似搜尋）
+
+查詢向量取自資料庫中隨機的食譜向量再加上少量雜訊；
+同時以記憶體的精確結果計算 SQL 路徑的 recall@k。
+用法：
+    python scripts/bench_memory_index.py --queries 200 --k 10
+    python scripts/bench_memory_index.py --save-snapshot embeddings.npy   # 產生 VECTOR_MEMORY_INDEX_SNAPSHOT 用的快照
+    python scripts/bench_memory_index.py --synthetic 15000                 # 不連資料庫，只測記憶體搜尋
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from app.services.memory_index import LOAD_SQL, MemoryVectorIndex  # noqa: E402
+
+EMBEDDING_DIM = 768
+
+
+def percentiles(latencies):
+    latencies = sorted(latencies)
+    return statistics.median(latencies), latencies[max(0, int(len(latencies) * 0.95) - 1)]
+
+
+def make_queries(vectors, n, noise, seed):
+    rng = np.random.default_rng(seed)
+    picks = vectors[rng.integers(0, len(vectors), size=n)]
+    queries = picks + rng.normal(0, noise, size=picks.shape).astype(np.float32)
+    return queries / np.linalg.norm(queries, axis=1, keepdims=True)
+
+
+def synthetic_index(n, seed):
+    rng = np.random.default_rng(seed)
+    vectors = rng.normal(size=(n, EMBEDDING_DIM)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    now = datetime.now(timezone.utc)
+    index = MemoryVectorIndex()
+    index.load_rows(((i + 1, f"recipe-{i + 1}", "", vectors[i], now) for i in range(n)), source="synthetic")
+    return index
+
+
+def bench_memory(index, queries, k):
+    latencies, results = [], []
+    for q in queries:
+        start = time.perf_counter()
+        hits = index.search(q, k)
+        latencies.append((time.perf_counter() - start) * 1000)
+        results.append([rid for rid, _, _, _ in hits])
+    return latencies, results
+
+
+def bench_sql(cur, queries, k, ef_search):
+    latencies, results = [], []
+    if ef_search:
+        cur.execute("SET hnsw.ef_search = %s", (ef_search,))
+    for q in queries:
+        start = time.perf_counter()
+        cur.execute(
+            "SELECT id FROM recipes WHERE embedding IS NOT NULL ORDER BY embedding <#> %s LIMIT %s", (q, k)
+        )
+        ids = [row[0] for row in cur.fetchall()]
+        latencies.append((time.perf_counter() - start) * 1000)
+        results.append(ids)
+    return latencies, results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="記憶體向量索引與 pgvector 的搜尋延遲比較")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--noise", type=float, default=0.05, help="加在查詢向量上的雜訊標準差")
+    parser.add_argument("--ef-search", type=int, default=None, help="SQL 路徑的 hnsw.ef_search")
+    parser.add_argument("--save-snapshot", default=None, help="把載入的向量存成快照（.npy + .meta.json）")
+    parser.add_argument("--synthetic", type=int, default=0, help="以 N 筆隨機向量測試，不連資料庫")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    conn = None
+    if args.synthetic:
+        started = time.perf_counter()
+        index = synthetic_index(args.synthetic, args.seed)
+        print(f"產生 {len(index)} 筆隨機向量：{time.perf_counter() - started:.2f} 秒")
+    else:
+        import psycopg2
+        from pgvector.psycopg2 import register_vector
+        from migrate import get_database_url
+
+        conn = psycopg2.connect(get_database_url())
+        register_vector(conn)
+        cur = conn.cursor()
+        index = MemoryVectorIndex()
+        started = time.perf_counter()
+        cur.execute(LOAD_SQL)
+        index.load_rows(cur.fetchall())
+        print(f"自資料庫載入 {len(index)} 筆向量：{time.perf_counter() - started:.2f} 秒")
+        if not len(index):
+            print("資料庫中沒有向量，請先執行 scripts/vec_import.py。")
+            return
+
+    print(f"矩陣大小 {index.vectors.shape}，{index.vectors.nbytes / 1024 / 1024:.1f} MB")
+    if args.save_snapshot:
+        index.save_snapshot(args.save_snapshot)
+        started = time.perf_counter()
+        MemoryVectorIndex().load_snapshot(args.save_snapshot)
+        print(f"已儲存快照 {args.save_snapshot}（memory map 載入 {(time.perf_counter() - started) * 1000:.1f} ms）")
+
+    queries = make_queries(np.asarray(index.vectors), args.queries, args.noise, args.seed)
+    print(f"\n{args.queries} 次查詢，k = {args.k}")
+    mem_latencies, exact = bench_memory(index, queries, args.k)
+    p50, p95 = percentiles(mem_latencies)
+    print(f"{'memory':<8} p50 {p50:>8.2f} ms   p95 {p95:>8.2f} ms")
+
+    if conn is not None:
+        sql_latencies, approx = bench_sql(cur, queries, args.k, args.ef_search)
+        recall = statistics.mean(len(set(a) & set(e)) / len(e) for a, e in zip(approx, exact) if e)
+        p50, p95 = percentiles(sql_latencies)
+        print(f"{'sql':<8} p50 {p50:>8.2f} ms   p95 {p95:>8.2f} ms   recall@{args.k} {recall:.3f}")
+        cur.close()
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
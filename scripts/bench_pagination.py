@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+# scripts/bench_pagination.py
+"""
+比較食譜列表的 OFFSET 分頁與 keyset（cursor）分頁，以及完整欄位與 summary 欄位的查詢延遲。
+
+直接對資料庫執行與 GET /api/v1/recipes/ 相同的 SQL，分別量測第 1 頁與第 --page 頁：
+    offset   SELECT ... ORDER BY id OFFSET (page-1)*limit LIMIT limit
+    keyset   SELECT ... WHERE id > 上一頁最後一筆 ORDER BY id LIMIT limit
+用法：
+    python scripts/bench_pagination.py --page 700 --limit 20 --repeat 50
+"""
+
+import argparse
+import statistics
+import time
+
+import psycopg2
+
+from migrate import get_database_url
+
+FULL_COLUMNS = [
+    "id", "name", "image_url", "core_ingredients", "full_ingredient_list", "steps",
+    "total_time", "difficulty", "cuisine_style", "servings", "key_equipment", "tips", "nutrition_info",
+]
+SUMMARY_COLUMNS = ["id", "name", "image_url", "total_time", "difficulty", "cuisine_style"]
+
+
+def keyset_after(cursor, page, limit):
+    """第 page 頁之前最後一筆的 id（keyset 分頁在實際使用時由 next_cursor 帶入）"""
+    if page <= 1:
+        return None
+    cursor.execute("SELECT id FROM recipes ORDER BY id OFFSET %s LIMIT 1", ((page - 1) * limit - 1,))
+    row = cursor.fetchone()
+    return row[0] if row else None
+
+
+def time_query(cursor, sql, params, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        cursor.execute(sql, params)
+        cursor.fetchall()
+        timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    return statistics.median(timings), timings[int(len(timings) * 0.95) - 1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="OFFSET 與 keyset 分頁的延遲比較")
+    parser.add_argument("--page", type=int, default=700, help="要比較的深層頁碼")
+    parser.add_argument("--limit", type=int, default=20, help="每頁筆數")
+    parser.add_argument("--repeat", type=int, default=50, help="每種組合重複次數")
+    parser.add_argument("--explain", action="store_true", help="印出第 --page 頁的查詢計畫")
+    args = parser.parse_args()
+
+    conn = psycopg2.connect(get_database_url())
+    conn.set_session(readonly=True, autocommit=True)
+    cursor = conn.cursor()
+    cursor.execute("SELECT count(*) FROM recipes")
+    total = cursor.fetchone()[0]
+    print(f"recipes 共 {total} 筆，每頁 {args.limit} 筆，每種組合執行 {args.repeat} 次")
+    if (args.page - 1) * args.limit >= total:
+        print(f"  [警告] 第 {args.page} 頁已超過資料範圍，深層頁面的結果會是空的")
+
+    print(f"\n{'columns':<9} {'method':<8} {'page':>6} {'p50 ms':>9} {'p95 ms':>9}")
+    for label, columns in (("full", FULL_COLUMNS), ("summary", SUMMARY_COLUMNS)):
+        select = f"SELECT {', '.join(columns)} FROM recipes"
+        for page in (1, args.page):
+            offset_sql = f"{select} ORDER BY id OFFSET %s LIMIT %s"
+            offset_params = ((page - 1) * args.limit, args.limit)
+            after = keyset_after(cursor, page, args.limit)
+            if after is None:
+                keyset_sql, keyset_params = f"{select} ORDER BY id LIMIT %s", (args.limit,)
+            else:
+                keyset_sql, keyset_params = f"{select} WHERE id > %s ORDER BY id LIMIT %s", (after, args.limit)
+
+            for method, sql, params in (("offset", offset_sql, offset_params), ("keyset", keyset_sql, keyset_params)):
+                p50, p95 = time_query(cursor, sql, params, args.repeat)
+                print(f"{label:<9} {method:<8} {page:>6} {p50:>9.2f} {p95:>9.2f}")
+                if args.explain and page == args.page:
+                    cursor.execute(f"EXPLAIN (ANALYZE, BUFFERS) {sql}", params)
+                    print("\n".join(f"    {row[0]}" for row in cursor.fetchall()))
+
+    cursor.close()
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
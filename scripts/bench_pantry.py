@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+# scripts/bench_pantry.py
+"""
+POST /api/v1/recipes/pantry-match 查詢的 micro-benchmark（需要已套用 migrations/0005 與 0008 的資料庫）。
+
+從資料庫中最常見的核心食材隨機組出 --pantries 組「冰箱」（每組 --size 樣食材），
+以與 API 相同的 SQL 比較兩種執行方式的延遲：
+  gin      : 預設的查詢計畫（clean_ingredients(core_ingredients) && ... 走 idx_recipes_core_ingredients_clean）
+  seqscan  : 關閉 index / bitmap scan，模擬沒有 GIN 索引時整張表逐筆比對
+用法：
+    python scripts/bench_pantry.py --pantries 200 --size 5
+"""
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+from sqlalchemy import text
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from app.db.session import engine  # noqa: E402
+from app.services.ingredient_normalizer import SYNONYMS_SQL, IngredientNormalizer  # noqa: E402
+from app.services.pantry_match import pantry_match_params, pantry_match_sql  # noqa: E402
+
+TOP_INGREDIENTS_SQL = """
+    SELECT btrim(item) AS item, count(*) AS n
+    FROM recipes, unnest(core_ingredients) AS item
+    GROUP BY 1
+    ORDER BY n DESC
+    LIMIT :top
+"""
+
+
+def run(label, conn, statements, disable_index):
+    latencies, results = [], []
+    for params in statements:
+        with conn.begin():
+            if disable_index:
+                conn.execute(text("SET LOCAL enable_bitmapscan = off"))
+                conn.execute(text("SET LOCAL enable_indexscan = off"))
+            start = time.perf_counter()
+            rows = conn.execute(text(pantry_match_sql()), params).fetchall()
+            latencies.append((time.perf_counter() - start) * 1000)
+            results.append(len(rows))
+    latencies.sort()
+    print(
+        f"{label:<8} p50 {statistics.median(latencies):>8.2f} ms   "
+        f"p95 {latencies[int(len(latencies) * 0.95) - 1]:>8.2f} ms   "
+        f"平均結果 {statistics.mean(results):.1f} 筆"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="食材比對查詢效能測試")
+    parser.add_argument("--pantries", type=int, default=200, help="隨機產生幾組食材")
+    parser.add_argument("--size", type=int, default=5, help="每組的食材數")
+    parser.add_argument("--top", type=int, default=200, help="從最常見的前幾名食材中抽樣")
+    parser.add_argument("--limit", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--explain", action="store_true", help="印出第一組食材的查詢計畫")
+    args = parser.parse_args()
+
+    with engine.connect() as conn:
+        normalizer = IngredientNormalizer({r.alias: r.canonical for r in conn.execute(text(SYNONYMS_SQL))})
+        top = [r.item for r in conn.execute(text(TOP_INGREDIENTS_SQL), {"top": args.top})]
+        total = conn.execute(text("SELECT count(*) FROM recipes")).scalar()
+        conn.commit()
+        if len(top) < args.size:
+            print("資料庫中的食材種類不足，請先匯入食譜並套用 migrations。")
+            return
+
+        rng = random.Random(args.seed)
+        statements = [
+            pantry_match_params(normalizer, rng.sample(top, args.size), args.limit)[1]
+            for _ in range(args.pantries)
+        ]
+        print(f"recipes 共 {total} 筆：{args.pantries} 組食材，每組 {args.size} 樣（取自最常見的 {len(top)} 種）")
+
+        if args.explain:
+            with conn.begin():
+                plan = conn.execute(text(f"EXPLAIN (ANALYZE, BUFFERS) {pantry_match_sql()}"), statements[0])
+                print("\n".join(f"    {row[0]}" for row in plan))
+
+        run("gin", conn, statements, disable_index=False)
+        run("seqscan", conn, statements, disable_index=True)
+
+
+if __name__ == "__main__":
+    main()
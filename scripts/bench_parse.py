@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+# scripts/bench_parse.py
+"""
+比較 crawler.py 各 HTML 解析後端的效能（pages/sec）。
+
+語料為 crawler.py --save-html 保存的原始頁面（Big5-HKSCS 位元組）。
+每個後端分別以單一 process 與 ProcessPoolExecutor 解析整份語料，
+並以 html.parser 的結果為基準，檢查其他後端解析出的內容是否一致。
+用法：
+    python scripts/crawler.py --save-html html_corpus     # 先蒐集語料
+    python scripts/bench_parse.py html_corpus --workers 4
+"""
+
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from crawler import PARSER_BACKENDS, parse_page
+
+
+def load_corpus(directory, limit):
+    files = sorted(Path(directory).glob("*.html"))
+    if limit:
+        files = files[:limit]
+    return [(f.name, f.read_bytes()) for f in files]
+
+
+def parse_all(pages, backend, workers):
+    """回傳 (解析結果, 耗時秒數)；workers 為 0 時在目前的 process 中依序解析"""
+    start = time.perf_counter()
+    if workers:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(
+                parse_page, [raw for _, raw in pages], [name for name, _ in pages],
+                [backend] * len(pages), chunksize=16,
+            ))
+    else:
+        results = [parse_page(raw, name, backend) for name, raw in pages]
+    return results, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="HTML 解析後端效能測試")
+    parser.add_argument("corpus", help="保存原始頁面的目錄")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--limit", type=int, default=0, help="最多使用幾頁（0 表示全部）")
+    parser.add_argument("--backends", nargs="+", choices=PARSER_BACKENDS, default=PARSER_BACKENDS)
+    args = parser.parse_args()
+
+    pages = load_corpus(args.corpus, args.limit)
+    if not pages:
+        print(f"{args.corpus} 中沒有 .html 檔案，請先以 crawler.py --save-html 蒐集語料。")
+        return
+    print(f"語料：{len(pages)} 頁，{sum(len(raw) for _, raw in pages) / 1e6:.1f} MB；pool 使用 {args.workers} 個 process")
+    print(f"{'backend':<12} {'1 process':>12} {'pool':>12} {'pool/core':>12}  與 html.parser 不同")
+
+    baseline = None
+    for backend in args.backends:
+        try:
+            single, single_time = parse_all(pages, backend, 0)
+        except Exception as e:
+            print(f"{backend:<12} 無法使用：{e}", file=sys.stderr)
+            continue
+        _, pool_time = parse_all(pages, backend, args.workers)
+        if baseline is None and backend == "html.parser":
+            baseline = single
+        diff = "-" if baseline is None else str(sum(a != b for a, b in zip(single, baseline)))
+        print(
+            f"{backend:<12} {len(pages) / single_time:>10.1f}/s {len(pages) / pool_time:>10.1f}/s "
+            f"{len(pages) / pool_time / args.workers:>10.1f}/s  {diff}"
+        )
+
+
+if __name__ == "__main__":
+    main()
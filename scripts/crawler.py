@@ -1,10 +1,23 @@
+import argparse
 import asyncio
 import aiohttp
 import aiofiles
 from bs4 import BeautifulSoup
+from concurrent.futures import ProcessPoolExecutor
+from frontier import Frontier
+from http_cache import HttpCache
+from rate_control import HostRateControllers, parse_retry_after, report_stats
+import hashlib
 import json
+import os
 import time
-import random
+
+# 可選的 HTML 解析後端；lxml 與 selectolax 需另外安裝（見 requirements.txt）
+PARSER_BACKENDS = ["html.parser", "lxml", "selectolax"]
+
+# 成功解析、內容為空與已不存在的網址都記入 ledger，重新執行時略過；
+# 連線失敗的網址不記錄，下次會重試
+LEDGER_DONE_STATUSES = {"ok", "unchanged", "empty", "gone"}
 
 # ... parse_ytower_recipe_content 函式保持不變，它已經被驗證是正確的 ...
 def parse_ytower_recipe_content(soup: BeautifulSoup, url: str) -> dict:
@@ -14,6 +27,7 @@ def parse_ytower_recipe_content(soup: BeautifulSoup, url: str) -> dict:
         "full_ingredient_list": {}, "steps": [], "total_time": None,
         "difficulty": None, "cuisine_style": None, "servings": None,
         "key_equipment": None, "tips": None, "nutrition_info": None,
+        "source_url": url,
     }
     title_tag = soup.find('div', id='recipe_name')
     if title_tag:
@@ -43,81 +57,322 @@ def parse_ytower_recipe_content(soup: BeautifulSoup, url: str) -> dict:
     return recipe_data
 
 
-async def fetch_and_parse(session: aiohttp.ClientSession, url: str, semaphore: asyncio.Semaphore, retries=2):
-    async with semaphore:
-        await asyncio.sleep(random.uniform(2.0, 5.0)) # 拉長並拉大隨機延遲範圍
-        for attempt in range(retries):
+def parse_ytower_recipe_selectolax(html: str, url: str) -> dict:
+    """
+    與 parse_ytower_recipe_content 相同的解析規則，改用 selectolax 的 CSS selector。
+    """
+    from selectolax.lexbor import LexborHTMLParser
+
+    tree = LexborHTMLParser(html)
+    recipe_data = {
+        "name": None, "image_url": None, "core_ingredients": [],
+        "full_ingredient_list": {}, "steps": [], "total_time": None,
+        "difficulty": None, "cuisine_style": None, "servings": None,
+        "key_equipment": None, "tips": None, "nutrition_info": None,
+        "source_url": url,
+    }
+    title_tag = tree.css_first('div#recipe_name')
+    if title_tag:
+        recipe_data['name'] = title_tag.text(strip=True)
+    image_meta_tag = tree.css_first('meta[property="og:image"]')
+    if image_meta_tag:
+        recipe_data['image_url'] = image_meta_tag.attributes.get('content')
+    for ul in tree.css('ul.ingredient'):
+        group_title_tag = ul.css_first('li')
+        if not group_title_tag: continue
+        group_title = group_title_tag.text(strip=True)
+        group_ingredients = {}
+        for item in ul.css('span.ingredient_name'):
+            name_tag = item.css_first('a')
+            amount_tag = item.css_first('span.ingredient_amount')
+            name = name_tag.text(strip=True) if name_tag else ''
+            amount = amount_tag.text(strip=True) if amount_tag else ''
+            if name:
+                group_ingredients[name] = amount
+        recipe_data['full_ingredient_list'][group_title] = group_ingredients
+        if '【材　料】' in group_title:
+            recipe_data['core_ingredients'].extend(group_ingredients.keys())
+    recipe_data['steps'] = [step.text(separator='\n', strip=True) for step in tree.css('li.step')]
+    return recipe_data
+
+
+def parse_page(raw: bytes, url: str, backend: str = "html.parser") -> dict:
+    """
+    解析一頁原始 HTML：在 worker process 中完成 Big5-HKSCS 解碼與 DOM 解析，
+    避免 CPU 密集的工作卡住 event loop（thread 受 GIL 限制，無法真正並行）。
+    """
+    html_content = raw.decode('big5-hkscs', errors='ignore')
+    if backend == "selectolax":
+        return parse_ytower_recipe_selectolax(html_content, url)
+    soup = BeautifulSoup(html_content, backend)
+    return parse_ytower_recipe_content(soup, url)
+
+
+async def fetch_and_parse(session: aiohttp.ClientSession, url: str, controllers: HostRateControllers, retries=3,
+                          parse_pool: ProcessPoolExecutor = None, parser: str = "html.parser", save_html: str = None,
+                          cache: HttpCache = None):
+    """
+    回傳 (狀態, 食譜資料)，狀態為 "ok"、"unchanged"（與上次爬取相同）、"empty"（頁面無內容）、
+    "gone"（404/410）或 "failed"（重試後仍失敗）。
+    送出時間由該主機的自適應速率控制器決定；下載在 event loop 上進行，
+    解碼與解析交給 parse_pool 的 worker process。
+    提供 cache 時會送出條件請求，未變動的頁面不解析也不回傳食譜。
+    """
+    controller = controllers.for_url(url)
+    request_headers = cache.conditional_headers(url) if cache else {}
+    for attempt in range(retries):
+        async with controller.slot():
+            start = time.monotonic()
             try:
-                async with session.get(url, timeout=30) as response:
-                    if response.status >= 400: # 捕捉所有客戶端和伺服器錯誤
-                        print(f"🟡 請求異常 (狀態碼: {response.status}) 於 {url}, 準備重試 (第 {attempt + 1}/{retries} 次)")
-                        await asyncio.sleep(5 * (attempt + 1))
-                        continue
-                    
-                    html_content = await response.text(encoding='big5-hkscs', errors='ignore')
-                    soup = BeautifulSoup(html_content, 'html.parser')
-                    data = await asyncio.to_thread(parse_ytower_recipe_content, soup, url)
-                    
-                    if not data or not data.get('name'):
-                        # 即使狀態碼200，也可能回傳無效頁面，需增加判斷
-                        print(f"⚠️ 內容解析為空: {url}")
-                        return None
-
-                    print('.', end='', flush=True)
-                    return data
+                async with session.get(url, headers=request_headers, timeout=aiohttp.ClientTimeout(total=30)) as response:
+                    status = response.status
+                    retry_after = parse_retry_after(response.headers.get('Retry-After'))
+                    etag = response.headers.get('ETag')
+                    last_modified = response.headers.get('Last-Modified')
+                    raw = await response.read() if status < 300 else None
             except Exception as e:
+                controller.record(None, time.monotonic() - start)
                 print(f"❌ 處理時發生錯誤: {url}, 錯誤: {e}")
-                if attempt == retries - 1: return None
-        return None
-
-async def main():
-    urls_file = 'unique_urls.txt'
-    try:
-        async with aiofiles.open(urls_file, mode='r', encoding='utf-8') as f:
-            target_urls = [line.strip() for line in await f.readlines() if line.strip()]
-    except FileNotFoundError:
-        print(f"錯誤：找不到連結檔案 '{urls_file}'。")
-        return
-
-    print(f"從 {urls_file} 讀取到 {len(target_urls)} 個食譜連結...")
+                continue
+            controller.record(status, time.monotonic() - start, retry_after)
+
+        if status == 304 and cache:
+            cache.mark_not_modified(url)
+            return "unchanged", None
+        if status in (404, 410):
+            print(f"🟡 頁面不存在 (狀態碼: {status}) 於 {url}")
+            return "gone", None
+        if status >= 400: # 其餘客戶端與伺服器錯誤，等待控制器的退避後重試
+            print(f"🟡 請求異常 (狀態碼: {status}) 於 {url}, 準備重試 (第 {attempt + 1}/{retries} 次)")
+            continue
+        if status != 200:
+            # 3xx（包含沒有快取時的 304）沒有可解析的內容，同樣視為失敗並重試
+            print(f"🟡 非預期的狀態碼 {status} 於 {url}, 準備重試 (第 {attempt + 1}/{retries} 次)")
+            continue
+
+        if cache and cache.is_same_content(url, raw):
+            # 主機不支援條件請求，但頁面與上次完全相同（上次已成功解析），不必解析
+            cache.store_page(url, etag, last_modified, raw)
+            cache.same_content += 1
+            return "unchanged", None
+
+        try:
+            if save_html:
+                await save_raw_html(save_html, url, raw)
+            loop = asyncio.get_running_loop()
+            data = await loop.run_in_executor(parse_pool, parse_page, raw, url, parser)
+        except Exception as e:
+            # 寫檔或解析失敗（包含 worker process 異常結束）只影響這個網址
+            print(f"❌ 解析時發生錯誤: {url}, 錯誤: {e}")
+            return "failed", None
+
+        if not data or not data.get('name'):
+            # 即使狀態碼200，也可能回傳無效頁面，需增加判斷
+            print(f"⚠️ 內容解析為空: {url}")
+            return "empty", None
+        # 解析成功後才記錄驗證標頭與頁面雜湊；解析失敗或內容為空時若先記錄，
+        # 下次 --refresh 會收到 304 或判定內容相同，這個網址就再也不會被解析
+        if cache:
+            cache.store_page(url, etag, last_modified, raw)
+            if not cache.store_recipe(url, data):
+                return "unchanged", None
+
+        print('.', end='', flush=True)
+        return "ok", data
+    return "failed", None
+
+async def save_raw_html(directory: str, url: str, raw: bytes):
+    """保存原始頁面，供 scripts/bench_parse.py 當作測試語料"""
+    name = hashlib.sha1(url.encode('utf-8')).hexdigest()[:16] + '.html'
+    async with aiofiles.open(os.path.join(directory, name), 'wb') as f:
+        await f.write(raw)
+
+
+def load_ledger(ledger_file: str) -> set:
+    """讀出已完成的網址（ledger 每行為「網址<TAB>狀態」）"""
+    done = set()
+    if not os.path.exists(ledger_file):
+        return done
+    with open(ledger_file, 'r', encoding='utf-8') as f:
+        for line in f:
+            url, _, status = line.rstrip('\n').partition('\t')
+            if url and status in LEDGER_DONE_STATUSES:
+                done.add(url)
+    return done
+
+
+def compact(jsonl_file: str, output_file: str) -> int:
+    """
+    把 JSON Lines 輸出整理成 importer 使用的 JSON 陣列。
+    同一網址重複爬取時保留最後一筆；逐行讀寫，不會把全部食譜載入記憶體。
+    """
+    last_line = {}
+    with open(jsonl_file, 'r', encoding='utf-8') as f:
+        for lineno, line in enumerate(f):
+            if line.strip():
+                last_line[json.loads(line).get('source_url') or f"#{lineno}"] = lineno
+    keep = set(last_line.values())
+
+    count = 0
+    tmp_file = output_file + '.tmp'
+    with open(jsonl_file, 'r', encoding='utf-8') as f, open(tmp_file, 'w', encoding='utf-8') as out:
+        out.write('[\n')
+        for lineno, line in enumerate(f):
+            if lineno not in keep:
+                continue
+            if count:
+                out.write(',\n')
+            out.write(json.dumps(json.loads(line), ensure_ascii=False, indent=4))
+            count += 1
+        out.write('\n]\n')
+    os.replace(tmp_file, output_file)
+    return count
+
+
+async def main(args):
+    frontier = None
+    if args.frontier:
+        # 從 frontier 取得待爬網址（new 與已到重試時間的 retry-after），狀態由 frontier 追蹤
+        frontier = Frontier(args.frontier)
+        target_urls = frontier.pending(limit=args.limit, include_fetched=args.refresh)
+        print(f"frontier 中有 {len(target_urls)} 個待爬的食譜連結（{frontier.stats()}）")
+    else:
+        urls_file = args.urls
+        try:
+            async with aiofiles.open(urls_file, mode='r', encoding='utf-8') as f:
+                target_urls = [line.strip() for line in await f.readlines() if line.strip()]
+        except FileNotFoundError:
+            print(f"錯誤：找不到連結檔案 '{urls_file}'。")
+            return
+
+        print(f"從 {urls_file} 讀取到 {len(target_urls)} 個食譜連結...")
+        done_urls = set() if args.refresh else load_ledger(args.ledger)
+        if done_urls:
+            target_urls = [url for url in target_urls if url not in done_urls]
+            print(f"ledger 中已有 {len(done_urls)} 個完成的連結，本次需處理 {len(target_urls)} 個。")
+        if args.limit:
+            target_urls = target_urls[:args.limit]
     
     headers = {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/114.0.0.0 Safari/537.36'}
     
     # --- 戰術參數調整 ---
-    BATCH_SIZE = 50  # 每 50 個 URL 為一個批次
-    CONCURRENT_REQUESTS = 5 # 非常保守的並發數
-    
-    all_recipes = []
+    BATCH_SIZE = args.batch_size  # 每批的 URL 數（預設 50），也是寫入進度的單位
+    CONCURRENT_REQUESTS = args.concurrency # 同時進行的請求數上限（預設 5）
+
+    # 依主機回應自動調整速率，取代固定的隨機休息
+    controllers = HostRateControllers(
+        initial_rate=args.initial_rate, max_rate=args.max_rate,
+        target_latency=args.target_latency, max_in_flight=CONCURRENT_REQUESTS,
+    )
     
-    for i in range(0, len(target_urls), BATCH_SIZE):
-        batch_urls = target_urls[i:i + BATCH_SIZE]
-        print(f"\n--- 正在處理批次 {i // BATCH_SIZE + 1} (URL {i+1} - {i+len(batch_urls)}) ---")
-        
-        # 為每一個批次建立全新的 Session 和 Connector
-        connector = aiohttp.TCPConnector(limit_per_host=5)
-        semaphore = asyncio.Semaphore(CONCURRENT_REQUESTS)
-        
-        async with aiohttp.ClientSession(headers=headers, connector=connector) as session:
-            tasks = [asyncio.create_task(fetch_and_parse(session, url, semaphore)) for url in batch_urls]
-            results = await asyncio.gather(*tasks)
-            
-            all_recipes.extend([res for res in results if res])
-            
-        # 一個批次結束後，隨機休息 8 到 15 秒
-        sleep_duration = random.uniform(8, 15)
-        print(f"\n批次完成，隨機休息 {sleep_duration:.2f} 秒...")
-        await asyncio.sleep(sleep_duration)
-
-    output_filename = 'recipes_data.json'
-    async with aiofiles.open(output_filename, 'w', encoding='utf-8') as f:
-        await f.write(json.dumps(all_recipes, ensure_ascii=False, indent=4))
-
-    print(f"\n全部爬取完成！共 {len(target_urls)} 個連結，成功解析 {len(all_recipes)} 筆食譜。")
-    print(f"結果已儲存至 {output_filename}")
+    parsed_count = 0
+    failed_count = 0
+
+    # 每筆食譜完成就附加到 JSON Lines 檔，ledger 在食譜寫入後才記錄；
+    # 兩者在每個批次結束時 flush + fsync，中斷時最多只會損失當前批次
+    if args.save_html:
+        os.makedirs(args.save_html, exist_ok=True)
+    parse_pool = ProcessPoolExecutor(max_workers=args.parse_workers)
+    # 只有 --refresh 才使用 HTTP 快取：一般爬取要輸出每一筆食譜，
+    # 若沿用快取，304 或內容相同的頁面會被略過，ledger 遺失的網址就再也不會輸出
+    cache = HttpCache(args.http_cache) if args.refresh else None
+
+    async with aiofiles.open(args.output, 'a', encoding='utf-8') as out, \
+            aiofiles.open(args.ledger, 'a', encoding='utf-8') as ledger:
+
+        async def crawl(session, url):
+            nonlocal parsed_count, failed_count
+            status, data = await fetch_and_parse(
+                session, url, controllers,
+                parse_pool=parse_pool, parser=args.parser, save_html=args.save_html, cache=cache,
+            )
+            if data:
+                await out.write(json.dumps(data, ensure_ascii=False) + '\n')
+                parsed_count += 1
+            if status in LEDGER_DONE_STATUSES:
+                await ledger.write(f"{url}\t{status}\n")
+            else:
+                failed_count += 1
+            if frontier:
+                if status == "gone":
+                    frontier.mark_failed(url, error=status, permanent=True)
+                elif status == "failed":
+                    frontier.mark_failed(url, error=status)
+                else:
+                    frontier.mark_fetched(url)
+
+        # 整個爬取過程共用一個 session，保留 keep-alive 連線
+        connector = aiohttp.TCPConnector(limit_per_host=CONCURRENT_REQUESTS)
+        stats_task = asyncio.create_task(report_stats(controllers, args.stats_interval))
+        try:
+            async with aiohttp.ClientSession(headers=headers, connector=connector) as session:
+                for i in range(0, len(target_urls), BATCH_SIZE):
+                    batch_urls = target_urls[i:i + BATCH_SIZE]
+                    print(f"\n--- 正在處理批次 {i // BATCH_SIZE + 1} (URL {i+1} - {i+len(batch_urls)}) ---")
+
+                    tasks = [asyncio.create_task(crawl(session, url)) for url in batch_urls]
+                    # 單一網址的例外不應中斷整個批次（其他任務仍在進行，ledger 也還沒 flush）
+                    for url, result in zip(batch_urls, await asyncio.gather(*tasks, return_exceptions=True)):
+                        if isinstance(result, Exception):
+                            failed_count += 1
+                            print(f"❌ 處理時發生錯誤: {url}, 錯誤: {result}")
+
+                    for f in (out, ledger):
+                        await f.flush()
+                        await asyncio.to_thread(os.fsync, f.fileno())
+                    if cache:
+                        cache.commit()
+                    if frontier:
+                        frontier.commit()
+                    print(f"\n批次完成：{controllers.format_stats()}")
+        finally:
+            stats_task.cancel()
+
+    parse_pool.shutdown()
+    if cache:
+        cache.close()
+        print(f"\nHTTP 快取：{cache.summary()}")
+    if frontier:
+        frontier.close()
+    print(f"\n本次爬取完成！共 {len(target_urls)} 個連結，成功解析 {parsed_count} 筆食譜，失敗 {failed_count} 個（下次執行會重試）。")
+    print(f"結果已附加至 {args.output}，執行 --compact 可產生 {args.compact_output}")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="楊桃美食網食譜爬蟲")
+    parser.add_argument("--urls", default="unique_urls.txt", help="食譜連結清單")
+    parser.add_argument("--frontier", help="改從 frontier（scripts/frontier.py）取得待爬網址並回寫狀態")
+    parser.add_argument("--limit", type=int, default=0, help="本次最多爬取幾個網址（0 表示全部）")
+    parser.add_argument("--output", help="逐筆附加的 JSON Lines 輸出"
+                        "（預設 recipes_data.jsonl；--refresh 時為 recipes_changed.jsonl）")
+    parser.add_argument("--refresh", action="store_true",
+                        help="重新檢查所有網址（忽略 ledger），只輸出內容有變動的食譜")
+    parser.add_argument("--http-cache", default="crawl_cache.sqlite", help="ETag / Last-Modified / 內容雜湊快取（僅 --refresh 使用）")
+    parser.add_argument("--ledger", default="crawled_urls.txt", help="已完成網址的紀錄檔")
+    parser.add_argument("--batch-size", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=5, help="同時進行的請求數上限")
+    parser.add_argument("--initial-rate", type=float, default=1.0, help="起始速率（每秒請求數）")
+    parser.add_argument("--max-rate", type=float, default=10.0, help="速率上限（每秒請求數）")
+    parser.add_argument("--target-latency", type=float, default=2.0, help="延遲超過此秒數即降速")
+    parser.add_argument("--stats-interval", type=float, default=10.0, help="印出即時狀態的間隔秒數")
+    parser.add_argument("--parser", choices=PARSER_BACKENDS, default="html.parser", help="HTML 解析後端")
+    parser.add_argument("--parse-workers", type=int, default=os.cpu_count(), help="解析用的 process 數")
+    parser.add_argument("--save-html", help="同時把原始頁面存到此目錄（供 bench_parse.py 使用）")
+    parser.add_argument("--compact", action="store_true", help="不爬取，只把 JSON Lines 整理成 JSON 陣列")
+    parser.add_argument("--compact-output", default="recipes_data.json")
+    args = parser.parse_args()
+    if args.output is None:
+        args.output = "recipes_changed.jsonl" if args.refresh else "recipes_data.jsonl"
+    return args
 
 
 if __name__ == "__main__":
-    start_time = time.time()
-    asyncio.run(main())
-    end_time = time.time()
-    print(f"總耗時: {end_time - start_time:.2f} 秒")
\ No newline at end of file
+    args = parse_args()
+    if args.compact:
+        count = compact(args.output, args.compact_output)
+        print(f"已將 {count} 筆食譜整理至 {args.compact_output}")
+    else:
+        start_time = time.time()
+        asyncio.run(main(args))
+        end_time = time.time()
+        print(f"總耗時: {end_time - start_time:.2f} 秒")
\ No newline at end of file
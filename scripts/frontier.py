@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+# scripts/frontier.py
+"""
+食譜網址的 frontier（SQLite）。
+
+所有網址都以食譜的 seq 正規化（大寫、去除 IsMobile 等其他參數），同一道食譜只會有一筆。
+合併網址檔時只讀取上次之後新增的部分，不必重寫整個清單；
+每個網址記錄爬取狀態，crawler.py --frontier 可以直接從這裡取得待爬的網址。
+
+狀態：
+    new          尚未爬取
+    fetched      已爬取（成功、內容為空或未變動）
+    retry-after  暫時失敗，retry_at 之後再試
+    failed       頁面不存在，或重試次數用盡
+
+用法：
+    python scripts/frontier.py merge ytower_recipe_urls*.txt unique_urls.txt
+    python scripts/frontier.py stats
+    python scripts/frontier.py export --output unique_urls.txt
+    python scripts/frontier.py retry-failed
+"""
+
+import argparse
+import hashlib
+import os
+import sqlite3
+import time
+from urllib.parse import parse_qsl, urlsplit
+
+RECIPE_URL = "https://www.ytower.com.tw/recipe/iframe-recipe.asp?seq={seq}"
+STATES = ["new", "fetched", "retry-after", "failed"]
+
+
+def canonical_seq(url: str):
+    """取出食譜網址的 seq（不分大小寫）；不是食譜網址時回傳 None"""
+    parts = urlsplit(url.strip())
+    if not parts.path.lower().endswith("iframe-recipe.asp"):
+        return None
+    for key, value in parse_qsl(parts.query):
+        if key.lower() == "seq" and value.strip():
+            return value.strip().upper()
+    return None
+
+
+def canonical_url(url: str):
+    seq = canonical_seq(url)
+    return RECIPE_URL.format(seq=seq) if seq else None
+
+
+class Frontier:
+    def __init__(self, path: str = "frontier.sqlite", max_attempts: int = 5, backoff_base: float = 300.0):
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.conn = sqlite3.connect(path)
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS urls (
+                seq        TEXT PRIMARY KEY,
+                url        TEXT NOT NULL,
+                state      TEXT NOT NULL DEFAULT 'new',
+                attempts   INTEGER NOT NULL DEFAULT 0,
+                retry_at   REAL,
+                last_error TEXT,
+                source     TEXT,
+                updated_at REAL
+            );
+            CREATE INDEX IF NOT EXISTS idx_urls_state ON urls (state, retry_at);
+            -- 已合併過的網址檔、讀到的位置與已讀部分的雜湊，下次只讀新增的部分
+            CREATE TABLE IF NOT EXISTS sources (
+                path        TEXT PRIMARY KEY,
+                offset      INTEGER NOT NULL,
+                size        INTEGER NOT NULL,
+                prefix_hash TEXT
+            );
+        """)
+        columns = {row[1] for row in self.conn.execute("PRAGMA table_info(sources)")}
+        if "prefix_hash" not in columns:
+            # 舊版的 frontier 沒有這個欄位；沒有雜湊的檔案下次會從頭讀取
+            self.conn.execute("ALTER TABLE sources ADD COLUMN prefix_hash TEXT")
+        self.conn.commit()
+
+    def add_urls(self, urls, source=None) -> int:
+        """加入網址（已存在的 seq 會被略過），回傳新增筆數"""
+        now = time.time()
+        rows = [(seq, RECIPE_URL.format(seq=seq), source, now)
+                for seq in filter(None, (canonical_seq(u) for u in urls))]
+        before = self.conn.total_changes
+        self.conn.executemany(
+            "INSERT OR IGNORE INTO urls (seq, url, source, updated_at) VALUES (?, ?, ?, ?)", rows
+        )
+        self.conn.commit()
+        return self.conn.total_changes - before
+
+    def merge_file(self, path: str):
+        """
+        合併一個網址檔，回傳 (讀取行數, 新增筆數)。
+        同一個檔案只讀取上次合併之後附加的內容；已讀過的部分與上次的雜湊不同
+        （檔案被重寫，即使大小不變或變大）時從頭讀取，重複的網址由 INSERT OR IGNORE 略過。
+        """
+        key = os.path.abspath(path)
+        size = os.path.getsize(path)
+        row = self.conn.execute("SELECT offset, prefix_hash FROM sources WHERE path = ?", (key,)).fetchone()
+        with open(path, "rb") as f:
+            offset, digest = 0, hashlib.sha256()
+            if row and row[1] and row[0] <= size:
+                prefix = hashlib.sha256(f.read(row[0]))
+                if prefix.hexdigest() == row[1]:
+                    offset, digest = row[0], prefix
+                else:
+                    f.seek(0)
+            data = f.read()
+        # 最後一行若沒有換行，可能還在寫入中，留到下次再讀
+        end = data.rfind(b"\n") + 1
+        digest.update(data[:end])
+        lines = data[:end].decode("utf-8").splitlines()
+        added = self.add_urls(lines, source=os.path.basename(path))
+        self.conn.execute(
+            "INSERT INTO sources (path, offset, size, prefix_hash) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT (path) DO UPDATE SET offset = excluded.offset, size = excluded.size, "
+            "prefix_hash = excluded.prefix_hash",
+            (key, offset + end, size, digest.hexdigest()),
+        )
+        self.conn.commit()
+        return len(lines), added
+
+    def pending(self, limit=None, now=None, include_fetched=False):
+        """
+        待爬的網址：new，以及已到重試時間的 retry-after，依 seq 排序。
+        include_fetched 為 True 時（定期重新爬取）也包含已爬過的網址。
+        """
+        now = time.time() if now is None else now
+        states = "('new', 'fetched')" if include_fetched else "('new')"
+        sql = (f"SELECT url FROM urls WHERE state IN {states} "
+               "OR (state = 'retry-after' AND retry_at <= ?) ORDER BY seq")
+        params = [now]
+        if limit:
+            sql += " LIMIT ?"
+            params.append(limit)
+        return [row[0] for row in self.conn.execute(sql, params)]
+
+    def mark_fetched(self, url: str):
+        self.conn.execute(
+            "UPDATE urls SET state = 'fetched', attempts = 0, retry_at = NULL, "
+            "last_error = NULL, updated_at = ? WHERE seq = ?",
+            (time.time(), canonical_seq(url)),
+        )
+
+    def mark_failed(self, url: str, error: str = None, permanent: bool = False, retry_after: float = None):
+        """
+        記錄失敗：permanent 或重試次數用盡時標為 failed，
+        否則標為 retry-after，並以指數退避（或主機指定的 retry_after 秒數）排定下次重試。
+        """
+        seq = canonical_seq(url)
+        row = self.conn.execute("SELECT attempts FROM urls WHERE seq = ?", (seq,)).fetchone()
+        attempts = (row[0] if row else 0) + 1
+        now = time.time()
+        if permanent or attempts >= self.max_attempts:
+            state, retry_at = "failed", None
+        else:
+            state = "retry-after"
+            retry_at = now + (retry_after if retry_after is not None else self.backoff_base * 2 ** (attempts - 1))
+        self.conn.execute(
+            "UPDATE urls SET state = ?, attempts = ?, retry_at = ?, last_error = ?, updated_at = ? WHERE seq = ?",
+            (state, attempts, retry_at, error, now, seq),
+        )
+
+    def retry_failed(self) -> int:
+        cur = self.conn.execute(
+            "UPDATE urls SET state = 'new', attempts = 0, retry_at = NULL WHERE state IN ('failed', 'retry-after')"
+        )
+        self.conn.commit()
+        return cur.rowcount
+
+    def commit(self):
+        self.conn.commit()
+
+    def close(self):
+        self.conn.commit()
+        self.conn.close()
+
+    def stats(self) -> dict:
+        counts = dict(self.conn.execute("SELECT state, count(*) FROM urls GROUP BY state").fetchall())
+        return {state: counts.get(state, 0) for state in STATES}
+
+    def export(self, output_file: str) -> int:
+        """輸出排序好的正規化網址清單（與 unique_urls.txt 格式相同）"""
+        count = 0
+        with open(output_file, "w", encoding="utf-8") as f:
+            for (url,) in self.conn.execute("SELECT url FROM urls ORDER BY seq"):
+                f.write(url + "\n")
+                count += 1
+        return count
+
+
+def main():
+    parser = argparse.ArgumentParser(description="食譜網址 frontier")
+    parser.add_argument("--db", default="frontier.sqlite")
+    sub = parser.add_subparsers(dest="command", required=True)
+    merge = sub.add_parser("merge", help="合併網址檔（只讀取新增的部分）")
+    merge.add_argument("files", nargs="+")
+    sub.add_parser("stats", help="各狀態的網址數")
+    export = sub.add_parser("export", help="輸出排序好的網址清單")
+    export.add_argument("--output", default="unique_urls.txt")
+    sub.add_parser("retry-failed", help="把失敗的網址重設為 new")
+    args = parser.parse_args()
+
+    frontier = Frontier(args.db)
+    if args.command == "merge":
+        for path in args.files:
+            try:
+                read, added = frontier.merge_file(path)
+            except FileNotFoundError:
+                print(f"  [警告] 找不到檔案 '{path}'，已跳過。")
+                continue
+            print(f"  {path}: 讀取 {read} 行，新增 {added} 個網址")
+    elif args.command == "export":
+        print(f"已輸出 {frontier.export(args.output)} 個網址至 {args.output}")
+    elif args.command == "retry-failed":
+        print(f"已重設 {frontier.retry_failed()} 個網址")
+    print("狀態：" + "、".join(f"{state} {n}" for state, n in frontier.stats().items()))
+    frontier.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,30 @@
+import argparse
+import asyncio
 import requests
+import aiohttp
 from bs4 import BeautifulSoup
-from urllib.parse import urljoin
+from urllib.parse import urljoin, quote
 import time
 
+from rate_control import HostRateControllers, parse_retry_after, report_stats
+
+PAGER_URL = 'https://www.ytower.com.tw/recipe/pager.asp'
+HEADERS = {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/114.0.0.0 Safari/537.36'}
+
+
+def category_url(mainfood: str) -> str:
+    """由分類名稱（例如「葉菜類」）組出 pager.asp 的基礎 URL；參數需以 Big5 編碼"""
+    return f"{PAGER_URL}?MAINFOOD={quote(mainfood.encode('big5'))}&IsMobile=0"
+
+
+def extract_recipe_urls(html: str, base_api_url: str) -> list:
+    """取出一頁中所有食譜的絕對網址；頁面為空時回傳空清單"""
+    if len(html.strip()) < 50: # 用一個很小的長度作為閾值
+        return []
+    soup = BeautifulSoup(html, 'html.parser')
+    recipe_links = soup.find_all('a', href=lambda href: href and 'iframe-recipe.asp' in href)
+    return [urljoin(base_api_url, link['href']) for link in recipe_links]
+
 def collect_recipe_urls(base_api_url: str, output_file: str):
     """
     從一個基礎的分類 API URL 開始，自動翻頁並收集所有食譜的獨立連結。
@@ -69,8 +91,158 @@ def collect_recipe_urls(base_api_url: str, output_file: str):
     print(f"結果已儲存至: {output_file}")
 
 
+async def fetch_pager_page(session, controllers, base_api_url: str, page: int, retries=3) -> list:
+    """非同步抓取一頁 pager.asp，回傳該頁的食譜網址"""
+    url = f"{base_api_url}&page={page}"
+    controller = controllers.for_url(url)
+    for attempt in range(retries):
+        async with controller.slot():
+            start = time.monotonic()
+            try:
+                async with session.get(url, timeout=aiohttp.ClientTimeout(total=30)) as response:
+                    status = response.status
+                    retry_after = parse_retry_after(response.headers.get('Retry-After'))
+                    # 注意：楊桃網的 pager.asp 回傳的可能是 Big5 編碼的 HTML 片段
+                    html = await response.text(encoding='big5', errors='ignore') if status < 400 else ''
+            except Exception as e:
+                controller.record(None, time.monotonic() - start)
+                print(f"請求 API 時出錯: {url}, {e}")
+                continue
+            controller.record(status, time.monotonic() - start, retry_after)
+        if status < 400:
+            return extract_recipe_urls(html, base_api_url)
+    raise RuntimeError(f"重試 {retries} 次後仍無法取得 {url}")
+
+
+async def probe_page_count(session, controllers, base_api_url: str, cache: dict, max_pages=1000) -> int:
+    """
+    找出分類的最後一頁：先以 1, 2, 4, 8... 倍增探測到第一個空頁，再二分搜尋邊界。
+    探測時抓到的頁面存在 cache 中，之後不必重抓。
+    重試後仍失敗的頁面記錄為空頁；超過 max_pages 的頁面一律視為空頁。
+    伺服器對超出範圍的頁碼可能重複回傳最後一頁，因此連結全都已經看過的頁面也視為空頁。
+    """
+    seen = set()
+    has_new = {}
+
+    async def has_links(page):
+        if page > max_pages:
+            return False
+        if page not in has_new:
+            if page not in cache:
+                try:
+                    cache[page] = await fetch_pager_page(session, controllers, base_api_url, page)
+                except RuntimeError as e:
+                    print(f"  [警告] {e}，視為空頁")
+                    cache[page] = []
+            links = set(cache[page])
+            has_new[page] = bool(links - seen)
+            seen.update(links)
+        return has_new[page]
+
+    if not await has_links(1):
+        return 0
+    low, high = 1, 2
+    while await has_links(high):
+        low, high = high, high * 2
+    # low 有內容、high 為空
+    while high - low > 1:
+        mid = (low + high) // 2
+        if await has_links(mid):
+            low = mid
+        else:
+            high = mid
+    return low
+
+
+async def discover_category(session, controllers, base_api_url: str, max_pages=1000) -> list:
+    """探測頁數後並行抓取其餘頁面，回傳該分類所有食譜網址（含重複）"""
+    cache = {}
+    last_page = await probe_page_count(session, controllers, base_api_url, cache, max_pages)
+    remaining = [p for p in range(1, last_page + 1) if p not in cache]
+    pages = await asyncio.gather(
+        *(fetch_pager_page(session, controllers, base_api_url, p) for p in remaining), return_exceptions=True
+    )
+    failed = 0
+    for page, result in zip(remaining, pages):
+        if isinstance(result, Exception):
+            # 單頁失敗不影響其他頁面，已抓到的網址照常輸出
+            print(f"  [警告] {result}")
+            result = []
+            failed += 1
+        cache[page] = result
+    print(f"  {base_api_url}: {last_page} 頁" + (f"（{failed} 頁失敗）" if failed else ""))
+    return [url for p in range(1, last_page + 1) for url in cache[p]]
+
+
+async def discover(category_urls: list, output_file: str, concurrency: int, max_rate: float, max_pages=1000):
+    """
+    同時探索多個分類，所有請求共用同一個 session 與速率控制器，
+    結果即時去重後寫成單一排序好的網址清單，並列出各分類的數量。
+    """
+    controllers = HostRateControllers(initial_rate=2.0, max_rate=max_rate, max_in_flight=concurrency)
+    all_urls = set()
+    counts = {}
+    started = time.perf_counter()
+    stats_task = asyncio.create_task(report_stats(controllers, 10.0))
+    try:
+        async with aiohttp.ClientSession(headers=HEADERS) as session:
+            async def run(base_api_url):
+                try:
+                    urls = await discover_category(session, controllers, base_api_url, max_pages)
+                except Exception as e:
+                    # 單一分類失敗不取消其他分類，其餘分類的結果仍會寫入檔案
+                    print(f"  [警告] 探索 {base_api_url} 失敗：{e}")
+                    urls = []
+                new = set(urls) - all_urls
+                all_urls.update(new)
+                counts[base_api_url] = (len(set(urls)), len(new))
+            await asyncio.gather(*(run(u) for u in category_urls))
+    finally:
+        stats_task.cancel()
+
+    with open(output_file, 'w', encoding='utf-8') as f:
+        for url in sorted(all_urls):
+            f.write(url + '\n')
+
+    print("\n各分類結果（食譜數 / 新增的不重複連結）：")
+    for base_api_url in category_urls:
+        total, new = counts[base_api_url]
+        print(f"  {base_api_url}: {total} / {new}")
+    print(f"\n連結收集完成！共找到 {len(all_urls)} 個不重複的食譜連結，耗時 {time.perf_counter() - started:.1f} 秒。")
+    print(f"結果已儲存至: {output_file}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="收集楊桃美食網的食譜連結")
+    parser.add_argument("--mainfood", action="append", default=[], help="分類名稱，例如 葉菜類（可重複指定）")
+    parser.add_argument("--category", action="append", default=[], help="不含 page 參數的 pager.asp 網址（可重複指定）")
+    parser.add_argument("--categories-file", help="每行一個分類名稱或 pager.asp 網址")
+    # 預設不覆寫主清單 unique_urls.txt；以 frontier.py merge 合併
+    parser.add_argument("--output", default="ytower_recipe_urls2.txt")
+    parser.add_argument("--concurrency", type=int, default=8, help="同時進行的請求數上限")
+    parser.add_argument("--max-rate", type=float, default=10.0, help="速率上限（每秒請求數）")
+    parser.add_argument("--max-pages", type=int, default=1000, help="每個分類最多探測的頁數")
+    parser.add_argument("--sequential", action="store_true", help="使用舊版逐頁抓取（一次一個分類）")
+    args = parser.parse_args()
+
+    entries = list(args.category) + list(args.mainfood)
+    if args.categories_file:
+        with open(args.categories_file, 'r', encoding='utf-8') as f:
+            entries += [line.strip() for line in f if line.strip() and not line.startswith('#')]
+    category_urls = list(dict.fromkeys(e if e.startswith('http') else category_url(e) for e in entries))
+    if not category_urls:
+        # 我們將 URL 拆成不含 page 參數的基礎部分
+        category_urls = ['https://www.ytower.com.tw/recipe/pager.asp?MAINFOOD=%B8%AD%B5%E6%C3%FE&IsMobile=0']
+
+    if args.sequential:
+        # 舊版流程每個分類各自輸出一個檔案，之後再以 url_integrate.py 合併
+        stem = args.output.rsplit('.', 1)[0]
+        for i, base_api_url in enumerate(category_urls):
+            output_file = args.output if len(category_urls) == 1 else f"{stem}{i}.txt"
+            collect_recipe_urls(base_api_url=base_api_url, output_file=output_file)
+        return
+    asyncio.run(discover(category_urls, args.output, args.concurrency, args.max_rate, args.max_pages))
+
+
 if __name__ == "__main__":
-    # 我們將 URL 拆成不含 page 參數的基礎部分
-    BASE_API_URL = 'https://www.ytower.com.tw/recipe/pager.asp?MAINFOOD=%B8%AD%B5%E6%C3%FE&IsMobile=0'
-    OUTPUT_FILENAME = 'ytower_recipe_urls2.txt'
-    collect_recipe_urls(base_api_url=BASE_API_URL, output_file=OUTPUT_FILENAME)
\ No newline at end of file
+    main()
\ No newline at end of file
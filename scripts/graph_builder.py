@@ -1,18 +1,452 @@
 #!/usr/bin/env python3
 # scripts/graph_builder.py
+"""
+由 recipes 表格建立 Apache AGE 知識圖譜。
 
+用法：
+    python scripts/graph_builder.py                  # bulk 模式（預設）
+    python scripts/graph_builder.py --mode incremental  # 只同步有變動的食譜
+    python scripts/graph_builder.py --mode legacy    # 舊版逐筆 MERGE
+"""
+
+import argparse
+import hashlib
+import json
 import os
 import sys
+import time
 import psycopg2
+from psycopg2.extras import execute_values
 from dotenv import load_dotenv
 
+# 節點 label 與對應的關係類型
+VERTEX_LABELS = ["Recipe", "Ingredient", "Cuisine", "Equipment"]
+EDGE_LABELS = {
+    "HAS_INGREDIENT": "Ingredient",
+    "BELONGS_TO_CUISINE": "Cuisine",
+    "REQUIRES_EQUIPMENT": "Equipment",
+}
+
 def escape_cypher_string(s):
     """跳脫 Cypher 字串中的單引號"""
     if s is None:
         return ""
     return s.replace("'", "''")
 
+def bump_graph_version(cursor, graph_name):
+    """
+    遞增圖譜版本號。AI 服務會定期讀取此版本，
+    一旦改變就讓語意回答快取失效並重新推導 schema，避免回傳舊圖譜算出的答案。
+    """
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS public.graph_build_meta (
+            graph_name     TEXT PRIMARY KEY,
+            version        BIGINT NOT NULL DEFAULT 1,
+            built_at       TIMESTAMP WITH TIME ZONE DEFAULT now(),
+            schema         JSONB,
+            schema_version BIGINT
+        );
+    """)
+    # 舊版建立的表格沒有 schema 欄位，這裡補上（AI 服務會把推導出的 schema 快取在此）
+    cursor.execute("ALTER TABLE public.graph_build_meta ADD COLUMN IF NOT EXISTS schema JSONB;")
+    cursor.execute("ALTER TABLE public.graph_build_meta ADD COLUMN IF NOT EXISTS schema_version BIGINT;")
+    cursor.execute("""
+        INSERT INTO public.graph_build_meta (graph_name) VALUES (%s)
+        ON CONFLICT (graph_name) DO UPDATE
+        SET version = public.graph_build_meta.version + 1, built_at = now()
+        RETURNING version;
+    """, (graph_name,))
+    return cursor.fetchone()[0]
+
+def load_recipes(cursor):
+    cursor.execute(
+        "SELECT id, name, core_ingredients, cuisine_style, key_equipment FROM recipes;"
+    )
+    cols = [d[0] for d in cursor.description]
+    return [dict(zip(cols, row)) for row in cursor.fetchall()]
+
+def clean_names(values):
+    """去除空白與重複的名稱，保留原本順序"""
+    seen = []
+    for v in values or []:
+        v = (v or "").strip()
+        if v and v not in seen:
+            seen.append(v)
+    return seen
+
+def collect_graph(recipes):
+    """
+    在 Python 端先把實體節點去重，並整理出所有關係。
+    回傳 (各 label 的節點名稱集合, 各關係類型的 (recipe_id, 實體名稱) 清單)。
+    """
+    entities = {label: set() for label in EDGE_LABELS.values()}
+    edges = {label: [] for label in EDGE_LABELS}
+    for recipe in recipes:
+        rid = recipe["id"]
+        for ing in clean_names(recipe.get("core_ingredients")):
+            entities["Ingredient"].add(ing)
+            edges["HAS_INGREDIENT"].append((rid, ing))
+        for cuisine in clean_names([recipe.get("cuisine_style")]):
+            entities["Cuisine"].add(cuisine)
+            edges["BELONGS_TO_CUISINE"].append((rid, cuisine))
+        for eq in clean_names(recipe.get("key_equipment")):
+            entities["Equipment"].add(eq)
+            edges["REQUIRES_EQUIPMENT"].append((rid, eq))
+    return entities, edges
+
+def ensure_labels(cursor, graph_name):
+    """建立尚不存在的節點與關係 label（即 AGE 底層的 label 表格）"""
+    cursor.execute(
+        "SELECT l.name FROM ag_catalog.ag_label l "
+        "JOIN ag_catalog.ag_graph g ON g.graphid = l.graph WHERE g.name = %s;",
+        (graph_name,),
+    )
+    existing = {row[0] for row in cursor.fetchall()}
+    for label in VERTEX_LABELS:
+        if label not in existing:
+            cursor.execute("SELECT ag_catalog.create_vlabel(%s::cstring, %s::cstring);", (graph_name, label))
+    for label in EDGE_LABELS:
+        if label not in existing:
+            cursor.execute("SELECT ag_catalog.create_elabel(%s::cstring, %s::cstring);", (graph_name, label))
+
+def insert_vertices(cursor, graph_name, label, properties, key, batch_size):
+    """
+    直接寫入 label 表格（與 AGE 的 load_labels_from_file 相同做法），
+    以 execute_values 批次插入，回傳 {key 屬性值: graphid}。
+    """
+    ids = {}
+    for start in range(0, len(properties), batch_size):
+        batch = properties[start:start + batch_size]
+        rows = execute_values(
+            cursor,
+            f'INSERT INTO "{graph_name}"."{label}" (properties) VALUES %s '
+            f'RETURNING id::text, properties::text',
+            [(json.dumps(p, ensure_ascii=False),) for p in batch],
+            template="(%s::ag_catalog.agtype)",
+            page_size=batch_size,
+            fetch=True,
+        )
+        for graphid, props in rows:
+            ids[json.loads(props)[key]] = graphid
+    return ids
+
+def insert_edges(cursor, graph_name, label, pairs, batch_size):
+    """以 (起點 graphid, 終點 graphid) 批次建立關係"""
+    for start in range(0, len(pairs), batch_size):
+        execute_values(
+            cursor,
+            f'INSERT INTO "{graph_name}"."{label}" (start_id, end_id, properties) VALUES %s',
+            pairs[start:start + batch_size],
+            template="(%s::ag_catalog.graphid, %s::ag_catalog.graphid, '{}'::ag_catalog.agtype)",
+            page_size=batch_size,
+        )
+
+def create_graph_indexes(cursor, graph_name):
+    """
+    為節點屬性建立 GIN 索引（加速 MATCH (n:Label {name: ...})），
+    並為關係的起訖點建立 B-tree 索引（加速沿關係展開）。
+    """
+    for label in VERTEX_LABELS:
+        cursor.execute(
+            f'CREATE INDEX IF NOT EXISTS "{label}_properties_gin" '
+            f'ON "{graph_name}"."{label}" USING gin (properties);'
+        )
+    for label in EDGE_LABELS:
+        cursor.execute(f'CREATE INDEX IF NOT EXISTS "{label}_start_id" ON "{graph_name}"."{label}" (start_id);')
+        cursor.execute(f'CREATE INDEX IF NOT EXISTS "{label}_end_id" ON "{graph_name}"."{label}" (end_id);')
+
+def recipe_hash(recipe):
+    """只對會寫進圖譜的欄位取雜湊，其他欄位變動不需要同步"""
+    content = json.dumps(
+        [
+            recipe["name"],
+            clean_names(recipe.get("core_ingredients")),
+            clean_names([recipe.get("cuisine_style")]),
+            clean_names(recipe.get("key_equipment")),
+        ],
+        ensure_ascii=False,
+    )
+    return hashlib.sha1(content.encode("utf-8")).hexdigest()
+
+def ensure_sync_state(cursor):
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS public.graph_sync_state (
+            graph_name   TEXT NOT NULL,
+            recipe_id    INTEGER NOT NULL,
+            content_hash TEXT NOT NULL,
+            synced_at    TIMESTAMP WITH TIME ZONE DEFAULT now(),
+            PRIMARY KEY (graph_name, recipe_id)
+        );
+    """)
+
+def load_sync_state(cursor, graph_name):
+    cursor.execute(
+        "SELECT recipe_id, content_hash FROM public.graph_sync_state WHERE graph_name = %s;",
+        (graph_name,),
+    )
+    return dict(cursor.fetchall())
+
+def save_sync_state(cursor, graph_name, recipes, batch_size, deleted_ids=()):
+    """記錄每筆食譜同步時的內容雜湊，下次只處理雜湊不同的食譜"""
+    if deleted_ids:
+        cursor.execute(
+            "DELETE FROM public.graph_sync_state WHERE graph_name = %s AND recipe_id = ANY(%s);",
+            (graph_name, list(deleted_ids)),
+        )
+    execute_values(
+        cursor,
+        "INSERT INTO public.graph_sync_state (graph_name, recipe_id, content_hash) VALUES %s "
+        "ON CONFLICT (graph_name, recipe_id) DO UPDATE "
+        "SET content_hash = EXCLUDED.content_hash, synced_at = now()",
+        [(graph_name, r["id"], recipe_hash(r)) for r in recipes],
+        page_size=batch_size,
+    )
+
+def load_vertex_ids(cursor, graph_name, label, key):
+    """讀出既有節點的 {key 屬性值: graphid}"""
+    cursor.execute(f'SELECT id::text, properties::text FROM "{graph_name}"."{label}";')
+    return {json.loads(props)[key]: graphid for graphid, props in cursor.fetchall()}
+
+def graph_exists(cursor, graph_name):
+    cursor.execute(
+        "SELECT count(*) FROM ag_catalog.ag_graph WHERE name = %s;", (graph_name,)
+    )
+    return bool(cursor.fetchone()[0])
+
+def build_bulk(conn, cursor, graph_name, batch_size):
+    """
+    批次建圖：實體在 Python 端去重後各只建立一次，關係以大批次寫入，
+    耗時與關係數量成線性。整個重建在同一個交易中完成，失敗時保留舊圖譜。
+    """
+    started = time.perf_counter()
+    print("正在讀取食譜資料...")
+    recipes = load_recipes(cursor)
+    entities, edges = collect_graph(recipes)
+    print(
+        f"成功讀取 {len(recipes)} 筆食譜，"
+        + "、".join(f"{label} {len(names)} 個" for label, names in entities.items())
+    )
+
+    if graph_exists(cursor, graph_name):
+        cursor.execute("SELECT * FROM ag_catalog.drop_graph(%s::name, %s);", (graph_name, True))
+    cursor.execute("SELECT * FROM ag_catalog.create_graph(%s::name);", (graph_name,))
+    ensure_labels(cursor, graph_name)
+
+    step = time.perf_counter()
+    recipe_ids = insert_vertices(
+        cursor, graph_name, "Recipe",
+        [{"id": r["id"], "name": r["name"]} for r in recipes], "id", batch_size,
+    )
+    entity_ids = {
+        label: insert_vertices(
+            cursor, graph_name, label, [{"name": n} for n in sorted(names)], "name", batch_size
+        )
+        for label, names in entities.items()
+    }
+    vertex_count = len(recipe_ids) + sum(len(ids) for ids in entity_ids.values())
+    vertex_time = time.perf_counter() - step
+    print(f"已建立 {vertex_count} 個節點（{vertex_count / max(vertex_time, 1e-9):.0f} 個/秒）")
+
+    step = time.perf_counter()
+    edge_count = 0
+    for label, pairs in edges.items():
+        target = entity_ids[EDGE_LABELS[label]]
+        graph_pairs = [(recipe_ids[rid], target[name]) for rid, name in pairs]
+        insert_edges(cursor, graph_name, label, graph_pairs, batch_size)
+        edge_count += len(graph_pairs)
+        print(f"  {label}: {len(graph_pairs)} 條")
+    edge_time = time.perf_counter() - step
+    print(f"已建立 {edge_count} 條關係（{edge_count / max(edge_time, 1e-9):.0f} 條/秒）")
+
+    create_graph_indexes(cursor, graph_name)
+    # 全量重建後重設同步狀態，之後的 incremental 模式以此為基準
+    ensure_sync_state(cursor)
+    cursor.execute("DELETE FROM public.graph_sync_state WHERE graph_name = %s;", (graph_name,))
+    save_sync_state(cursor, graph_name, recipes, batch_size)
+    version = bump_graph_version(cursor, graph_name)
+    conn.commit()
+    total = time.perf_counter() - started
+    print(f"知識圖譜建構完成！（版本 {version}，總耗時 {total:.1f} 秒）")
+
+def build_incremental(conn, cursor, graph_name, batch_size):
+    """
+    增量同步：以內容雜湊比對 graph_sync_state，只處理新增、修改與刪除的食譜，
+    並清除不再被任何食譜引用的 Ingredient/Cuisine/Equipment 節點。
+    不刪除圖譜，所有變更在同一個交易中提交，查詢端在同步期間持續看到舊版本。
+    """
+    if not graph_exists(cursor, graph_name):
+        print(f"圖譜 '{graph_name}' 尚不存在，改用 bulk 模式全量建立。")
+        build_bulk(conn, cursor, graph_name, batch_size)
+        return
+
+    started = time.perf_counter()
+    ensure_labels(cursor, graph_name)
+    ensure_sync_state(cursor)
+    synced = load_sync_state(cursor, graph_name)
+    recipes = load_recipes(cursor)
+    current = {r["id"]: r for r in recipes}
+
+    changed = [r for r in recipes if synced.get(r["id"]) != recipe_hash(r)]
+    deleted = [rid for rid in synced if rid not in current]
+    inserted = sum(1 for r in changed if r["id"] not in synced)
+    print(
+        f"新增 {inserted} 筆、修改 {len(changed) - inserted} 筆、刪除 {len(deleted)} 筆"
+        f"（共 {len(recipes)} 筆食譜）"
+    )
+    if not changed and not deleted:
+        print("圖譜已是最新，不需同步。")
+        return
+
+    recipe_ids = load_vertex_ids(cursor, graph_name, "Recipe", "id")
+
+    # 先移除修改與刪除食譜的所有關係，修改的食譜稍後重新建立
+    stale = [recipe_ids[rid] for rid in [r["id"] for r in changed] + deleted if rid in recipe_ids]
+    if stale:
+        for label in EDGE_LABELS:
+            cursor.execute(
+                f'DELETE FROM "{graph_name}"."{label}" WHERE start_id = ANY(%s::ag_catalog.graphid[]);',
+                (stale,),
+            )
+    gone = [recipe_ids.pop(rid) for rid in deleted if rid in recipe_ids]
+    if gone:
+        cursor.execute(
+            f'DELETE FROM "{graph_name}"."Recipe" WHERE id = ANY(%s::ag_catalog.graphid[]);',
+            (gone,),
+        )
+
+    # 更新既有食譜節點的屬性，新增不存在的食譜節點
+    renamed = [(json.dumps({"id": r["id"], "name": r["name"]}, ensure_ascii=False), recipe_ids[r["id"]])
+               for r in changed if r["id"] in recipe_ids]
+    if renamed:
+        execute_values(
+            cursor,
+            f'UPDATE "{graph_name}"."Recipe" AS v SET properties = d.props::ag_catalog.agtype '
+            f'FROM (VALUES %s) AS d(props, id) WHERE v.id = d.id::ag_catalog.graphid',
+            renamed,
+            page_size=batch_size,
+        )
+    recipe_ids.update(insert_vertices(
+        cursor, graph_name, "Recipe",
+        [{"id": r["id"], "name": r["name"]} for r in changed if r["id"] not in recipe_ids],
+        "id", batch_size,
+    ))
+
+    # 只為新出現的實體建立節點，再重建變動食譜的關係
+    entities, edges = collect_graph(changed)
+    edge_count = 0
+    entity_ids = {}
+    for label, names in entities.items():
+        ids = load_vertex_ids(cursor, graph_name, label, "name")
+        ids.update(insert_vertices(
+            cursor, graph_name, label, [{"name": n} for n in sorted(names - ids.keys())], "name", batch_size
+        ))
+        entity_ids[label] = ids
+    for label, pairs in edges.items():
+        target = entity_ids[EDGE_LABELS[label]]
+        graph_pairs = [(recipe_ids[rid], target[name]) for rid, name in pairs]
+        insert_edges(cursor, graph_name, label, graph_pairs, batch_size)
+        edge_count += len(graph_pairs)
+
+    # 清除孤立的實體節點
+    orphans = 0
+    for edge_label, vertex_label in EDGE_LABELS.items():
+        cursor.execute(
+            f'DELETE FROM "{graph_name}"."{vertex_label}" AS v WHERE NOT EXISTS ('
+            f'SELECT 1 FROM "{graph_name}"."{edge_label}" AS e WHERE e.end_id = v.id);'
+        )
+        orphans += cursor.rowcount
+
+    save_sync_state(cursor, graph_name, changed, batch_size, deleted_ids=deleted)
+    version = bump_graph_version(cursor, graph_name)
+    conn.commit()
+    total = time.perf_counter() - started
+    print(
+        f"增量同步完成！重建 {edge_count} 條關係、清除 {orphans} 個孤立節點"
+        f"（版本 {version}，耗時 {total:.1f} 秒）"
+    )
+
+def build_legacy(conn, cursor, graph_name):
+    """舊版做法：刪除重建後逐筆 MERGE，保留作為比較基準"""
+    # 刪除並重建圖，並立即提交
+    cursor.execute(
+        "SELECT * FROM ag_catalog.drop_graph(%s::text, %s);",
+        (graph_name, True)
+    )
+    cursor.execute(
+        "SELECT * FROM ag_catalog.create_graph(%s::text);",
+        (graph_name,)
+    )
+    conn.commit()
+    print(f"圖譜 '{graph_name}' 已重建並提交。")
+
+    # 讀取食譜主表資料
+    print("正在讀取食譜資料...")
+    recipes = load_recipes(cursor)
+    print(f"成功讀取 {len(recipes)} 筆食譜資料。")
+
+    # 逐筆建立節點與關係
+    for i, recipe in enumerate(recipes, start=1):
+        rid = recipe['id']
+        rname = escape_cypher_string(recipe['name'])
+        # MERGE 食譜節點
+        cypher = f"MERGE (r:Recipe {{id: {rid}, name: '{rname}'}})"
+
+        # 核心食材關係
+        for ing in recipe.get('core_ingredients') or []:
+            ing_safe = escape_cypher_string(ing)
+            var_ing = ''.join(filter(str.isalnum, ing_safe))
+            cypher += (
+                f" MERGE (i_{var_ing}_{i}:Ingredient {{name: '{ing_safe}'}})"
+                f" MERGE (r)-[:HAS_INGREDIENT]->(i_{var_ing}_{i})"
+            )
+
+        # 料理類型關係
+        if recipe.get('cuisine_style'):
+            cuisine = escape_cypher_string(recipe['cuisine_style'])
+            var_cu = ''.join(filter(str.isalnum, cuisine))
+            cypher += (
+                f" MERGE (c_{var_cu}:Cuisine {{name: '{cuisine}'}})"
+                f" MERGE (r)-[:BELONGS_TO_CUISINE]->(c_{var_cu})"
+            )
+
+        # 所需設備關係
+        for eq in recipe.get('key_equipment') or []:
+            eq_safe = escape_cypher_string(eq)
+            var_eq = ''.join(filter(str.isalnum, eq_safe))
+            cypher += (
+                f" MERGE (e_{var_eq}_{i}:Equipment {{name: '{eq_safe}'}})"
+                f" MERGE (r)-[:REQUIRES_EQUIPMENT]->(e_{var_eq}_{i})"
+            )
+
+        # 執行 Cypher
+        final_sql = (
+            f"SELECT * FROM ag_catalog.cypher('{graph_name}', $$"
+            f"{cypher}"
+            "$$) AS (v agtype);"
+        )
+        try:
+            cursor.execute(final_sql)
+        except Exception as e:
+            print(f"[ERROR] 第 {i} 筆處理失敗：{e}", file=sys.stderr)
+            conn.rollback()
+            sys.exit(1)
+
+        # 每 100 筆 Commit
+        if i % 100 == 0 or i == len(recipes):
+            conn.commit()
+            print(f"已處理 {i}/{len(recipes)} 筆")
+
+    version = bump_graph_version(cursor, graph_name)
+    conn.commit()
+    print(f"知識圖譜建構完成！（版本 {version}）")
+
 def main():
+    parser = argparse.ArgumentParser(description="由 recipes 表格建立知識圖譜")
+    parser.add_argument("--mode", choices=["bulk", "incremental", "legacy"], default="bulk",
+                        help="bulk：批次全量建圖（預設）；incremental：只同步變動的食譜；legacy：舊版逐筆 MERGE")
+    parser.add_argument("--batch-size", type=int, default=5000, help="每批寫入的節點/關係數")
+    args = parser.parse_args()
+
     load_dotenv()
     db_user = os.getenv("DB_USER")
     db_password = os.getenv("DB_PASSWORD")
@@ -21,6 +455,7 @@ def main():
     db_port = os.getenv("DB_PORT", "5432")
     graph_name = os.getenv("GRAPH_NAME", "moms_hero_graph")
 
+    conn = cursor = None
     try:
         conn_str = (
             f"dbname='{db_name}' user='{db_user}' "
@@ -36,82 +471,16 @@ def main():
         cursor.execute("LOAD 'age';")
         cursor.execute("SET search_path = ag_catalog, \"$user\", public;")
 
-        # 刪除並重建圖，並立即提交
-        cursor.execute(
-            "SELECT * FROM ag_catalog.drop_graph(%s::text, %s);",
-            (graph_name, True)
-        )
-        cursor.execute(
-            "SELECT * FROM ag_catalog.create_graph(%s::text);",
-            (graph_name,)
-        )
-        conn.commit()
-        print(f"圖譜 '{graph_name}' 已重建並提交。")
-
-        # 讀取食譜主表資料
-        print("正在讀取食譜資料...")
-        cursor.execute(
-            "SELECT id, name, core_ingredients, cuisine_style, key_equipment FROM recipes;"
-        )
-        cols = [d[0] for d in cursor.description]
-        recipes = [dict(zip(cols, row)) for row in cursor.fetchall()]
-        print(f"成功讀取 {len(recipes)} 筆食譜資料。")
-
-        # 逐筆建立節點與關係
-        for i, recipe in enumerate(recipes, start=1):
-            rid = recipe['id']
-            rname = escape_cypher_string(recipe['name'])
-            # MERGE 食譜節點
-            cypher = f"MERGE (r:Recipe {{id: {rid}, name: '{rname}'}})"
-
-            # 核心食材關係
-            for ing in recipe.get('core_ingredients') or []:
-                ing_safe = escape_cypher_string(ing)
-                var_ing = ''.join(filter(str.isalnum, ing_safe))
-                cypher += (
-                    f" MERGE (i_{var_ing}_{i}:Ingredient {{name: '{ing_safe}'}})"
-                    f" MERGE (r)-[:HAS_INGREDIENT]->(i_{var_ing}_{i})"
-                )
-
-            # 料理類型關係
-            if recipe.get('cuisine_style'):
-                cuisine = escape_cypher_string(recipe['cuisine_style'])
-                var_cu = ''.join(filter(str.isalnum, cuisine))
-                cypher += (
-                    f" MERGE (c_{var_cu}:Cuisine {{name: '{cuisine}'}})"
-                    f" MERGE (r)-[:BELONGS_TO_CUISINE]->(c_{var_cu})"
-                )
-
-            # 所需設備關係
-            for eq in recipe.get('key_equipment') or []:
-                eq_safe = escape_cypher_string(eq)
-                var_eq = ''.join(filter(str.isalnum, eq_safe))
-                cypher += (
-                    f" MERGE (e_{var_eq}_{i}:Equipment {{name: '{eq_safe}'}})"
-                    f" MERGE (r)-[:REQUIRES_EQUIPMENT]->(e_{var_eq}_{i})"
-                )
-
-            # 執行 Cypher
-            final_sql = (
-                f"SELECT * FROM ag_catalog.cypher('{graph_name}', $$"
-                f"{cypher}"
-                "$$) AS (v agtype);"
-            )
-            try:
-                cursor.execute(final_sql)
-            except Exception as e:
-                print(f"[ERROR] 第 {i} 筆處理失敗：{e}", file=sys.stderr)
-                conn.rollback()
-                sys.exit(1)
-
-            # 每 100 筆 Commit
-            if i % 100 == 0 or i == len(recipes):
-                conn.commit()
-                print(f"已處理 {i}/{len(recipes)} 筆")
-
-        print("知識圖譜建構完成！")
+        if args.mode == "bulk":
+            build_bulk(conn, cursor, graph_name, args.batch_size)
+        elif args.mode == "incremental":
+            build_incremental(conn, cursor, graph_name, args.batch_size)
+        else:
+            build_legacy(conn, cursor, graph_name)
 
     except Exception as ex:
+        if conn is not None:
+            conn.rollback()
         print(f"[ERROR] 建圖失敗：{ex}", file=sys.stderr)
         sys.exit(1)
 
@@ -0,0 +1,106 @@
+# scripts/http_cache.py
+"""
+爬蟲的 HTTP 快取（SQLite）。
+
+每個網址記錄 ETag、Last-Modified、原始頁面的雜湊與解析後食譜的雜湊：
+  - 重新爬取時送出 If-None-Match / If-Modified-Since，主機回 304 就不必下載
+  - 主機不支援條件請求時，以原始頁面雜湊判斷，內容相同就不解析
+  - 頁面有變動但解析出的食譜相同（例如只有廣告不同）時，也不往下游輸出
+"""
+
+import hashlib
+import json
+import sqlite3
+import time
+
+
+def content_hash(raw: bytes) -> str:
+    return hashlib.sha1(raw).hexdigest()
+
+
+def recipe_hash(recipe: dict) -> str:
+    return hashlib.sha1(json.dumps(recipe, ensure_ascii=False, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+class HttpCache:
+    def __init__(self, path: str):
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS pages (
+                url           TEXT PRIMARY KEY,
+                etag          TEXT,
+                last_modified TEXT,
+                content_hash  TEXT,
+                recipe_hash   TEXT,
+                fetched_at    REAL,
+                changed_at    REAL
+            )
+        """)
+        self.conn.commit()
+        self.not_modified = 0
+        self.same_content = 0
+        self.same_recipe = 0
+        self.changed = 0
+
+    def get(self, url: str):
+        row = self.conn.execute(
+            "SELECT etag, last_modified, content_hash, recipe_hash FROM pages WHERE url = ?", (url,)
+        ).fetchone()
+        if row is None:
+            return None
+        return dict(zip(("etag", "last_modified", "content_hash", "recipe_hash"), row))
+
+    def conditional_headers(self, url: str) -> dict:
+        entry = self.get(url)
+        headers = {}
+        if entry:
+            if entry["etag"]:
+                headers["If-None-Match"] = entry["etag"]
+            if entry["last_modified"]:
+                headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    def mark_not_modified(self, url: str):
+        """主機回 304：只更新檢查時間"""
+        self.not_modified += 1
+        self.conn.execute("UPDATE pages SET fetched_at = ? WHERE url = ?", (time.time(), url))
+
+    def is_same_content(self, url: str, raw: bytes) -> bool:
+        entry = self.get(url)
+        return bool(entry and entry["content_hash"] == content_hash(raw))
+
+    def store_page(self, url: str, etag, last_modified, raw: bytes):
+        """記錄最新的驗證標頭與頁面雜湊（頁面成功解析後才呼叫）；食譜雜湊保留到 store_recipe 時再更新"""
+        self.conn.execute("""
+            INSERT INTO pages (url, etag, last_modified, content_hash, fetched_at)
+            VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT (url) DO UPDATE SET
+                etag = excluded.etag, last_modified = excluded.last_modified,
+                content_hash = excluded.content_hash, fetched_at = excluded.fetched_at
+        """, (url, etag, last_modified, content_hash(raw), time.time()))
+
+    def store_recipe(self, url: str, recipe: dict) -> bool:
+        """
+        記錄解析後的食譜雜湊，回傳食譜是否與上次不同（不同才需要往下游輸出）。
+        """
+        digest = recipe_hash(recipe)
+        entry = self.get(url)
+        if entry and entry["recipe_hash"] == digest:
+            self.same_recipe += 1
+            return False
+        self.conn.execute(
+            "UPDATE pages SET recipe_hash = ?, changed_at = ? WHERE url = ?", (digest, time.time(), url)
+        )
+        self.changed += 1
+        return True
+
+    def commit(self):
+        self.conn.commit()
+
+    def close(self):
+        self.conn.commit()
+        self.conn.close()
+
+    def summary(self) -> str:
+        return (f"304 未修改 {self.not_modified} 頁、內容相同 {self.same_content} 頁、"
+                f"食譜未變 {self.same_recipe} 筆、有變動 {self.changed} 筆")
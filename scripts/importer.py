@@ -1,49 +1,232 @@
 # 檔案位置: scripts/importer.py
 
+import argparse
+import io
 import os
 import json
+import time
 from dotenv import load_dotenv
 from sqlalchemy import create_engine, text
 from sqlalchemy.exc import IntegrityError, ProgrammingError
 
-def main():
+# recipes 表格中由匯入檔提供的欄位
+COLUMNS = [
+    "source_url", "name", "image_url", "core_ingredients", "full_ingredient_list", "steps",
+    "total_time", "difficulty", "cuisine_style", "servings", "key_equipment",
+    "tips", "nutrition_info",
+]
+
+
+def iter_json_array(f, chunk_size=1 << 16):
     """
-    資料匯入腳本的主函式。
+    逐筆讀出 JSON 陣列中的物件，不必把整個檔案載入記憶體。
+    每次只保留尚未解析完的部分在緩衝區中。
     """
-    # 步驟 1: 載入環境變數
-    # 從 .env 檔案中讀取我們設定的資料庫連線資訊
-    load_dotenv()
+    decoder = json.JSONDecoder()
+    buf = ""
+    started = False
+    eof = False
+    while True:
+        buf = buf.lstrip()
+        if not started:
+            if buf:
+                if buf[0] != "[":
+                    raise ValueError("JSON 檔案的最外層必須是陣列")
+                buf = buf[1:]
+                started = True
+                continue
+        elif buf.startswith(","):
+            buf = buf[1:]
+            continue
+        elif buf.startswith("]"):
+            return
+        elif buf:
+            try:
+                obj, end = decoder.raw_decode(buf)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+            else:
+                yield obj
+                buf = buf[end:]
+                continue
+        if eof:
+            if started:
+                raise ValueError("JSON 陣列未正確結束")
+            return
+        chunk = f.read(chunk_size)
+        eof = not chunk
+        buf += chunk
 
-    # 步驟 2: 建立資料庫連線
-    # 從環境變數中取得資料庫連線資訊
-    db_user = os.getenv("DB_USER")
-    db_password = os.getenv("DB_PASSWORD")
-    db_host = "localhost"  # 因為我們的應用和資料庫都透過 Docker 在本機運行
-    db_port = "5432"       # PostgreSQL 的預設 Port
-    db_name = os.getenv("DB_NAME")
 
-    if not all([db_user, db_password, db_name]):
-        print("錯誤：資料庫連線資訊不完整，請檢查 .env 檔案。")
-        return
+def iter_records(path):
+    """支援 JSON 陣列 (.json) 與 JSON Lines (.jsonl)，兩者皆以串流方式讀取"""
+    with open(path, 'r', encoding='utf-8') as f:
+        if path.endswith(".jsonl"):
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+        else:
+            yield from iter_json_array(f)
 
-    # 組裝成 SQLAlchemy 的資料庫連線 URL
-    # 格式為: postgresql+psycopg2://使用者:密碼@主機:端口/資料庫名稱
-    database_url = f"postgresql+psycopg2://{db_user}:{db_password}@{db_host}:{db_port}/{db_name}"
 
-    # 建立資料庫引擎 (Engine)，這是 SQLAlchemy 與資料庫溝通的核心
+def validate(recipe):
+    """
+    檢查必要欄位並轉換成 recipes 表格的欄位格式；不合格的資料回傳 None。
+    """
+    if not isinstance(recipe, dict) or not all([recipe.get('name'), recipe.get('image_url'), recipe.get('steps')]):
+        return None
+    row = {col: recipe.get(col) for col in COLUMNS}
+    row["core_ingredients"] = row["core_ingredients"] or []
+    row["full_ingredient_list"] = row["full_ingredient_list"] or {}
+    row["total_time"] = row["total_time"] if row["total_time"] is not None else 0
+    row["difficulty"] = row["difficulty"] if row["difficulty"] is not None else 0
+    return row
+
+
+def copy_to_staging(cursor, rows):
+    """
+    以 COPY 把一批資料寫入暫存表。每列是一個 JSON 文件，
+    合併時再用 jsonb_populate_record 轉成 recipes 的欄位型別。
+    """
+    cursor.execute("TRUNCATE recipes_staging;")
+    buf = io.StringIO()
+    for row in rows:
+        doc = json.dumps(row, ensure_ascii=False)
+        # COPY 文字格式中反斜線、換行與 tab 需要跳脫
+        buf.write(doc.replace("\\", "\\\\").replace("\n", "\\n").replace("\r", "\\r").replace("\t", "\\t"))
+        buf.write("\n")
+    buf.seek(0)
+    cursor.copy_expert("COPY recipes_staging (doc) FROM STDIN", buf)
+
+
+def merge_staging(cursor):
+    """
+    把暫存表合併進 recipes，回傳 (新增筆數, 更新筆數)。
+
+    有 source_url 的資料以 source_url 為自然鍵 upsert；舊版爬蟲產生、沒有 source_url 的資料
+    則以名稱比對。既有食譜保留原本的 id 與 embedding，內容沒有變動時不會更新 updated_at。
+    """
+    cols = ", ".join(COLUMNS)
+    data_cols = [c for c in COLUMNS if c != "source_url"]
+    changed = " OR ".join(f"recipes.{c} IS DISTINCT FROM EXCLUDED.{c}" for c in data_cols)
+    # 舊資料沒有 source_url：先以名稱找出同一道食譜並補上 source_url，之後的 upsert 才會更新它而不是新增一筆。
+    # 同名的舊資料只補 id 最小的一筆，已被其他食譜使用的 source_url 不補
+    cursor.execute("""
+        UPDATE recipes SET source_url = m.source_url, updated_at = now()
+        FROM (
+            SELECT DISTINCT ON (r.name) r.name, r.source_url
+            FROM recipes_staging s, jsonb_populate_record(NULL::recipes, s.doc) r
+            WHERE r.source_url IS NOT NULL
+              AND NOT EXISTS (SELECT 1 FROM recipes x WHERE x.source_url = r.source_url)
+            ORDER BY r.name, r.source_url
+        ) AS m
+        WHERE recipes.id = (SELECT min(y.id) FROM recipes y WHERE y.source_url IS NULL AND y.name = m.name)
+        RETURNING recipes.id;
+    """)
+    backfilled = {row[0] for row in cursor.fetchall()}
+    cursor.execute(f"""
+        INSERT INTO recipes ({cols})
+        SELECT {cols} FROM recipes_staging s, jsonb_populate_record(NULL::recipes, s.doc)
+        WHERE s.doc->>'source_url' IS NOT NULL
+        ON CONFLICT (source_url) DO UPDATE
+        SET {", ".join(f"{c} = EXCLUDED.{c}" for c in data_cols)}, updated_at = now()
+        WHERE {changed}
+        RETURNING id, (xmax = 0) AS inserted;
+    """)
+    results = cursor.fetchall()
+    inserted = sum(1 for _, is_new in results if is_new)
+    updated = len(backfilled | {rid for rid, is_new in results if not is_new})
+
+    select_cols = ", ".join(f"r.{c}" for c in data_cols)
+    cursor.execute(f"""
+        UPDATE recipes
+        SET ({", ".join(data_cols)}) = ({select_cols}), updated_at = now()
+        FROM recipes_staging s, jsonb_populate_record(NULL::recipes, s.doc) r
+        WHERE s.doc->>'source_url' IS NULL
+          AND recipes.source_url IS NULL AND recipes.name = r.name
+          AND ({" OR ".join(f"recipes.{c} IS DISTINCT FROM r.{c}" for c in data_cols)});
+    """)
+    updated += cursor.rowcount
+    cursor.execute(f"""
+        INSERT INTO recipes ({", ".join(data_cols)})
+        SELECT {select_cols} FROM recipes_staging s, jsonb_populate_record(NULL::recipes, s.doc) r
+        WHERE s.doc->>'source_url' IS NULL
+          AND NOT EXISTS (SELECT 1 FROM recipes x WHERE x.source_url IS NULL AND x.name = r.name);
+    """)
+    inserted += cursor.rowcount
+    return inserted, updated
+
+
+def import_bulk(engine, path, batch_size):
+    """
+    串流讀取匯入檔，每批驗證後以 COPY 寫入暫存表，再 upsert 進 recipes。
+    不會 TRUNCATE recipes，既有食譜的 id（圖譜節點）與 embedding 都會保留；
+    記憶體用量只與 batch_size 有關，與檔案大小無關。
+    """
+    print(f"以 bulk 模式匯入 {path}（每批 {batch_size} 筆）...")
+    started = time.perf_counter()
+    total = skipped = inserted = updated = 0
+
+    conn = engine.raw_connection()
     try:
-        engine = create_engine(database_url)
-        # 測試連線
-        with engine.connect() as connection:
-            print("資料庫連線成功！")
-    except Exception as e:
-        print(f"資料庫連線失敗：{e}")
+        cursor = conn.cursor()
+        cursor.execute("CREATE TEMP TABLE recipes_staging (doc JSONB NOT NULL);")
+
+        def flush(batch):
+            nonlocal inserted, updated
+            # 同一批內 source_url 重複時只保留最後一筆，避免 ON CONFLICT 重複更新同一列
+            deduped = {}
+            for row in batch:
+                key = row["source_url"] or ("name", row["name"])
+                deduped[key] = row
+            copy_to_staging(cursor, deduped.values())
+            ins, upd = merge_staging(cursor)
+            conn.commit()
+            inserted += ins
+            updated += upd
+            elapsed = time.perf_counter() - started
+            print(f"已處理 {total} 筆（{total / max(elapsed, 1e-9):.0f} 筆/秒）")
+
+        batch = []
+        for recipe in iter_records(path):
+            total += 1
+            row = validate(recipe)
+            if row is None:
+                skipped += 1
+                continue
+            batch.append(row)
+            if len(batch) >= batch_size:
+                flush(batch)
+                batch = []
+        if batch:
+            flush(batch)
+    except FileNotFoundError:
+        print(f"錯誤：找不到 {path} 檔案。請確保檔案存在於專案根目錄。")
+        return
+    except (ValueError, json.JSONDecodeError) as e:
+        conn.rollback()
+        print(f"錯誤：{path} 檔案格式不正確，無法解析：{e}")
         return
+    finally:
+        conn.close()
+
+    elapsed = time.perf_counter() - started
+    print("-" * 20)
+    print("資料匯入完成！")
+    print(f"讀取 {total} 筆：新增 {inserted} 筆、更新 {updated} 筆、"
+          f"未變動 {total - skipped - inserted - updated} 筆、跳過 {skipped} 筆。")
+    print(f"耗時 {elapsed:.1f} 秒（{total / max(elapsed, 1e-9):.0f} 筆/秒）")
 
+
+def import_legacy(engine, path):
+    """
+    舊版匯入流程：整個檔案讀進記憶體，TRUNCATE 後逐筆 INSERT。
+    """
     # 步驟 3: 讀取 JSON 檔案
     # 我們假設 recipe_data.json 檔案與 importer.py 在同一個目錄層級的根目錄下
     try:
-        with open('recipes_data.json', 'r', encoding='utf-8') as f:
+        with open(path, 'r', encoding='utf-8') as f:
             recipes_data = json.load(f)
         print("成功讀取 recipe_data.json 檔案。")
     except FileNotFoundError:
@@ -67,11 +250,11 @@ def main():
         # 我們使用 :key 的形式來代表參數，以防止 SQL 注入攻擊
         sql = text("""
             INSERT INTO recipes (
-                name, image_url, core_ingredients, full_ingredient_list, steps,
+                source_url, name, image_url, core_ingredients, full_ingredient_list, steps,
                 total_time, difficulty, cuisine_style, servings, key_equipment,
                 tips, nutrition_info
             ) VALUES (
-                :name, :image_url, :core_ingredients, :full_ingredient_list, :steps,
+                :source_url, :name, :image_url, :core_ingredients, :full_ingredient_list, :steps,
                 :total_time, :difficulty, :cuisine_style, :servings, :key_equipment,
                 :tips, :nutrition_info
             )
@@ -93,6 +276,7 @@ def main():
                 # 將 None 或空字串的欄位轉換為資料庫能接受的 NULL
                 # 這是為了應對 JSON 中可能存在的空值
                 params = {
+                    "source_url": recipe.get('source_url'),
                     "name": recipe.get('name'),
                     "image_url": recipe.get('image_url'),
                     "core_ingredients": recipe.get('core_ingredients'),
@@ -126,6 +310,53 @@ def main():
     print(f"失敗或跳過 {fail_count} 筆。")
 
 
+def main():
+    """
+    資料匯入腳本的主函式。
+    """
+    parser = argparse.ArgumentParser(description="將爬蟲產生的食譜資料匯入 recipes 表格")
+    parser.add_argument("--file", default="recipes_data.json", help="匯入檔（.json 陣列或 .jsonl）")
+    parser.add_argument("--mode", choices=["bulk", "legacy"], default="bulk",
+                        help="bulk：COPY + upsert（預設）；legacy：TRUNCATE 後逐筆 INSERT")
+    parser.add_argument("--batch-size", type=int, default=1000, help="bulk 模式每批筆數")
+    args = parser.parse_args()
+
+    # 步驟 1: 載入環境變數
+    # 從 .env 檔案中讀取我們設定的資料庫連線資訊
+    load_dotenv()
+
+    # 步驟 2: 建立資料庫連線
+    # 從環境變數中取得資料庫連線資訊
+    db_user = os.getenv("DB_USER")
+    db_password = os.getenv("DB_PASSWORD")
+    db_host = "localhost"  # 因為我們的應用和資料庫都透過 Docker 在本機運行
+    db_port = "5432"       # PostgreSQL 的預設 Port
+    db_name = os.getenv("DB_NAME")
+
+    if not all([db_user, db_password, db_name]):
+        print("錯誤：資料庫連線資訊不完整，請檢查 .env 檔案。")
+        return
+
+    # 組裝成 SQLAlchemy 的資料庫連線 URL
+    # 格式為: postgresql+psycopg2://使用者:密碼@主機:端口/資料庫名稱
+    database_url = f"postgresql+psycopg2://{db_user}:{db_password}@{db_host}:{db_port}/{db_name}"
+
+    # 建立資料庫引擎 (Engine)，這是 SQLAlchemy 與資料庫溝通的核心
+    try:
+        engine = create_engine(database_url)
+        # 測試連線
+        with engine.connect() as connection:
+            print("資料庫連線成功！")
+    except Exception as e:
+        print(f"資料庫連線失敗：{e}")
+        return
+
+    if args.mode == "bulk":
+        import_bulk(engine, args.file, args.batch_size)
+    else:
+        import_legacy(engine, args.file)
+
+
 if __name__ == "__main__":
     # 當我們直接執行這個 python 檔案時，就呼叫 main() 函式
     main()
\ No newline at end of file
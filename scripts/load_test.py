@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+# scripts/load_test.py
+"""
+API 壓力測試：以固定的並發數持續送出請求，統計 req/s 與延遲。
+
+可同時指定多個目標，依序測試後並列比較，例如改版前後各起一個 uvicorn：
+    git stash / git checkout <舊版> && uvicorn app.main:app --port 8001
+    uvicorn app.main:app --port 8000
+    python scripts/load_test.py --target before=http://127.0.0.1:8001 --target after=http://127.0.0.1:8000
+
+情境：
+    get     GET /api/v1/recipes/{id}，id 從 --ids 範圍隨機選
+    search  POST /api/v1/recipes/search，查詢字詞從 --queries 隨機選（需要 GOOGLE_API_KEY）
+    mixed   兩者各半
+"""
+
+import argparse
+import asyncio
+import random
+import statistics
+import time
+
+import httpx
+
+DEFAULT_QUERIES = ["番茄炒蛋", "牛肉", "豆腐", "雞腿", "高麗菜", "咖哩", "蒸魚", "排骨湯"]
+
+
+async def run_target(label, base_url, args):
+    latencies = []
+    errors = 0
+    statuses = {}
+    deadline = time.perf_counter() + args.duration
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=args.timeout, limits=limits) as client:
+        # 暖身：建立連線、填滿連線池與快取，不列入統計
+        for _ in range(min(args.concurrency, 10)):
+            try:
+                await client.get(f"/api/v1/recipes/{random.randint(*args.ids)}")
+            except httpx.HTTPError:
+                pass
+
+        async def worker():
+            nonlocal errors
+            while time.perf_counter() < deadline:
+                scenario = args.scenario
+                if scenario == "mixed":
+                    scenario = random.choice(["get", "search"])
+                start = time.perf_counter()
+                try:
+                    if scenario == "get":
+                        resp = await client.get(f"/api/v1/recipes/{random.randint(*args.ids)}")
+                    else:
+                        resp = await client.post("/api/v1/recipes/search",
+                                                 json={"query": random.choice(args.queries), "limit": 5})
+                    statuses[resp.status_code] = statuses.get(resp.status_code, 0) + 1
+                    if resp.status_code >= 500:
+                        errors += 1
+                except httpx.HTTPError:
+                    errors += 1
+                    statuses["error"] = statuses.get("error", 0) + 1
+                latencies.append((time.perf_counter() - start) * 1000)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+        elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "label": label,
+        "requests": len(latencies),
+        "rps": len(latencies) / elapsed,
+        "p50": statistics.median(latencies) if latencies else 0.0,
+        "p95": latencies[int(len(latencies) * 0.95) - 1] if latencies else 0.0,
+        "p99": latencies[int(len(latencies) * 0.99) - 1] if latencies else 0.0,
+        "errors": errors,
+        "statuses": statuses,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="API 壓力測試")
+    parser.add_argument("--target", action="append", default=[],
+                        help="label=base_url，可重複指定（預設 local=http://127.0.0.1:8000）")
+    parser.add_argument("--scenario", choices=["get", "search", "mixed"], default="get")
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--duration", type=float, default=30.0, help="每個目標測試的秒數")
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--ids", type=int, nargs=2, default=[1, 1000], metavar=("MIN", "MAX"))
+    parser.add_argument("--queries", nargs="+", default=DEFAULT_QUERIES)
+    args = parser.parse_args()
+
+    targets = [t.split("=", 1) if "=" in t else [t, t] for t in args.target] or [["local", "http://127.0.0.1:8000"]]
+    print(f"情境 {args.scenario}，並發 {args.concurrency}，每個目標 {args.duration:.0f} 秒")
+    results = [asyncio.run(run_target(label, url, args)) for label, url in targets]
+
+    print(f"\n{'target':<10} {'req/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'errors':>7}  status")
+    for r in results:
+        print(f"{r['label']:<10} {r['rps']:>9.1f} {r['p50']:>9.1f} {r['p95']:>9.1f} {r['p99']:>9.1f} "
+              f"{r['errors']:>7}  {r['statuses']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+# scripts/migrate.py
+"""
+依序套用 migrations/ 目錄下的 SQL 檔案。
+
+已套用過的檔名會記錄在 schema_migrations 表格中，重複執行是安全的。
+用法：
+    python scripts/migrate.py            # 套用所有尚未執行的 migration
+    python scripts/migrate.py --list     # 只列出狀態
+"""
+
+import argparse
+import os
+import sys
+from pathlib import Path
+
+import psycopg2
+from dotenv import load_dotenv
+
+MIGRATIONS_DIR = Path(__file__).resolve().parent.parent / "migrations"
+
+
+def get_database_url() -> str:
+    """
+    取得 psycopg2 可用的連線字串。優先使用 DATABASE_URL（與 app/db/session.py 相同）；
+    否則以 DB_* 環境變數組裝。腳本通常在主機上執行，DB_HOST 預設為 localhost，
+    不同於 app/db/session.py 在 docker compose 網路中使用的 db。
+    """
+    load_dotenv()
+    database_url = os.getenv("DATABASE_URL")
+    if database_url is None:
+        db_user = os.getenv("DB_USER")
+        db_password = os.getenv("DB_PASSWORD")
+        db_host = os.getenv("DB_HOST", "localhost")
+        db_port = os.getenv("DB_PORT", "5432")
+        db_name = os.getenv("DB_NAME")
+        database_url = f"postgresql://{db_user}:{db_password}@{db_host}:{db_port}/{db_name}"
+    elif database_url.startswith("postgresql+psycopg2://"):
+        database_url = database_url.replace("postgresql+psycopg2://", "postgresql://", 1)
+    return database_url
+
+
+def main():
+    parser = argparse.ArgumentParser(description="套用資料庫 migration")
+    parser.add_argument("--list", action="store_true", help="只列出 migration 狀態，不執行")
+    args = parser.parse_args()
+
+    files = sorted(MIGRATIONS_DIR.glob("*.sql"))
+    with psycopg2.connect(get_database_url()) as conn, conn.cursor() as cur:
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS schema_migrations (
+                filename   TEXT PRIMARY KEY,
+                applied_at TIMESTAMP WITH TIME ZONE DEFAULT now()
+            )
+        """)
+        conn.commit()
+        cur.execute("SELECT filename FROM schema_migrations;")
+        applied = {row[0] for row in cur.fetchall()}
+
+        if args.list:
+            for f in files:
+                mark = "x" if f.name in applied else " "
+                print(f"[{mark}] {f.name}")
+            return
+
+        pending = [f for f in files if f.name not in applied]
+        if not pending:
+            print("資料庫已是最新狀態。")
+            return
+
+        for f in pending:
+            print(f"套用 {f.name} ...")
+            try:
+                cur.execute(f.read_text(encoding="utf-8"))
+                cur.execute("INSERT INTO schema_migrations (filename) VALUES (%s);", (f.name,))
+                conn.commit()
+            except Exception as e:
+                conn.rollback()
+                print(f"[ERROR] {f.name} 執行失敗：{e}", file=sys.stderr)
+                sys.exit(1)
+        print(f"完成，共套用 {len(pending)} 個 migration。")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,194 @@
+# scripts/rate_control.py
+"""
+爬蟲用的自適應速率控制（AIMD）。
+
+每個主機各有一個控制器：
+  - 回應正常且延遲低於目標時，速率線性增加（additive increase）
+  - 收到 429 / 5xx 或延遲超過目標時，速率乘以 decrease_factor（multiplicative decrease）
+  - 429 / 503 帶有 Retry-After 時，整個主機暫停到指定時間；沒有時以帶抖動的指數退避暫停
+如此吞吐量會升到主機能承受的程度，主機開始拒絕時再自動降回來。
+"""
+
+import asyncio
+import random
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlsplit
+
+# 代表主機要求降速的狀態碼
+THROTTLE_STATUSES = {429, 503}
+
+
+def parse_retry_after(value, now=None):
+    """Retry-After 可能是秒數或 HTTP 日期，回傳需要等待的秒數；無法解析時回傳 None"""
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    now = time.time() if now is None else now
+    return max(0.0, when.timestamp() - now)
+
+
+class AdaptiveRateController:
+    """
+    單一主機的 AIMD 速率控制器。
+
+    acquire() 依目前速率排定送出時間並限制同時進行的請求數，
+    record() 依回應狀態與延遲調整速率。
+    """
+    def __init__(self, initial_rate=1.0, min_rate=0.2, max_rate=20.0, additive_step=0.5,
+                 decrease_factor=0.5, target_latency=2.0, max_in_flight=16,
+                 backoff_base=1.0, backoff_max=60.0, window=10.0):
+        self.rate = initial_rate
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.additive_step = additive_step
+        self.decrease_factor = decrease_factor
+        self.target_latency = target_latency
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.window = window
+
+        self._slots = asyncio.Semaphore(max_in_flight)
+        self._lock = asyncio.Lock()
+        self._last_send = 0.0
+        self._blocked_until = 0.0
+        self._last_decrease = 0.0
+        self._consecutive_throttles = 0
+        # (完成時間, 是否為錯誤)，用來計算最近 window 秒的 req/s 與錯誤率
+        self._recent = deque()
+        self.in_flight = 0
+        self.total = 0
+        self.errors = 0
+        self.throttled = 0
+
+    async def acquire(self):
+        """等待可以送出下一個請求的時間點（受速率、暫停與同時請求數限制）"""
+        await self._slots.acquire()
+        try:
+            # 等待者依序通過；每次醒來都重新讀取速率與暫停時間，調整後立即生效
+            async with self._lock:
+                while True:
+                    now = time.monotonic()
+                    wait = max(self._last_send + 1.0 / self.rate, self._blocked_until) - now
+                    if wait <= 0:
+                        break
+                    await asyncio.sleep(min(wait, 0.25))
+                self._last_send = now
+        except BaseException:
+            # 等待中被取消時歸還名額，否則同時請求數上限會永久減少
+            self._slots.release()
+            raise
+        self.in_flight += 1
+
+    def release(self):
+        self.in_flight -= 1
+        self._slots.release()
+
+    @asynccontextmanager
+    async def slot(self):
+        await self.acquire()
+        try:
+            yield
+        finally:
+            self.release()
+
+    def _decrease(self, now):
+        # 同一波壅塞可能同時回來很多個錯誤，一段時間內只降速一次
+        if now - self._last_decrease >= max(self.target_latency, 1.0):
+            self.rate = max(self.min_rate, self.rate * self.decrease_factor)
+            self._last_decrease = now
+
+    def backoff(self, retry_after=None):
+        """暫停整個主機：優先使用 Retry-After，否則以帶抖動的指數退避計算"""
+        self._consecutive_throttles += 1
+        if retry_after is None:
+            delay = min(self.backoff_max, self.backoff_base * 2 ** (self._consecutive_throttles - 1))
+            delay *= random.uniform(0.5, 1.5)
+        else:
+            delay = min(self.backoff_max, retry_after)
+        self._blocked_until = max(self._blocked_until, time.monotonic() + delay)
+        return delay
+
+    def record(self, status, latency, retry_after=None):
+        """
+        依回應調整速率。status 為 None 表示連線錯誤或逾時，視同主機壅塞。
+        回傳建議的重試等待秒數（不需重試時為 0）。
+        """
+        now = time.monotonic()
+        self.total += 1
+        is_error = status is None or status >= 400
+        self._recent.append((now, is_error))
+        if is_error:
+            self.errors += 1
+
+        if status is None or status in THROTTLE_STATUSES or status >= 500:
+            self.throttled += 1
+            self._decrease(now)
+            if status in THROTTLE_STATUSES or status is None:
+                return self.backoff(retry_after)
+            return 0.0
+        if latency > self.target_latency:
+            self._decrease(now)
+        elif status < 400:
+            # 每秒約增加 additive_step，與目前速率無關
+            self.rate = min(self.max_rate, self.rate + self.additive_step / max(self.rate, 1.0))
+            self._consecutive_throttles = 0
+        return 0.0
+
+    def stats(self):
+        now = time.monotonic()
+        while self._recent and now - self._recent[0][0] > self.window:
+            self._recent.popleft()
+        recent = len(self._recent)
+        recent_errors = sum(1 for _, err in self._recent if err)
+        return {
+            "rate_limit": round(self.rate, 2),
+            "req_per_sec": round(recent / self.window, 2),
+            "error_rate": round(recent_errors / recent, 3) if recent else 0.0,
+            "in_flight": self.in_flight,
+            "paused_for": round(max(0.0, self._blocked_until - now), 1),
+            "total": self.total,
+            "errors": self.errors,
+            "throttled": self.throttled,
+        }
+
+
+class HostRateControllers:
+    """依主機名稱分配各自的 AdaptiveRateController"""
+    def __init__(self, **controller_kwargs):
+        self.controller_kwargs = controller_kwargs
+        self._controllers = {}
+
+    def for_url(self, url):
+        host = urlsplit(url).netloc
+        if host not in self._controllers:
+            self._controllers[host] = AdaptiveRateController(**self.controller_kwargs)
+        return self._controllers[host]
+
+    def stats(self):
+        return {host: c.stats() for host, c in self._controllers.items()}
+
+    def format_stats(self):
+        return " | ".join(
+            f"{host}: {s['req_per_sec']:.1f} req/s (上限 {s['rate_limit']:.1f})，"
+            f"錯誤率 {s['error_rate']:.0%}，進行中 {s['in_flight']}"
+            + (f"，暫停 {s['paused_for']:.0f}s" if s["paused_for"] else "")
+            for host, s in self.stats().items()
+        )
+
+
+async def report_stats(controllers, interval=5.0):
+    """定期印出各主機的即時狀態，直到被取消"""
+    while True:
+        await asyncio.sleep(interval)
+        line = controllers.format_stats()
+        if line:
+            print(f"\n[rate] {line}", flush=True)
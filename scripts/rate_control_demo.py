@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+# scripts/rate_control_demo.py
+"""
+以本機的 aiohttp 模擬主機驗證 rate_control.py 的行為，不會連線到楊桃美食網。
+
+模擬主機每秒最多服務 --capacity 個請求：負載越接近上限延遲越高，
+超過上限時回傳 429（帶 Retry-After），並可在指定時間後把容量減半，
+觀察控制器是否先爬升到容量附近、被拒絕時降速，容量改變後再重新收斂。
+用法：
+    python scripts/rate_control_demo.py --capacity 8 --duration 40 --drop-at 20
+"""
+
+import argparse
+import asyncio
+import time
+from collections import deque
+
+import aiohttp
+from aiohttp import web
+
+from rate_control import HostRateControllers, parse_retry_after, report_stats
+
+
+class StandInHost:
+    def __init__(self, capacity, base_latency=0.05):
+        self.capacity = capacity
+        self.base_latency = base_latency
+        self._recent = deque()
+        self.served = 0
+        self.rejected = 0
+
+    async def handle(self, request):
+        now = time.monotonic()
+        while self._recent and now - self._recent[0] > 1.0:
+            self._recent.popleft()
+        if len(self._recent) >= self.capacity:
+            self.rejected += 1
+            return web.Response(status=429, headers={"Retry-After": "1"})
+        self._recent.append(now)
+        # 負載越接近容量，延遲越高
+        load = len(self._recent) / self.capacity
+        await asyncio.sleep(self.base_latency / max(0.05, 1.0 - load))
+        self.served += 1
+        return web.Response(text="<html>ok</html>")
+
+
+async def run(args):
+    host = StandInHost(args.capacity)
+    app = web.Application()
+    app.router.add_get("/{tail:.*}", host.handle)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", args.port)
+    await site.start()
+
+    controllers = HostRateControllers(
+        initial_rate=1.0, max_rate=args.capacity * 4, target_latency=args.target_latency, max_in_flight=16, window=5.0,
+    )
+    stats_task = asyncio.create_task(report_stats(controllers, args.stats_interval))
+    deadline = time.monotonic() + args.duration
+    drop_at = time.monotonic() + args.drop_at if args.drop_at else None
+
+    async def worker(session, n):
+        controller = controllers.for_url(f"http://127.0.0.1:{args.port}/")
+        i = 0
+        while time.monotonic() < deadline:
+            if drop_at and time.monotonic() >= drop_at and host.capacity == args.capacity:
+                host.capacity = max(1, args.capacity // 2)
+                print(f"\n[host] 容量降為每秒 {host.capacity} 個請求")
+            async with controller.slot():
+                start = time.monotonic()
+                try:
+                    async with session.get(f"http://127.0.0.1:{args.port}/recipe/{n}-{i}") as resp:
+                        await resp.read()
+                        controller.record(resp.status, time.monotonic() - start,
+                                          parse_retry_after(resp.headers.get("Retry-After")))
+                except aiohttp.ClientError:
+                    controller.record(None, time.monotonic() - start)
+            i += 1
+
+    async with aiohttp.ClientSession() as session:
+        await asyncio.gather(*(worker(session, n) for n in range(16)))
+    stats_task.cancel()
+    await runner.cleanup()
+
+    print(f"\n模擬主機：成功 {host.served} 次、拒絕 {host.rejected} 次，"
+          f"平均 {host.served / args.duration:.1f} req/s（容量 {args.capacity}）")
+    print(controllers.format_stats())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="自適應速率控制示範")
+    parser.add_argument("--capacity", type=int, default=8, help="模擬主機每秒可服務的請求數")
+    parser.add_argument("--duration", type=float, default=30.0)
+    parser.add_argument("--drop-at", type=float, default=0, help="幾秒後把主機容量減半（0 表示不變）")
+    parser.add_argument("--target-latency", type=float, default=0.5)
+    parser.add_argument("--stats-interval", type=float, default=2.0)
+    parser.add_argument("--port", type=int, default=8765)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,60 +1,229 @@
+#!/usr/bin/env python3
+# scripts/vec_import.py
+"""
+為 recipes 表格產生語意搜尋用的向量。
+
+流程：依 id 分批讀出食譜 → 以 embed_documents 一次嵌入一整批 →
+多個批次並行送出（以 token bucket 控制 API 頻率）→ 依主鍵批次寫回 embedding。
+每批寫回時一併記錄 embedding_hash（嵌入文字的雜湊），中斷後重新執行會略過
+已完成且內容沒有變動的食譜，等同從上次的進度繼續。
+
+用法：
+    python scripts/vec_import.py                                   # 使用 Gemini
+    python scripts/vec_import.py --batch-size 64 --concurrency 4 --rpm 300
+    python scripts/vec_import.py --backend stub --stub-latency 0.2 # 離線測試吞吐量（不寫回）
+"""
+
+import argparse
+import asyncio
+import hashlib
 import os
+import random
+import sys
 import time
-import json
-from dotenv import load_dotenv
+
 import psycopg2
-from langchain_google_genai import GoogleGenerativeAIEmbeddings
-
-# 載入 .env 檔案
-load_dotenv()
-
-# 取得資料庫連線字串，與專案 session.py 一致
-DATABASE_URL = os.getenv("DATABASE_URL")
-if DATABASE_URL is None:
-    db_user = os.getenv("DB_USER")
-    db_password = os.getenv("DB_PASSWORD")
-    db_host = "localhost"
-    db_port = "5432"
-    db_name = os.getenv("DB_NAME")
-    DATABASE_URL = f"postgresql://{db_user}:{db_password}@{db_host}:{db_port}/{db_name}"
-elif DATABASE_URL.startswith("postgresql+psycopg2://"):
-    DATABASE_URL = DATABASE_URL.replace("postgresql+psycopg2://", "postgresql://", 1)
-
-# 初始化 Gemini Embedding
-API_KEY = os.getenv("GOOGLE_API_KEY")
-emb = GoogleGenerativeAIEmbeddings(
-    model="models/embedding-001",  # 官方建議的 embedding 模型
-    google_api_key=API_KEY
-)
-
-# 讀取 JSON 檔案
-with open('recipes_data.json', 'r', encoding='utf-8') as f:
-    recipes = json.load(f)
-
-# 連線資料庫
-with psycopg2.connect(DATABASE_URL) as conn, conn.cursor() as cur:
-    for idx, r in enumerate(recipes[:]):
-        name = r.get('name') or ''
-        core = '；'.join(r.get('core_ingredients') or [])
-        full = []
-        for section in (r.get('full_ingredient_list') or {}).values():
-            for ing, amt in section.items():
-                full.append(f"{ing}{amt or ''}")
-        full = '，'.join(full)
-        steps = '；'.join(r.get('steps') or [])
-        vector_text = '。'.join([p for p in [name, core, full, steps] if p])
-
-        vec = emb.embed_query(vector_text)
-
-        # 以 name 為條件更新
-        cur.execute(
-            "UPDATE recipes SET embedding = %s WHERE name = %s",
-            (list(vec), name)
+from psycopg2.extras import execute_values
+from dotenv import load_dotenv
+
+from migrate import get_database_url
+
+DEFAULT_EMBEDDING_MODEL = "models/embedding-001"
+EMBEDDING_DIM = 768
+
+
+def build_vector_text(recipe):
+    """組出要嵌入的文字：名稱、核心食材、完整食材與步驟"""
+    name = recipe.get('name') or ''
+    core = '；'.join(recipe.get('core_ingredients') or [])
+    full = []
+    for section in (recipe.get('full_ingredient_list') or {}).values():
+        for ing, amt in section.items():
+            full.append(f"{ing}{amt or ''}")
+    full = '，'.join(full)
+    steps = '；'.join(recipe.get('steps') or [])
+    return '。'.join([p for p in [name, core, full, steps] if p])
+
+
+def text_hash(model, text):
+    """嵌入文字與模型名稱的雜湊；任一改變都需要重新嵌入"""
+    return hashlib.sha1(f"{model}\n{text}".encode("utf-8")).hexdigest()
+
+
+class StubEmbeddings:
+    """
+    離線用的假 embedding：依文字雜湊產生固定的單位向量，並模擬 API 延遲。
+    只用於測量管線本身的吞吐量，不會呼叫任何外部服務。
+    """
+    def __init__(self, dim=EMBEDDING_DIM, latency=0.2):
+        self.dim = dim
+        self.latency = latency
+
+    def embed_documents(self, texts):
+        time.sleep(self.latency)
+        vectors = []
+        for text in texts:
+            rng = random.Random(hashlib.sha1(text.encode("utf-8")).digest())
+            vec = [rng.gauss(0, 1) for _ in range(self.dim)]
+            norm = sum(v * v for v in vec) ** 0.5
+            vectors.append([v / norm for v in vec])
+        return vectors
+
+
+class TokenBucket:
+    """
+    簡單的 token bucket：每秒補充 rate 個 token，最多累積 capacity 個。
+    每次 API 請求前取得一個 token，取代固定的 sleep。
+    """
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+def load_pending(cur, model, force, limit):
+    """
+    讀出需要（重新）嵌入的食譜，回傳 [(id, 嵌入文字, 雜湊)]。
+    已有向量且雜湊相同的食譜會被略過。
+    """
+    cur.execute("""
+        SELECT id, name, core_ingredients, full_ingredient_list, steps,
+               embedding_hash, embedding IS NOT NULL
+        FROM recipes ORDER BY id;
+    """)
+    pending, skipped = [], 0
+    for rid, name, core, full, steps, old_hash, has_embedding in cur.fetchall():
+        text = build_vector_text({
+            "name": name, "core_ingredients": core,
+            "full_ingredient_list": full, "steps": steps,
+        })
+        digest = text_hash(model, text)
+        if not force and has_embedding and old_hash == digest:
+            skipped += 1
+            continue
+        pending.append((rid, text, digest))
+        if limit and len(pending) >= limit:
+            break
+    return pending, skipped
+
+
+def write_batch(conn, rows):
+    """
+    依主鍵批次寫回向量與雜湊，每批各自提交，作為可續傳的進度點。
+    embedding_updated_at 讓 API 的記憶體索引只需載入這次寫入的向量。
+    """
+    with conn.cursor() as cur:
+        execute_values(
+            cur,
+            "UPDATE recipes AS r SET embedding = d.embedding::vector, embedding_hash = d.hash, "
+            "embedding_updated_at = now() "
+            "FROM (VALUES %s) AS d(id, embedding, hash) WHERE r.id = d.id",
+            [(rid, "[" + ",".join(f"{v:.7g}" for v in vec) + "]", digest) for rid, vec, digest in rows],
+            page_size=len(rows),
+        )
+    conn.commit()
+
+
+async def run_pipeline(conn, emb, pending, batch_size, concurrency, bucket, retries, dry_run=False):
+    batches = [pending[i:i + batch_size] for i in range(0, len(pending), batch_size)]
+    semaphore = asyncio.Semaphore(concurrency)
+    db_lock = asyncio.Lock()
+    done = failed = 0
+    started = time.perf_counter()
+
+    async def process(batch):
+        nonlocal done, failed
+        async with semaphore:
+            texts = [text for _, text, _ in batch]
+            for attempt in range(retries + 1):
+                await bucket.acquire()
+                try:
+                    vectors = await asyncio.to_thread(emb.embed_documents, texts)
+                    break
+                except Exception as e:
+                    if attempt == retries:
+                        failed += len(batch)
+                        print(f"[ERROR] 批次 id {batch[0][0]}-{batch[-1][0]} 嵌入失敗：{e}", file=sys.stderr)
+                        return
+                    await asyncio.sleep(2 ** attempt + random.random())
+        rows = [(rid, vec, digest) for (rid, _, digest), vec in zip(batch, vectors)]
+        # psycopg2 的連線不能同時被多個 thread 使用，寫入依序進行
+        if not dry_run:
+            async with db_lock:
+                await asyncio.to_thread(write_batch, conn, rows)
+        done += len(rows)
+        elapsed = time.perf_counter() - started
+        print(f"已完成 {done}/{len(pending)} 筆（{done / max(elapsed, 1e-9):.1f} 筆/秒）")
+
+    await asyncio.gather(*(process(b) for b in batches))
+    return done, failed, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description="為食譜產生語意搜尋向量")
+    parser.add_argument("--backend", choices=["gemini", "stub"], default="gemini")
+    parser.add_argument("--batch-size", type=int, default=32, help="每次 embed_documents 的食譜數")
+    parser.add_argument("--concurrency", type=int, default=4, help="同時進行的批次數")
+    parser.add_argument("--rpm", type=float, default=120, help="每分鐘最多送出的 API 請求數")
+    parser.add_argument("--retries", type=int, default=3)
+    parser.add_argument("--limit", type=int, default=0, help="最多處理幾筆（0 表示全部）")
+    parser.add_argument("--force", action="store_true", help="忽略 embedding_hash，全部重新嵌入")
+    parser.add_argument("--dry-run", action="store_true", help="只嵌入不寫回資料庫")
+    parser.add_argument("--stub-latency", type=float, default=0.2, help="stub 後端每次請求的模擬延遲（秒）")
+    args = parser.parse_args()
+
+    load_dotenv()
+    if args.backend == "stub":
+        emb = StubEmbeddings(latency=args.stub_latency)
+        model = "stub"
+        # 假向量不能寫進正式資料，stub 後端一律只測吞吐量
+        args.dry_run = True
+    else:
+        from langchain_google_genai import GoogleGenerativeAIEmbeddings
+        # 與 app/services/embedding_service.py 使用同一個模型，查詢與文件向量才在同一個空間
+        model = os.getenv("EMBEDDING_MODEL", DEFAULT_EMBEDDING_MODEL)
+        emb = GoogleGenerativeAIEmbeddings(
+            model=model,
+            google_api_key=os.getenv("GOOGLE_API_KEY"),
         )
-        conn.commit()
 
-        # 控制 API 頻率（建議每 4 秒 1 筆，避免超過免費額度）
-        time.sleep(0.3)
-        print(f"已處理第 {idx+1} 筆")
+    # psycopg2 的 with conn 只包住一個交易，不會關閉連線，需另外 close
+    conn = psycopg2.connect(get_database_url())
+    try:
+        with conn:
+            with conn.cursor() as cur:
+                pending, skipped = load_pending(cur, model, args.force, args.limit)
+            conn.commit()
+            print(f"需要嵌入 {len(pending)} 筆，略過 {skipped} 筆未變動的食譜。")
+            if not pending:
+                return
+
+            bucket = TokenBucket(rate=args.rpm / 60, capacity=max(1, args.concurrency))
+            done, failed, elapsed = asyncio.run(run_pipeline(
+                conn, emb, pending, args.batch_size, args.concurrency, bucket, args.retries, args.dry_run
+            ))
+    finally:
+        conn.close()
+
+    print("-" * 20)
+    print(f"向量化完成：成功 {done} 筆、失敗 {failed} 筆，耗時 {elapsed:.1f} 秒"
+          f"（{done / max(elapsed, 1e-9):.1f} 筆/秒）")
+    if failed:
+        print("失敗的食譜可直接重新執行本腳本補上。")
+
 
-print("前 500 筆食譜向量化完成。")
+if __name__ == "__main__":
+    main()
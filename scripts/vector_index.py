@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+# scripts/vector_index.py
+"""
+recipes.embedding 近似最近鄰 (ANN) 索引的管理工具。
+
+搜尋 API 使用 `embedding <#> :q_vec`（負內積），因此索引一律使用 vector_ip_ops。
+用法：
+    python scripts/vector_index.py status
+    python scripts/vector_index.py build --method hnsw --m 16 --ef-construction 64
+    python scripts/vector_index.py build --method ivfflat --lists 120
+    python scripts/vector_index.py rebuild --method hnsw      # 線上重建，不中斷查詢
+    python scripts/vector_index.py drop
+    python scripts/vector_index.py benchmark --queries 50 --k 10
+"""
+
+import argparse
+import math
+import statistics
+import sys
+import time
+
+import psycopg2
+
+from migrate import get_database_url
+
+INDEX_NAME = "idx_recipes_embedding"
+
+
+def index_ddl(name: str, method: str, args, row_count: int, concurrently: bool = False) -> str:
+    """依照索引方法組出 CREATE INDEX 指令"""
+    prefix = "CREATE INDEX CONCURRENTLY" if concurrently else "CREATE INDEX"
+    if method == "hnsw":
+        return (
+            f"{prefix} {name} ON recipes USING hnsw (embedding vector_ip_ops) "
+            f"WITH (m = {int(args.m)}, ef_construction = {int(args.ef_construction)});"
+        )
+    # pgvector 建議：百萬筆以下 lists 取 rows / 1000，且至少 10
+    lists = args.lists or max(10, row_count // 1000)
+    return (
+        f"{prefix} {name} ON recipes USING ivfflat (embedding vector_ip_ops) "
+        f"WITH (lists = {int(lists)});"
+    )
+
+
+def current_index_method(cur):
+    cur.execute("SELECT indexdef FROM pg_indexes WHERE indexname = %s;", (INDEX_NAME,))
+    row = cur.fetchone()
+    if not row:
+        return None
+    indexdef = row[0].lower()
+    if "using hnsw" in indexdef:
+        return "hnsw"
+    if "using ivfflat" in indexdef:
+        return "ivfflat"
+    return "unknown"
+
+
+def count_embeddings(cur) -> int:
+    cur.execute("SELECT count(*) FROM recipes WHERE embedding IS NOT NULL;")
+    return cur.fetchone()[0]
+
+
+def cmd_status(conn, args):
+    with conn.cursor() as cur:
+        print(f"已有向量的食譜：{count_embeddings(cur)} 筆")
+        cur.execute(
+            "SELECT indexdef, pg_size_pretty(pg_relation_size(indexname::regclass)) "
+            "FROM pg_indexes WHERE indexname = %s;",
+            (INDEX_NAME,),
+        )
+        row = cur.fetchone()
+        if row:
+            print(f"索引：{row[0]}")
+            print(f"大小：{row[1]}")
+        else:
+            print(f"尚未建立索引 {INDEX_NAME}，目前的向量搜尋為全表掃描。")
+
+
+def cmd_build(conn, args):
+    with conn.cursor() as cur:
+        if current_index_method(cur):
+            print(f"索引 {INDEX_NAME} 已存在，如需更換參數請使用 rebuild。")
+            return
+        rows = count_embeddings(cur)
+        cur.execute("SET maintenance_work_mem = %s;", (args.maintenance_work_mem,))
+        ddl = index_ddl(INDEX_NAME, args.method, args, rows)
+        print(f"建立索引中（{rows} 筆向量）：{ddl}")
+        start = time.perf_counter()
+        cur.execute(ddl)
+        cur.execute("ANALYZE recipes;")
+        print(f"完成，耗時 {time.perf_counter() - start:.1f} 秒。")
+
+
+def cmd_rebuild(conn, args):
+    """先以 CONCURRENTLY 建立新索引，再替換舊索引；重建期間查詢照常使用舊索引"""
+    new_name = f"{INDEX_NAME}_new"
+    with conn.cursor() as cur:
+        rows = count_embeddings(cur)
+        cur.execute("SET maintenance_work_mem = %s;", (args.maintenance_work_mem,))
+        cur.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {new_name};")
+        ddl = index_ddl(new_name, args.method, args, rows, concurrently=True)
+        print(f"線上重建索引中（{rows} 筆向量）：{ddl}")
+        start = time.perf_counter()
+        cur.execute(ddl)
+        cur.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {INDEX_NAME};")
+        cur.execute(f"ALTER INDEX {new_name} RENAME TO {INDEX_NAME};")
+        cur.execute("ANALYZE recipes;")
+        print(f"完成，耗時 {time.perf_counter() - start:.1f} 秒。")
+
+
+def cmd_drop(conn, args):
+    with conn.cursor() as cur:
+        cur.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {INDEX_NAME};")
+    print(f"已刪除索引 {INDEX_NAME}。")
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    idx = min(len(ordered) - 1, max(0, math.ceil(pct / 100 * len(ordered)) - 1))
+    return ordered[idx]
+
+
+def run_search(cur, q_vec: str, k: int, settings):
+    """在單一交易中套用 SET LOCAL 設定後執行搜尋，回傳 (id 清單, 毫秒)"""
+    for name, value in settings:
+        cur.execute("SELECT set_config(%s, %s, true);", (name, str(value)))
+    start = time.perf_counter()
+    cur.execute(
+        """
+        SELECT id FROM recipes
+        WHERE embedding IS NOT NULL
+        ORDER BY embedding <#> CAST(%s AS vector)
+        LIMIT %s;
+        """,
+        (q_vec, k),
+    )
+    ids = [row[0] for row in cur.fetchall()]
+    elapsed = (time.perf_counter() - start) * 1000
+    cur.connection.rollback()
+    return ids, elapsed
+
+
+def cmd_benchmark(conn, args):
+    """以全表精確搜尋為基準，量測不同 ef_search / probes 下的 recall@k 與延遲"""
+    conn.autocommit = False
+    with conn.cursor() as cur:
+        method = current_index_method(cur)
+        if method not in ("hnsw", "ivfflat"):
+            print("尚未建立 ANN 索引，請先執行 build。")
+            return
+        cur.execute(
+            "SELECT embedding::text FROM recipes WHERE embedding IS NOT NULL "
+            "ORDER BY random() LIMIT %s;",
+            (args.queries,),
+        )
+        queries = [row[0] for row in cur.fetchall()]
+        conn.rollback()
+        if not queries:
+            print("資料庫中沒有任何向量。")
+            return
+
+        exact_settings = [("enable_indexscan", "off"), ("enable_bitmapscan", "off")]
+        truth, exact_ms = [], []
+        for q in queries:
+            ids, ms = run_search(cur, q, args.k, exact_settings)
+            truth.append(set(ids))
+            exact_ms.append(ms)
+
+        print(f"索引類型：{method}，查詢數：{len(queries)}，k = {args.k}")
+        print(f"{'設定':<22}{'recall@k':>10}{'p50 ms':>10}{'p95 ms':>10}")
+        print(f"{'exact (seq scan)':<22}{1.0:>10.3f}{statistics.median(exact_ms):>10.2f}{percentile(exact_ms, 95):>10.2f}")
+
+        if method == "hnsw":
+            knob, values = "hnsw.ef_search", args.ef_search
+        else:
+            knob, values = "ivfflat.probes", args.probes
+        for value in values:
+            recalls, latencies = [], []
+            for q, expected in zip(queries, truth):
+                ids, ms = run_search(cur, q, args.k, [(knob, value)])
+                recalls.append(len(expected & set(ids)) / max(1, len(expected)))
+                latencies.append(ms)
+            label = f"{knob}={value}"
+            print(f"{label:<22}{statistics.mean(recalls):>10.3f}{statistics.median(latencies):>10.2f}{percentile(latencies, 95):>10.2f}")
+
+
+def parse_int_list(value: str):
+    return [int(v) for v in value.split(",") if v.strip()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="管理 recipes.embedding 的 ANN 索引")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    sub.add_parser("status", help="顯示索引狀態")
+    sub.add_parser("drop", help="刪除索引")
+    for name in ("build", "rebuild"):
+        p = sub.add_parser(name, help=f"{name} 索引")
+        p.add_argument("--method", choices=["hnsw", "ivfflat"], default="hnsw")
+        p.add_argument("--m", type=int, default=16, help="HNSW 每個節點的連結數")
+        p.add_argument("--ef-construction", type=int, default=64, help="HNSW 建索引時的候選清單大小")
+        p.add_argument("--lists", type=int, default=None, help="IVFFlat 分群數（預設 rows/1000）")
+        p.add_argument("--maintenance-work-mem", default="512MB")
+    bench = sub.add_parser("benchmark", help="比較 ANN 與精確搜尋的 recall 與延遲")
+    bench.add_argument("--queries", type=int, default=50)
+    bench.add_argument("--k", type=int, default=10)
+    bench.add_argument("--ef-search", type=parse_int_list, default=[10, 20, 40, 80, 160])
+    bench.add_argument("--probes", type=parse_int_list, default=[1, 5, 10, 20])
+    args = parser.parse_args()
+
+    try:
+        conn = psycopg2.connect(get_database_url())
+    except Exception as e:
+        print(f"[ERROR] 資料庫連線失敗：{e}", file=sys.stderr)
+        sys.exit(1)
+    # CREATE/DROP INDEX CONCURRENTLY 不能在交易區塊中執行
+    conn.autocommit = True
+    try:
+        {
+            "status": cmd_status,
+            "build": cmd_build,
+            "rebuild": cmd_rebuild,
+            "drop": cmd_drop,
+            "benchmark": cmd_benchmark,
+        }[args.command](conn, args)
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()